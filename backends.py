@@ -0,0 +1,398 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from batching import MODEL_OUTPUT_LIMITS, DEFAULT_OUTPUT_LIMIT, estimate_tokens
+
+DEFAULT_MODELS = {
+    "Gemini": ["gemini-1.5-flash", "gemini-2.0-flash"],
+    "OpenAI": [],
+    "Mock": ["mock"]
+}
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta"
+CONNECT_TIMEOUT = 10
+REQUEST_TIMEOUT = 300
+PROMPT_LANGUAGES = re.compile(r'^Translate the values of this JSON object to (?:each of these languages: )?(.*?)\.\n')
+
+class BackendError(Exception):
+    """A failed request; ``code`` is the HTTP-like status the engine uses to decide on a retry."""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+class Completion:
+    """A model reply: its text, the output (and input) tokens it used if known, and whether it hit the output limit."""
+
+    def __init__(self, text="", output_tokens=None, truncated=False, input_tokens=None):
+        self.text = text
+        self.output_tokens = output_tokens
+        self.truncated = truncated
+        self.input_tokens = input_tokens
+
+class StreamingCompletion(Completion):
+    """A reply read chunk by chunk; ``text``, the token counts and ``truncated`` are final once iteration ends."""
+
+    def __init__(self, chunks):
+        super().__init__()
+        self.chunks = chunks
+
+    def __iter__(self):
+        parts = []
+        for chunk in self.chunks:
+            parts.append(chunk)
+            yield chunk
+        self.text = "".join(parts)
+
+    def close(self):
+        """Stop reading the reply, closing its connection."""
+        close = getattr(self.chunks, "close", None)
+        if close is not None:
+            close()
+
+class Backend:
+    """Sends prompts to a translation model.
+
+    ``complete`` returns a ``Completion``; ``stream`` returns a
+    ``StreamingCompletion`` to iterate over. Failures should be raised with
+    a ``code`` attribute (429, 5xx) when they are worth retrying.
+    ``max_concurrency``, if set, caps the requests the engine keeps in
+    flight against this backend. Backends with ``uses_api_keys`` take the
+    key to send a request with as ``api_key``, so the engine can spread
+    requests over a pool of keys; without one they use their own.
+    """
+
+    name = ""
+    uses_api_keys = False
+
+    def __init__(self, model, max_concurrency=None):
+        self.model = model
+        self.max_concurrency = max_concurrency
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(configured_model(config, cls.name),
+                   max_concurrency=setting_int(config, f"{cls.name.lower()}_concurrency"))
+
+    def close(self):
+        pass
+
+    def complete(self, prompt, api_key=None):
+        raise NotImplementedError
+
+    def stream(self, prompt, api_key=None):
+        completion = self.complete(prompt, api_key=api_key)
+        return StreamingCompletion(iter([completion.text]))
+
+class HTTPBackend(Backend):
+    """A backend reached over HTTP through one keep-alive ``requests.Session``.
+
+    The session pools up to ``max_concurrency`` connections (or
+    ``pool_size``), so back-to-back requests reuse them instead of paying
+    for a new TCP and TLS handshake each time. ``proxy`` is a
+    ``{"http": ..., "https": ...}`` dict that applies to this backend only;
+    proxy environment variables are ignored. A request fails once the
+    server has sent nothing for ``timeout`` seconds. ``requests`` is
+    imported here rather than with the module, as it takes longer to load
+    than the rest of the engine together.
+    """
+
+    def __init__(self, model, api_key="", proxy=None, max_concurrency=None, pool_size=10, timeout=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+        super().__init__(model, max_concurrency)
+        self.api_key = api_key
+        self.timeout = (CONNECT_TIMEOUT, timeout or REQUEST_TIMEOUT)
+        self.session = requests.Session()
+        self.session.trust_env = False
+        self.session.proxies = {scheme: url for scheme, url in (proxy or {}).items() if url}
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency or pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, url, payload, stream=False, api_key=None):
+        response = self.session.post(url, json=payload, headers=self.headers(api_key or self.api_key), stream=stream,
+                                     timeout=self.timeout)
+        if response.status_code >= 400:
+            message = response.text[:500]
+            response.close()
+            raise BackendError(f"{response.status_code} {message}", code=response.status_code)
+        return response
+
+    def headers(self, api_key):
+        return {}
+
+    @staticmethod
+    def server_sent_events(response):
+        """Yield the JSON payload of each ``data:`` line of a server-sent event stream.
+
+        The stream is read to its end, past any ``[DONE]`` marker, so the
+        connection goes back to the pool.
+        """
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data != "[DONE]":
+                    yield json.loads(data)
+
+    def close(self):
+        self.session.close()
+
+class GeminiBackend(HTTPBackend):
+    """Google Gemini through its REST API, using the ``api_key`` and ``proxy`` settings."""
+
+    name = "Gemini"
+    uses_api_keys = True
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(configured_model(config, cls.name), api_key=config.get('api_key', ''),
+                   proxy=json.loads(config.get('proxy') or '{}'),
+                   max_concurrency=setting_int(config, "gemini_concurrency"), timeout=setting_int(config, "request_timeout"))
+
+    def headers(self, api_key):
+        return {"x-goog-api-key": api_key}
+
+    def payload(self, prompt):
+        return {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {"responseMimeType": "application/json"}
+        }
+
+    @staticmethod
+    def read_response(data, completion):
+        """Add one ``GenerateContentResponse`` to ``completion``; return the text it carries."""
+        candidates = data.get("candidates") or [{}]
+        parts = (candidates[0].get("content") or {}).get("parts") or []
+        if candidates[0].get("finishReason") == "MAX_TOKENS":
+            completion.truncated = True
+        usage = data.get("usageMetadata") or {}
+        if "candidatesTokenCount" in usage:
+            completion.output_tokens = usage["candidatesTokenCount"]
+        if "promptTokenCount" in usage:
+            completion.input_tokens = usage["promptTokenCount"]
+        return "".join(part.get("text", "") for part in parts)
+
+    def complete(self, prompt, api_key=None):
+        response = self.post(f"{GEMINI_API_URL}/models/{self.model}:generateContent", self.payload(prompt),
+                             api_key=api_key)
+        completion = Completion()
+        completion.text = self.read_response(response.json(), completion)
+        return completion
+
+    def stream(self, prompt, api_key=None):
+        response = self.post(f"{GEMINI_API_URL}/models/{self.model}:streamGenerateContent?alt=sse",
+                             self.payload(prompt), stream=True, api_key=api_key)
+
+        def chunks():
+            for data in self.server_sent_events(response):
+                text = self.read_response(data, completion)
+                if text:
+                    yield text
+
+        completion = StreamingCompletion(chunks())
+        return completion
+
+class OpenAIBackend(HTTPBackend):
+    """Any server speaking the OpenAI chat completions API, such as vLLM or llama.cpp on the LAN.
+
+    Settings: ``openai_base_url`` (e.g. ``http://192.168.1.20:8000/v1``),
+    ``openai_api_key`` (often not needed for a local server),
+    ``openai_proxy`` and ``openai_concurrency``.
+    """
+
+    name = "OpenAI"
+
+    def __init__(self, model, base_url, api_key="", proxy=None, max_concurrency=None, timeout=None):
+        super().__init__(model, api_key, proxy, max_concurrency, timeout=timeout)
+        self.base_url = base_url.rstrip("/")
+
+    @classmethod
+    def from_config(cls, config):
+        base_url = config.get('openai_base_url')
+        if not base_url:
+            raise BackendError("No server URL set for the OpenAI-compatible backend")
+        model = configured_model(config, cls.name)
+        if not model:
+            raise BackendError("No model set for the OpenAI-compatible backend; choose one in Advanced Settings or pass --model")
+        return cls(model, base_url,
+                   api_key=config.get('openai_api_key', ''), proxy=json.loads(config.get('openai_proxy') or '{}'),
+                   max_concurrency=setting_int(config, "openai_concurrency"), timeout=setting_int(config, "request_timeout"))
+
+    def headers(self, api_key):
+        return {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+    def payload(self, prompt, stream=False):
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "response_format": {"type": "json_object"},
+            "stream": stream
+        }
+
+    def complete(self, prompt, api_key=None):
+        data = self.post(f"{self.base_url}/chat/completions", self.payload(prompt)).json()
+        choice = (data.get("choices") or [{}])[0]
+        usage = data.get("usage") or {}
+        return Completion((choice.get("message") or {}).get("content") or "", usage.get("completion_tokens"),
+                          choice.get("finish_reason") == "length", usage.get("prompt_tokens"))
+
+    def stream(self, prompt, api_key=None):
+        response = self.post(f"{self.base_url}/chat/completions", self.payload(prompt, stream=True), stream=True)
+
+        def chunks():
+            for data in self.server_sent_events(response):
+                for choice in data.get("choices") or []:
+                    if choice.get("finish_reason") == "length":
+                        completion.truncated = True
+                    text = (choice.get("delta") or {}).get("content")
+                    if text:
+                        yield text
+                usage = data.get("usage") or {}
+                if usage.get("completion_tokens"):
+                    completion.output_tokens = usage["completion_tokens"]
+                if usage.get("prompt_tokens"):
+                    completion.input_tokens = usage["prompt_tokens"]
+
+        completion = StreamingCompletion(chunks())
+        return completion
+
+class MockBackend(Backend):
+    """Local stand-in for a model, for measuring the pipeline without an API key.
+
+    It reads the JSON object and target languages out of the engine's
+    prompt and answers with ``[Language] text`` for every cue. Replies take
+    ``latency`` seconds plus one second per ``tokens_per_second`` output
+    tokens, and are cut off at ``output_limit`` tokens like a real model's.
+    More than ``rpm`` requests in a minute (counted per API key), or a
+    random ``error_rate`` share of them, fail with 429; ``malformed_rate`` replies are broken
+    JSON and ``drop_rate`` of the cues are left out. Runs with the same
+    ``seed`` make the same choices.
+    """
+
+    name = "Mock"
+    uses_api_keys = True
+
+    def __init__(self, model="mock", latency=0.0, tokens_per_second=0, rpm=0, error_rate=0.0,
+                 malformed_rate=0.0, drop_rate=0.0, output_limit=None, seed=0, max_concurrency=None):
+        super().__init__(model, max_concurrency)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.drop_rate = drop_rate
+        self.output_limit = output_limit or MODEL_OUTPUT_LIMITS.get(model, DEFAULT_OUTPUT_LIMIT)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_times = {}
+        self.requests = 0
+
+    @classmethod
+    def from_config(cls, config):
+        # Always "mock", whatever model is configured, so its replies are never cached under a real model's name
+        return cls(max_concurrency=setting_int(config, "mock_concurrency"))
+
+    def check_rate(self, api_key=None):
+        with self.lock:
+            self.requests += 1
+            now = time.monotonic()
+            request_times = self.request_times.setdefault(api_key, deque())
+            while request_times and now - request_times[0] >= 60:
+                request_times.popleft()
+            if self.rpm and len(request_times) >= self.rpm:
+                raise BackendError("429 Resource has been exhausted (mock rate limit)", code=429)
+            request_times.append(now)
+            if self.random.random() < self.error_rate:
+                raise BackendError("429 Resource has been exhausted (mock error rate)", code=429)
+
+    def reply(self, prompt):
+        match = PROMPT_LANGUAGES.match(prompt)
+        if not match:
+            raise BackendError("Mock backend cannot read the prompt", code=400)
+        languages = match.group(1).split(", ")
+        source = json.loads(prompt[prompt.index("{", match.end()):])
+        with self.lock:
+            kept = [(num, text) for num, text in source.items() if self.random.random() >= self.drop_rate]
+            malformed = self.random.random() < self.malformed_rate
+        if len(languages) == 1:
+            reply = {num: f"[{languages[0]}] {text}" for num, text in kept}
+        else:
+            reply = {num: {language: f"[{language}] {text}" for language in languages} for num, text in kept}
+        text = json.dumps(reply, ensure_ascii=False)
+        if malformed:
+            text = text[:len(text) // 2].replace('": "', '" "', 1)
+        output_tokens = estimate_tokens(text)
+        truncated = output_tokens > self.output_limit
+        if truncated:
+            text = text[:int(len(text) * self.output_limit / output_tokens)]
+            output_tokens = self.output_limit
+        return Completion(text, output_tokens, truncated, estimate_tokens(prompt))
+
+    def reply_time(self, completion):
+        if not self.tokens_per_second:
+            return 0.0
+        return completion.output_tokens / self.tokens_per_second
+
+    def complete(self, prompt, api_key=None):
+        self.check_rate(api_key)
+        completion = self.reply(prompt)
+        time.sleep(self.latency + self.reply_time(completion))
+        return completion
+
+    def stream(self, prompt, api_key=None, chunk_size=40):
+        self.check_rate(api_key)
+        reply = self.reply(prompt)
+        pieces = [reply.text[i:i + chunk_size] for i in range(0, len(reply.text), chunk_size)] or [""]
+        piece_time = self.reply_time(reply) / len(pieces)
+
+        def chunks():
+            time.sleep(self.latency)
+            for piece in pieces:
+                time.sleep(piece_time)
+                yield piece
+            completion.output_tokens = reply.output_tokens
+            completion.input_tokens = reply.input_tokens
+            completion.truncated = reply.truncated
+
+        completion = StreamingCompletion(chunks())
+        return completion
+
+BACKENDS = {
+    "Gemini": GeminiBackend,
+    "OpenAI": OpenAIBackend,
+    "Mock": MockBackend
+}
+
+def setting_int(config, key):
+    try:
+        return max(1, int(config[key]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def model_list(config, backend_name):
+    """The models offered for a backend: the ``{name}_models`` setting (a JSON list) or the built-in defaults."""
+    try:
+        models = json.loads(config.get(f"{backend_name.lower()}_models") or 'null')
+    except ValueError:
+        models = None
+    return models if isinstance(models, list) else list(DEFAULT_MODELS.get(backend_name, []))
+
+def default_model(config, backend_name):
+    models = model_list(config, backend_name)
+    return models[0] if models else ""
+
+def configured_model(config, backend_name):
+    """The ``model`` setting if it was saved for ``backend_name`` (it is then in its model list), else its default."""
+    if config.get('model') in model_list(config, backend_name):
+        return config['model']
+    return default_model(config, backend_name)
+
+def open_backend(config):
+    """Return the backend named by the ``backend`` setting, configured from its own settings."""
+    backend_class = BACKENDS.get(config.get('backend', 'Gemini'), GeminiBackend)
+    return backend_class.from_config(config)
@@ -0,0 +1,91 @@
+import threading
+
+MODEL_OUTPUT_LIMITS = {
+    "gemini-1.5-flash": 8192,
+    "gemini-2.0-flash": 8192
+}
+DEFAULT_OUTPUT_LIMIT = 8192
+CUE_OVERHEAD_TOKENS = 6
+MIN_INPUT_BUDGET = 64
+INITIAL_INPUT_BUDGET = 800
+MAX_CUES_PER_BATCH = 200
+
+def estimate_tokens(text):
+    """Rough token count: about four ASCII characters per token, fewer for other scripts."""
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return int(ascii_chars / 4 + (len(text) - ascii_chars) / 1.5) + 1
+
+class BatchProfile:
+    """What has been learned about one model's batch sizes."""
+
+    def __init__(self, input_budget=INITIAL_INPUT_BUDGET, output_ratio=1.5, failure_rate=0.0):
+        self.input_budget = input_budget
+        self.output_ratio = output_ratio
+        self.failure_rate = failure_rate
+
+    def to_dict(self):
+        return {"input_budget": self.input_budget, "output_ratio": self.output_ratio, "failure_rate": self.failure_rate}
+
+class AdaptiveBatcher:
+    """Packs translation units into requests by token budget rather than by count.
+
+    A batch is filled until its estimated input tokens reach the model's
+    input budget or its expected output (input times the observed output
+    ratio) would come near the model's output limit. The budget grows after
+    each complete response and is halved after a truncated or malformed
+    one, so batches settle at the largest size the model answers reliably.
+    With a fixed ``batch_size`` it packs that many units per request instead.
+    """
+
+    def __init__(self, model, batch_size="Auto", profiles=None):
+        self.model = model
+        self.fixed_size = None if str(batch_size) == "Auto" else max(1, int(batch_size))
+        self.output_limit = MODEL_OUTPUT_LIMITS.get(model, DEFAULT_OUTPUT_LIMIT)
+        self.profiles = {name: BatchProfile(**values) for name, values in (profiles or {}).items()}
+        self.profile = self.profiles.setdefault(model, BatchProfile())
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def unit_tokens(unit):
+        return estimate_tokens(unit.text) + CUE_OVERHEAD_TOKENS
+
+    def max_input_budget(self):
+        return max(MIN_INPUT_BUDGET, int(self.output_limit * 0.75 / self.profile.output_ratio))
+
+    def next_batch(self, units):
+        """Take the next batch from the front of the ``units`` deque."""
+        if self.fixed_size:
+            return [units.popleft() for _ in range(min(self.fixed_size, len(units)))]
+        with self.lock:
+            budget = min(self.profile.input_budget, self.max_input_budget())
+        batch = []
+        used = 0
+        while units and len(batch) < MAX_CUES_PER_BATCH:
+            tokens = self.unit_tokens(units[0])
+            if batch and used + tokens > budget:
+                break
+            batch.append(units.popleft())
+            used += tokens
+        return batch
+
+    @staticmethod
+    def texts_tokens(texts):
+        return sum(estimate_tokens(text) + CUE_OVERHEAD_TOKENS for text in texts)
+
+    def record_success(self, input_tokens, output_tokens=None):
+        with self.lock:
+            profile = self.profile
+            if output_tokens and input_tokens:
+                profile.output_ratio = 0.8 * profile.output_ratio + 0.2 * (output_tokens / input_tokens)
+            profile.failure_rate *= 0.9
+            profile.input_budget = min(self.max_input_budget(), int(profile.input_budget * 1.25) + 1)
+
+    def record_failure(self):
+        with self.lock:
+            profile = self.profile
+            profile.failure_rate = 0.9 * profile.failure_rate + 0.1
+            profile.input_budget = max(MIN_INPUT_BUDGET, profile.input_budget // 2)
+
+    def export(self):
+        with self.lock:
+            return {name: profile.to_dict() for name, profile in self.profiles.items()}
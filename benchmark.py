@@ -0,0 +1,241 @@
+"""Throughput benchmark for the translation pipeline, run against the local mock backend.
+
+    python benchmark.py --cues 1000 10000 100000 --latency 0.2 --tokens-per-second 400
+
+Each size gets a synthetic SRT that is parsed, translated and written back
+as in a real run. Every pass after the first reuses the cache of the one
+before. Use ``--json results.jsonl`` to keep results for comparison.
+``--keys N`` spreads requests over a pool of N API keys, each allowed
+``--rpm`` by the engine and ``--mock-rpm`` by the mock.
+
+Start-up is checked first: importing ``cli`` and ``engine``, and
+dispatching ``SubAI.py translate --help``, must not load Qt and must stay
+within ``--startup-budget`` seconds, or the benchmark exits with status 1.
+``--startup-only`` runs just that check.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import storage
+from backends import MockBackend
+from engine import TranslationEngine
+from translation_cache import LRUTranslationCache, SQLiteTranslationCache
+from subtitle_io import read_subtitles, srt_time, write_subtitles
+from translation_memory import SQLiteTranslationMemory, TranslationMemory
+
+WORDS = ("the", "you", "what", "we", "have", "to", "go", "now", "where", "is", "he", "she", "never", "come",
+         "back", "here", "right", "know", "think", "just", "want", "tell", "me", "about", "it", "night",
+         "tomorrow", "house", "door", "money", "father", "mother", "ship", "captain", "listen", "please")
+# What each start-up check runs; SubAI.py itself imports nothing until it dispatches, so it is timed doing that
+STARTUP_CHECKS = {
+    "engine": "import engine",
+    "cli": "import cli",
+    "SubAI translate": "import SubAI\ntry:\n    SubAI.main(['SubAI.py', 'translate', '--help'])\nexcept SystemExit:\n    pass",
+    "gui": "import gui",
+}
+QT_FREE_CHECKS = ("engine", "cli", "SubAI translate")
+STARTUP_RUNS = 3
+
+def near_duplicate(text, rng):
+    """``text`` with its final punctuation or its case changed, as a near-duplicate line would have."""
+    if rng.random() < 0.5:
+        return text.rstrip(".?!") + rng.choice(".?!…")
+    return text.lower() if text != text.lower() else text.upper()
+
+def write_synthetic_srt(path, cues, repeat_rate=0.3, seed=0, near_rate=0.0):
+    """Write ``cues`` subtitle cues, ``repeat_rate`` of them repeating an earlier line as real dialogue does
+    and ``near_rate`` of them nearly repeating one."""
+    rng = random.Random(seed)
+    recent = []
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(cues):
+            draw = rng.random()
+            if recent and draw < repeat_rate:
+                text = rng.choice(recent)
+            elif recent and draw < repeat_rate + near_rate:
+                text = near_duplicate(rng.choice(recent), rng)
+            else:
+                words = [rng.choice(WORDS) for _ in range(rng.randint(3, 14))]
+                if len(words) > 7 and rng.random() < 0.5:
+                    words[len(words) // 2] += "\n"
+                text = " ".join(words).replace("\n ", "\n").capitalize() + rng.choice(".?!")
+                if rng.random() < 0.1:
+                    text = f"<i>{text}</i>"
+                recent.append(text)
+                if len(recent) > 500:
+                    recent.pop(0)
+            start = i * 2500
+            f.write(f"{i + 1}\n{srt_time(start)} --> {srt_time(start + 2000)}\n{text}\n\n")
+
+def measure_startup(statement, runs=STARTUP_RUNS):
+    """Best of ``runs`` times a fresh interpreter takes to run ``statement``, and whether that loaded PyQt5;
+    ``(None, False)`` if it fails here (say, without PyQt5 installed)."""
+    code = (f"import sys, time\nstart = time.perf_counter()\n{statement}\n"
+            f"print(time.perf_counter() - start, 'PyQt5' in sys.modules)")
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return None, False
+        seconds, loads_qt = result.stdout.strip().splitlines()[-1].split()
+        timings.append(float(seconds))
+    return min(timings), loads_qt == "True"
+
+def check_startup(budget):
+    """Run every start-up check; return the timings and the problems found on the Qt-free path."""
+    startup = {}
+    problems = []
+    for name, statement in STARTUP_CHECKS.items():
+        seconds, loads_qt = measure_startup(statement)
+        startup[name] = seconds
+        if name in QT_FREE_CHECKS and seconds is not None:
+            if loads_qt:
+                problems.append(f"{name} loads Qt")
+            if seconds > budget:
+                problems.append(f"{name} takes {seconds:.3f} s, over the {budget:.3f} s budget")
+    return startup, problems
+
+def open_cache(cache_mode, db_path):
+    if cache_mode == "File":
+        return SQLiteTranslationCache(db_path)
+    if cache_mode == "RAM":
+        return LRUTranslationCache()
+    return None
+
+def open_memory(args, db_path):
+    if args.fuzzy == "Off" or args.cache == "None":
+        return None
+    if args.cache == "File":
+        return SQLiteTranslationMemory(db_path, threshold=float(args.fuzzy))
+    return TranslationMemory(float(args.fuzzy))
+
+def run_pipeline(source_path, output_path, args, translation_cache, translation_memory=None):
+    """Parse, translate and save one file; return its measurements."""
+    config = {
+        "rpm": str(args.rpm),
+        "concurrency": str(args.concurrency),
+        "batch_size": args.batch_size,
+        "streaming": args.streaming,
+        "cache_mode": args.cache
+    }
+    if args.keys > 1:
+        config["api_keys"] = json.dumps([{"key": f"benchmark-key-{index}", "rpm": args.rpm, "daily_quota": 0}
+                                         for index in range(args.keys)])
+    backend = MockBackend(latency=args.latency, tokens_per_second=args.tokens_per_second, rpm=args.mock_rpm,
+                          error_rate=args.error_rate, malformed_rate=args.malformed_rate,
+                          drop_rate=args.drop_rate, seed=args.seed)
+    cache_hits = translation_cache.hits if translation_cache is not None else 0
+    cache_lookups = cache_hits + (translation_cache.misses if translation_cache is not None else 0)
+    tracemalloc.start()
+    start = time.perf_counter()
+    document = read_subtitles(source_path)
+    engine = TranslationEngine(args.to, config=config, translation_cache=translation_cache, backend=backend,
+                               translation_memory=translation_memory)
+    try:
+        write_subtitles(document, output_path, engine.translate(document.texts))
+    finally:
+        engine.close()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if translation_cache is not None:
+        cache_hits = translation_cache.hits - cache_hits
+        cache_lookups = translation_cache.hits + translation_cache.misses - cache_lookups
+    cues = len(document)
+    metrics = engine.metrics.snapshot()
+    return {
+        "cues": cues,
+        "seconds": round(seconds, 3),
+        "cues_per_second": round(cues / seconds, 1) if seconds else None,
+        "requests": backend.requests,
+        "requests_per_cue": round(backend.requests / cues, 4) if cues else None,
+        "cache_hit_rate": round(cache_hits / cache_lookups, 4) if cache_lookups else 0.0,
+        "retries": engine.stats.get("retries", 0),
+        "fuzzy_rows": engine.stats.get("fuzzy_rows", 0),
+        "fuzzy_requests_saved": engine.stats.get("fuzzy_requests_saved", 0),
+        "peak_memory_mb": round(peak / 1048576, 1),
+        "latency_p50": metrics["latency_p50"],
+        "latency_p90": metrics["latency_p90"],
+        "queue_wait_seconds": metrics["queue_wait_seconds"],
+        "rate_wait_seconds": metrics["rate_wait_seconds"],
+        "input_tokens": metrics["input_tokens"],
+        "output_tokens": metrics["output_tokens"]
+    }
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Measure translation throughput against the mock backend.")
+    parser.add_argument("--cues", type=int, nargs="+", default=[1000, 10000, 100000], help="Synthetic file sizes")
+    parser.add_argument("--passes", type=int, default=2, help="Runs per size; later passes reuse the cache")
+    parser.add_argument("--repeat-rate", type=float, default=0.3, help="Share of cues repeating an earlier line")
+    parser.add_argument("--near-rate", type=float, default=0.0,
+                        help="Share of cues repeating an earlier line with other punctuation or case")
+    parser.add_argument("--to", default="French", help="Target language")
+    parser.add_argument("--rpm", type=int, default=100000, help="Engine requests per minute")
+    parser.add_argument("--concurrency", type=int, default=8, help="Engine requests in flight")
+    parser.add_argument("--batch-size", default="Auto", help="Translations per request, or Auto")
+    parser.add_argument("--streaming", choices=["On", "Off"], default="On")
+    parser.add_argument("--cache", choices=["RAM", "File", "None"], default="RAM")
+    parser.add_argument("--fuzzy", default="Off", help="Translation memory similarity threshold, or Off")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mock seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="Mock output speed (0: instant)")
+    parser.add_argument("--mock-rpm", type=int, default=0,
+                        help="Mock rate limit per API key; more requests get 429 (0: none)")
+    parser.add_argument("--keys", type=int, default=1, help="API keys in the engine's key pool")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock requests failing with 429")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of mock replies that are broken JSON")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Share of cues the mock leaves out")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Append results as JSON lines to this file")
+    parser.add_argument("--startup-budget", type=float, default=0.25,
+                        help="Most seconds importing the command-line path may take (default: 0.25)")
+    parser.add_argument("--startup-only", action="store_true", help="Only check start-up time")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    startup, problems = check_startup(args.startup_budget)
+    print("Start-up: " + ", ".join(f"{module} {seconds:.3f} s" if seconds is not None else f"{module} n/a"
+                                   for module, seconds in startup.items()))
+    for problem in problems:
+        print(f"Start-up budget exceeded: {problem}", file=sys.stderr)
+    if args.startup_only:
+        return 1 if problems else 0
+    print(f"{'cues':>8} {'pass':>4} {'seconds':>8} {'cues/s':>9} {'req/cue':>8} {'hit rate':>8} {'retries':>7} {'peak MB':>8}")
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        # The key pool counts each key's requests in the settings database
+        storage.DB_PATH = os.path.join(directory, "settings.db")
+        for cues in args.cues:
+            source_path = os.path.join(directory, f"synthetic-{cues}.srt")
+            write_synthetic_srt(source_path, cues, args.repeat_rate, args.seed, args.near_rate)
+            translation_cache = open_cache(args.cache, os.path.join(directory, f"cache-{cues}.db"))
+            translation_memory = open_memory(args, os.path.join(directory, f"cache-{cues}.db"))
+            try:
+                for run in range(1, args.passes + 1):
+                    result = run_pipeline(source_path, os.path.join(directory, "out.srt"), args, translation_cache,
+                                          translation_memory)
+                    result.update({"pass": run, "startup_seconds": startup})
+                    results.append(result)
+                    print(f"{cues:>8} {run:>4} {result['seconds']:>8.2f} {result['cues_per_second'] or 0:>9.0f} "
+                          f"{result['requests_per_cue']:>8.4f} {result['cache_hit_rate']:>8.0%} "
+                          f"{result['retries']:>7} {result['peak_memory_mb']:>8.1f}")
+            finally:
+                if translation_memory is not None:
+                    translation_memory.close()
+                if hasattr(translation_cache, 'close'):
+                    translation_cache.close()
+    if args.json:
+        with open(args.json, "a", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
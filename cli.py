@@ -0,0 +1,364 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import storage
+from backends import model_list
+from engine import PROMPT_VERSION, TranslationEngine, TranslationError, TranslationJob, output_file_name
+from jobs import JobQueue, collect_subtitle_files
+from journal import JobJournal
+from metrics import MetricsWriter
+from rate_limits import parse_key_spec, pool_entries
+from revision import revise
+from subtitle_io import SUBTITLE_EXTENSIONS, SubtitleWriter, read_subtitles
+from translation_cache import (TRANSFER_FORMATS, SQLiteTranslationCache, open_transfer_file, open_translation_cache,
+                               read_entries, transfer_format)
+from translation_memory import open_translation_memory
+
+def fuzzy_threshold(value):
+    if value == "Off":
+        return value
+    try:
+        if 0 < float(value) <= 1:
+            return value
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError("expected a similarity between 0 and 1, or Off")
+
+# Worker processes get their share of the API keys here rather than on the command line
+SHARD_KEYS_ENV = "SUBAI_API_KEYS"
+
+def shard(value):
+    try:
+        index, count = map(int, value.split("/"))
+        if 0 <= index < count:
+            return index, count
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError("expected K/N with 0 <= K < N")
+
+def positive_int(value):
+    try:
+        if int(value) > 0:
+            return int(value)
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError("expected a positive number")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="SubAI.py", description="Translate subtitles without the GUI.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    translate = subparsers.add_parser("translate", help="Translate SRT, WebVTT or ASS files")
+    translate.add_argument("inputs", nargs="+", metavar="input",
+                           help="Source subtitle files (.srt, .vtt, .ass) or directories of them")
+    translate.add_argument("--to", dest="target_languages", action="append", required=True,
+                           help="Target language, e.g. Persian; repeat it or separate languages with commas "
+                                "to translate into several in one pass")
+    translate.add_argument("-o", "--output", help="Output file for a single input and language, in the format of its "
+                                                  "extension, otherwise output directory "
+                                                  "(default: <lang>-<input name> next to each input)")
+    translate.add_argument("--api-key", dest="api_keys", action="append", metavar="KEY[,RPM[,DAILY_QUOTA]]",
+                           help="API key for the backend (default: the ones saved in settings); repeat it to spread "
+                                "requests over several keys, each with its own RPM and daily quota")
+    translate.add_argument("--backend", choices=["Gemini", "OpenAI", "Mock"],
+                           help="Translation backend: Gemini, an OpenAI-compatible server, or Mock to answer locally")
+    translate.add_argument("--base-url", dest="openai_base_url",
+                           help="Server URL for the OpenAI backend, e.g. http://192.168.1.20:8000/v1")
+    translate.add_argument("--model", help="Model API name, e.g. gemini-2.0-flash")
+    translate.add_argument("--rpm", help="Requests per minute")
+    translate.add_argument("--concurrency", help="Requests kept in flight at once")
+    translate.add_argument("--timeout", dest="request_timeout", type=positive_int, metavar="SECONDS",
+                           help="Give up on a request, and send its lines again, after this long without a reply")
+    translate.add_argument("--batch-size", help="Translations per request, or Auto to pack requests by token budget")
+    translate.add_argument("--cache", dest="cache_mode", choices=["RAM", "File", "None"], help="Translation cache mode")
+    translate.add_argument("--streaming", choices=["On", "Off"], help="Read replies as they are written")
+    translate.add_argument("--fuzzy", dest="fuzzy_threshold", metavar="SIMILARITY", type=fuzzy_threshold,
+                           help="Reuse the cached translation of a line at least this similar (0-1), or Off")
+    translate.add_argument("--metrics", metavar="FILE",
+                           help="Write request metrics to FILE while translating: Prometheus text format if it ends "
+                                "in .prom, otherwise one JSON line per snapshot")
+    translate.add_argument("--metrics-interval", type=float, default=10.0, metavar="SECONDS",
+                           help="Seconds between metrics snapshots (default: 10)")
+    translate.add_argument("--workers", type=positive_int, default=1, metavar="N",
+                           help="Split the files, or the lines of a single file, over N processes, each with its share "
+                                "of the API keys, before writing the outputs from the shared File cache")
+    translate.add_argument("--shard", type=shard, help=argparse.SUPPRESS)
+    translate.add_argument("--revise", nargs=2, metavar=("PREVIOUS_SOURCE", "PREVIOUS_TRANSLATION"),
+                           help="Keep the translation of every line unchanged since an earlier version of a single "
+                                "input, and translate only the changed and new lines")
+    translate.add_argument("--restart", action="store_true",
+                           help="Translate from scratch instead of resuming an interrupted run of the same files")
+
+    cache = subparsers.add_parser("cache", help="List, invalidate, export or import the translations in the File cache")
+    cache.add_argument("--language", help="Only entries translated into this language")
+    cache.add_argument("--model", help="Only entries translated by this model")
+    cache.add_argument("--prompt-version", type=int, help="Only entries made with this prompt version")
+    cache.add_argument("--stale", action="store_true",
+                       help=f"Only entries made with a prompt older than the current one (version {PROMPT_VERSION})")
+    action = cache.add_mutually_exclusive_group()
+    action.add_argument("--invalidate", action="store_true", help="Delete the selected entries instead of listing them")
+    action.add_argument("--export", metavar="FILE",
+                        help="Write the selected entries to FILE (.jsonl or .tmx, optionally .gz; - for standard output)")
+    action.add_argument("--import", dest="import_path", metavar="FILE",
+                        help="Add the entries of FILE to the cache; --model and --prompt-version fill in entries "
+                             "without them (default: the configured model and the current prompt)")
+    cache.add_argument("--format", choices=TRANSFER_FORMATS, help="Format of FILE (default: from its extension)")
+    cache.add_argument("--source-language", help="TMX language code of the source lines (default: en on export, "
+                                                 "the file's srclang on import)")
+    cache.add_argument("--replace", action="store_true",
+                       help="On import, overwrite cached translations of the same lines instead of keeping them")
+    return parser
+
+def print_progress(done, total):
+    print(f"\rTranslating: {done}/{total}", end="", file=sys.stderr, flush=True)
+
+def default_output_path(input_path, target_language):
+    directory, file_name = os.path.split(input_path)
+    return os.path.join(directory, output_file_name(file_name, target_language))
+
+def print_restored(restored):
+    if restored:
+        print(f"Resuming an interrupted run: {restored} lines already translated", file=sys.stderr)
+
+def translate_file(engine, args, journal):
+    document = read_subtitles(args.inputs[0])
+    if not document:
+        print("Error: Empty or invalid subtitle file", file=sys.stderr)
+        return 1
+    total = len(document)
+    output_path = args.output or default_output_path(args.inputs[0], engine.target_language)
+    writer = SubtitleWriter(document, output_path)
+
+    def progress(done):
+        writer.write_until(job.current_row, job.results)
+        print_progress(done, total)
+
+    job = TranslationJob(document.texts, name=args.inputs[0], target_language=engine.target_language, on_progress=progress)
+    if args.revise:
+        try:
+            revision = revise(document, read_subtitles(args.revise[0]), read_subtitles(args.revise[1]))
+        except (OSError, ValueError) as e:
+            print(f"Error: cannot read the previous version: {e}", file=sys.stderr)
+            return 1
+        job.results = revision.results
+        print(revision.summary(), file=sys.stderr)
+    print_restored(journal.open_job(job, args.inputs[0], engine.backend.model, resume=not args.restart))
+    try:
+        engine.run([job])
+    finally:
+        if not job.finished:
+            writer.discard()
+    if not job.finished:
+        return 1
+    writer.finish(job.results)
+    print(file=sys.stderr)
+    print(engine.stats_summary(), file=sys.stderr)
+    print(f"Saved {output_path}", file=sys.stderr)
+    return 0
+
+def translate_files(engine, args, journal):
+    if args.output and args.output.lower().endswith(SUBTITLE_EXTENSIONS):
+        print("Error: with several inputs or target languages -o must be a directory", file=sys.stderr)
+        return 2
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    queue = JobQueue(engine, output_dir=args.output, journal=journal, resume=not args.restart)
+    queue.add(args.inputs)
+    if not queue.paths:
+        print("Error: no subtitle files found", file=sys.stderr)
+        return 1
+
+    def file_finished(job):
+        print(f"\nSaved {job.output_path}", file=sys.stderr)
+
+    queue.load_jobs()
+    print_restored(queue.restored_rows)
+    queue.run(on_progress=print_progress, on_file_finished=file_finished)
+    print(file=sys.stderr)
+    for path, message in queue.errors:
+        print(f"{path}: {message}", file=sys.stderr)
+    print(f"{len(queue.outputs)}/{len(queue.jobs)} files translated. {engine.stats_summary()}", file=sys.stderr)
+    return 1 if queue.errors else 0
+
+def shard_jobs(engine, inputs, index, count):
+    """This worker's part of the work: every ``count``-th file, or with fewer files than workers its slice of each."""
+    paths = collect_subtitle_files(inputs, engine.target_languages)
+    split_rows = len(paths) < count
+    jobs = []
+    for path in paths if split_rows else paths[index::count]:
+        try:
+            texts = read_subtitles(path).texts
+        except Exception as e:
+            print(f"{path}: Error loading subtitle file: {str(e)}", file=sys.stderr)
+            continue
+        if split_rows:
+            texts = texts[len(texts) * index // count:len(texts) * (index + 1) // count]
+        jobs += [TranslationJob(texts, name=path, target_language=language) for language in engine.target_languages]
+    return jobs
+
+def run_shard(engine, args):
+    """Translate this worker's shard into the cache only; the parent process writes the outputs."""
+    index, count = args.shard
+    jobs = shard_jobs(engine, args.inputs, index, count)
+    engine.run(jobs)
+    finished = sum(job.finished for job in jobs)
+    print(f"Worker {index + 1}/{count}: {finished}/{len(jobs)} jobs translated. {engine.stats_summary()}", file=sys.stderr)
+    return 0 if finished == len(jobs) else 1
+
+def worker_key_entries(config, count):
+    """Each worker's API keys: one share of the pool each, or with fewer keys than workers every key at 1/``count`` of its budget."""
+    entries = pool_entries(config)
+    if len(entries) >= count:
+        return [entries[index::count] for index in range(count)]
+    shared = [dict(entry, rpm=max(1, entry["rpm"] // count), daily_quota=entry.get("daily_quota", 0) // count)
+              for entry in entries]
+    return [shared] * count
+
+def run_workers(args, config):
+    """Warm the File cache with ``args.workers`` processes, each translating a shard with its own keys."""
+    count = args.workers
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "SubAI.py")
+    key_entries = worker_key_entries(config, count) if config.get('backend', 'Gemini') != "OpenAI" else [[]] * count
+    rpm = str(max(1, int(config.get('rpm', '15')) // count))
+    print(f"Translating with {count} worker processes", file=sys.stderr)
+    processes = []
+    for index in range(count):
+        env = dict(os.environ)
+        if key_entries[index]:
+            env[SHARD_KEYS_ENV] = json.dumps(key_entries[index])
+        command = [sys.executable, script] + args.argv + ["--workers", "1", "--shard", f"{index}/{count}", "--cache", "File",
+                                                          "--rpm", rpm, "--metrics", ""]
+        processes.append(subprocess.Popen(command, env=env))
+    failed = [index + 1 for index, process in enumerate(processes) if process.wait() != 0]
+    if failed:
+        print(f"Workers {', '.join(map(str, failed))} did not finish; their remaining lines are translated next",
+              file=sys.stderr)
+
+def run_translate(args):
+    storage.initialize_db()
+    config = storage.load_config()
+    for key in ("backend", "openai_base_url", "model", "rpm", "concurrency", "request_timeout", "batch_size", "cache_mode",
+                "streaming", "fuzzy_threshold"):
+        value = getattr(args, key)
+        if value:
+            config[key] = value
+    backend = config.get('backend', 'Gemini')
+    if args.model:
+        # Offered for this run's backend, as the model setting is only used for the backend it was saved for
+        config[f"{backend.lower()}_models"] = json.dumps(model_list(config, backend) + [args.model])
+    try:
+        key_entries = [parse_key_spec(spec, config.get('rpm', '15')) for spec in args.api_keys or []]
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    if os.environ.get(SHARD_KEYS_ENV) and args.shard:
+        key_entries = json.loads(os.environ[SHARD_KEYS_ENV])
+    if key_entries:
+        config['openai_api_key' if backend == "OpenAI" else 'api_key'] = key_entries[0]["key"]
+        if backend != "OpenAI" and (len(key_entries) > 1 or key_entries[0]["daily_quota"]):
+            config['api_keys'] = json.dumps(key_entries)
+        elif backend != "OpenAI":
+            config['api_keys'] = '[]'
+            config['rpm'] = str(key_entries[0]["rpm"])
+    if backend == "Gemini" and not config.get('api_key'):
+        print("Error: no API key. Save one in Public Settings or pass --api-key.", file=sys.stderr)
+        return 2
+    target_languages = list(dict.fromkeys(language.strip() for value in args.target_languages
+                                          for language in value.split(",") if language.strip()))
+    single_file = len(args.inputs) == 1 and len(target_languages) == 1 and not os.path.isdir(args.inputs[0])
+    if args.revise and (not single_file or args.workers > 1):
+        print("Error: --revise takes a single input file, target language and worker", file=sys.stderr)
+        return 2
+    if args.workers > 1:
+        config['cache_mode'] = "File"
+        run_workers(args, config)
+
+    try:
+        engine = TranslationEngine(target_languages, config=config)
+    except TranslationError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    translation_cache = open_translation_cache(config)
+    engine.translation_cache = translation_cache
+    engine.translation_memory = open_translation_memory(config)
+    journal = JobJournal()
+    metrics_writer = MetricsWriter(engine.metrics, args.metrics, args.metrics_interval) if args.metrics else None
+    if metrics_writer:
+        metrics_writer.start()
+    try:
+        if args.shard:
+            return run_shard(engine, args)
+        if single_file:
+            return translate_file(engine, args, journal)
+        return translate_files(engine, args, journal)
+    except TranslationError as e:
+        print(f"\nError: {e}", file=sys.stderr)
+        print("Run the same command again to resume.", file=sys.stderr)
+        return 1
+    finally:
+        engine.close()
+        if metrics_writer:
+            metrics_writer.stop()
+        journal.close()
+        if engine.translation_memory is not None:
+            engine.translation_memory.close()
+        if hasattr(translation_cache, 'close'):
+            translation_cache.close()
+        storage.save_settings({'batch_profiles': json.dumps(engine.batcher.export())})
+
+def run_cache(args):
+    storage.initialize_db()
+    config = storage.load_config()
+    cache = SQLiteTranslationCache(legacy_model=config.get('model', ''))
+    before_version = PROMPT_VERSION if args.stale else None
+    try:
+        if args.export:
+            if args.stale:
+                print("Error: --stale cannot be exported", file=sys.stderr)
+                return 2
+            try:
+                with open_transfer_file(args.export, "w") as f:
+                    count = cache.export(f, transfer_format(args.export, args.format), args.source_language or "en",
+                                         language=args.language, model=args.model, prompt_version=args.prompt_version)
+            except BrokenPipeError:
+                # The reader of standard output (say, head) went away; keep Python from complaining at exit
+                os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+                return 1
+            print(f"Exported {count} cached translations", file=sys.stderr)
+            return 0
+        if args.import_path:
+            try:
+                with open_transfer_file(args.import_path, "r") as f:
+                    entries = read_entries(f, transfer_format(args.import_path, args.format),
+                                           args.model or config.get('model', ''), args.prompt_version or PROMPT_VERSION,
+                                           args.source_language)
+                    count = cache.import_entries(entries, args.replace)
+            except (OSError, ValueError) as e:
+                print(f"Error: {e}", file=sys.stderr)
+                return 1
+            print(f"Imported {count} translations", file=sys.stderr)
+            return 0
+        if args.invalidate:
+            deleted = cache.invalidate(args.language, args.model, args.prompt_version, before_version)
+            print(f"Deleted {deleted} cached translations", file=sys.stderr)
+            return 0
+        for language, model, prompt_version, entries in cache.scopes():
+            if ((args.language is None or language == args.language) and (args.model is None or model == args.model)
+                    and (args.prompt_version is None or prompt_version == args.prompt_version)
+                    and (before_version is None or prompt_version < before_version)):
+                print(f"{language}\t{model}\tprompt {prompt_version}\t{entries} entries")
+        return 0
+    finally:
+        cache.close()
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = build_parser().parse_args(argv)
+    args.argv = list(argv)
+    if args.command == "translate":
+        return run_translate(args)
+    if args.command == "cache":
+        return run_cache(args)
+    return 1
@@ -0,0 +1,990 @@
+import heapq
+import json
+import math
+import queue
+import random
+import sys
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future, wait
+from backends import REQUEST_TIMEOUT, BackendError, open_backend
+from normalize import normalize_text, restore_formatting
+from batching import AdaptiveBatcher, estimate_tokens
+from metrics import Metrics
+from rate_limits import QuotaExhausted, RateLimiter, open_key_pool
+from translation_cache import cache_scope, make_cache_key
+from translation_memory import adapt_translation
+from streaming import JSON_OBJECT_PAIR, JSON_PAIR, CueStreamParser, decode_pair, decode_raw_pair
+
+LANG_CODES = {
+    "English": "en",
+    "French": "fr",
+    "German": "de",
+    "Spanish": "es",
+    "Persian": "fa",
+    "Chinese": "zh",
+    "Japanese": "ja"
+}
+
+LOOKAHEAD_UNITS = 200
+MAX_REQUEST_RETRIES = 5
+MAX_CUE_RETRIES = 3
+MAX_BACKOFF = 60
+# Seconds ``close`` waits for requests given up on to bring their replies to the cache
+ABANDONED_WAIT = 3
+# Part of every cache key: raise it when a change to build_prompt changes what translations look like
+PROMPT_VERSION = 1
+
+def lang_prefix(target_language):
+    return LANG_CODES.get(target_language, target_language.lower())
+
+def output_file_name(original_file_name, target_language):
+    prefix = lang_prefix(target_language)
+    return f"{prefix}-{original_file_name}" if original_file_name else f"{prefix}-translated.srt"
+
+def is_connection_error(error, transient=False):
+    """Whether ``error`` is a lost connection (or with ``transient``, also a timeout or a cut-off reply).
+
+    ``requests`` is only imported by the HTTP backends, when one is opened;
+    without it loaded no request can have failed with one of its errors.
+    """
+    requests = sys.modules.get("requests")
+    if requests is None:
+        return False
+    errors = (requests.exceptions.ConnectionError,)
+    if transient:
+        errors += (requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError)
+    return isinstance(error, errors)
+
+class TranslationError(Exception):
+    pass
+
+class RequestAbandoned(Exception):
+    """Raised in a request thread once the engine has given up on its batch (pause, cancel or timeout)."""
+
+class TranslationJob:
+    """One subtitle file's texts, its results and the callbacks that report them.
+
+    ``on_translated(row, text)`` gets each result and
+    ``on_translated_rows(rows)`` each group of ``(row, text)`` results
+    applied together, ``on_progress(rows_done)`` the number of rows done so
+    far (counting rows before ``start_row`` and empty ones) and
+    ``on_finished(job)`` is called once every row is done.
+    ``target_language`` defaults to the engine's first target language.
+    Rows whose entry in ``results`` is already set, such as ones restored
+    from the job journal, are not requested again.
+    """
+
+    def __init__(self, texts, start_row=0, name="", target_language=None, on_translated=None, on_progress=None, on_finished=None,
+                 on_translated_rows=None):
+        self.texts = texts
+        self.start_row = start_row
+        self.name = name
+        self.target_language = target_language
+        self.on_translated = on_translated
+        self.on_translated_rows = on_translated_rows
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.results = [None] * len(texts)
+        self.current_row = start_row
+        self.done_rows = 0
+        self.queued_rows = 0
+        self.outstanding = []
+        self.applied_rows = set()
+        self.finished = False
+
+    @property
+    def total_rows(self):
+        return len(self.texts)
+
+    def start(self):
+        heapq.heapify(self.outstanding)
+        self.done_rows = self.total_rows - self.queued_rows
+        self.advance()
+
+    def apply(self, rows):
+        for row, translated_text in rows:
+            self.results[row] = translated_text
+            if self.on_translated:
+                self.on_translated(row, translated_text)
+        if self.on_translated_rows:
+            self.on_translated_rows(rows)
+        self.done_rows += len(rows)
+        self.advance()
+
+    def advance(self):
+        while self.outstanding and self.outstanding[0] in self.applied_rows:
+            heapq.heappop(self.outstanding)
+        self.current_row = self.outstanding[0] if self.outstanding else self.total_rows
+        if self.on_progress:
+            self.on_progress(self.done_rows)
+        if not self.outstanding and not self.finished:
+            self.finished = True
+            if self.on_finished:
+                self.on_finished(self)
+
+class TranslationUnit:
+    """One distinct normalized text in one target language and the rows, with their formatting, that share it."""
+
+    def __init__(self, cache_key, text, language, scope=None):
+        self.cache_key = cache_key
+        self.text = text
+        self.language = language
+        self.scope = scope
+        self.rows = []
+        self.first_rows = {}
+        self.attempts = 0
+        self.queued_at = 0.0
+
+class Batch:
+    """Cues answered from the cache, or sent together in one request.
+
+    A request asks for each distinct text once, in every language its units
+    need; ``unit_keys`` maps each (text index, language) of the reply to the
+    units waiting for it. Units already shown from a streamed reply are kept
+    in ``streamed``. ``urgent`` batches carry rows passed to
+    ``TranslationEngine.prioritize`` and are applied as soon as they are
+    ready rather than in turn. A request thread keeps what a streamed reply
+    brought so far in ``received`` and the time of its last chunk in
+    ``active`` (None while it waits to retry); ``abandoned`` tells it the
+    engine has given up on it. Units that replies kept leaving out are put in
+    ``failed`` and keep their source text.
+    """
+
+    def __init__(self, cached=None, units=None, ready=False, urgent=False):
+        self.cached = cached or []
+        self.units = units or []
+        self.urgent = urgent
+        self.translated = []
+        self.failed = []
+        self.streamed = set()
+        self.future = None
+        self.ready = ready
+        self.abandoned = False
+        self.received = {}
+        self.active = None
+        self.created = time.monotonic()
+        self.texts = list(dict.fromkeys(unit.text for unit in self.units))
+        self.languages = list(dict.fromkeys(unit.language for unit in self.units))
+        text_indexes = {text: idx for idx, text in enumerate(self.texts)}
+        self.unit_keys = {}
+        for unit in self.units:
+            self.unit_keys.setdefault((text_indexes[unit.text], unit.language), []).append(unit)
+
+class TranslationEngine:
+    """Batches subtitle texts through the model without depending on Qt.
+
+    Callers get results through the optional ``on_translated(row, text)`` and
+    ``on_progress(rows_done)`` callbacks passed to ``translate``. After a run,
+    ``stats`` reports how many rows were served from the cache or shared a
+    request with an identical cue, and how many requests that saved.
+    ``target_language`` may be a list; ``run`` then accepts jobs for any of
+    those languages and asks for all of a cue's languages in one request.
+    With the ``streaming`` setting on, replies are read as they are written
+    and each cue is passed on as soon as its translation is complete.
+    Requests go to ``backend``, by default the one named in the settings
+    (see ``backends.open_backend``). With a ``translation_memory``, cues
+    missing from the cache reuse the cached translation of a near-identical
+    line instead of being requested. With extra keys in the ``api_keys``
+    setting, requests are spread over a ``KeyPool`` whose keys each have
+    their own RPM and daily quota instead of the single ``rpm`` limit.
+    Rows passed to ``prioritize`` while it runs, such as the ones on screen,
+    jump ahead of the rest of the queue. ``pause``, ``resume`` and ``cancel``
+    take effect at once: requests in flight are given up on and their cues
+    queued again, and what they still bring back goes to the cache.
+    """
+
+    def __init__(self, target_language, config=None, translation_cache=None, backend=None, translation_memory=None):
+        self.target_languages = [target_language] if isinstance(target_language, str) else list(target_language)
+        self.target_language = self.target_languages[0]
+        self.config = config or {}
+        try:
+            self.backend = backend or open_backend(self.config)
+        except BackendError as e:
+            raise TranslationError(str(e))
+        self.key_pool = open_key_pool(self.config) if self.backend.uses_api_keys else None
+        self.rpm = self.key_pool.rpm if self.key_pool else int(self.config.get('rpm', '15'))
+        self.concurrency = max(1, int(self.config.get('concurrency', '3')))
+        if self.backend.max_concurrency:
+            self.concurrency = min(self.concurrency, self.backend.max_concurrency)
+        self.rate_limiter = RateLimiter(self.rpm)
+        self.metrics = Metrics(self.rpm)
+        self.is_canceled = False
+        self.is_paused = False
+        # Set while paused or canceled; every wait of the engine and its request threads ends when it is
+        self.interrupted = threading.Event()
+        self.request_timeout = float(self.config.get('request_timeout') or REQUEST_TIMEOUT)
+        self.abandoned = set()
+        self.abandoned_lock = threading.Lock()
+        self.closed = False
+        self.current_row = 0
+        self.stats = {}
+        self.cache_mode = self.config.get('cache_mode', 'RAM')
+        self.translation_cache = translation_cache
+        self.translation_memory = translation_memory
+        self.batcher = AdaptiveBatcher(self.config.get('model', 'gemini-1.5-flash'), self.config.get('batch_size', 'Auto'),
+                                       json.loads(self.config.get('batch_profiles', '{}')))
+        self.streaming = self.config.get('streaming', 'On') == "On"
+        self.backoff_until = 0
+        self.backoff_lock = threading.Lock()
+        self.priority_requests = []
+        self.priority_lock = threading.Lock()
+        self.priority_units = set()
+        self.row_units = {}
+        self.events = None
+
+    def cancel(self):
+        """Stop the run as soon as possible; safe to call from any thread.
+
+        Requests in flight are given up on rather than waited for; rows
+        they leave untranslated come after the jobs' ``current_row``.
+        """
+        self.is_canceled = True
+        self.interrupted.set()
+        self.wake()
+
+    def pause(self):
+        """Stop sending requests and give up on the ones in flight until ``resume``; safe to call from any thread."""
+        self.is_paused = True
+        self.interrupted.set()
+        self.wake()
+
+    def resume(self):
+        self.is_paused = False
+        if not self.is_canceled:
+            self.interrupted.clear()
+        self.wake()
+
+    def wake(self):
+        """Have a running ``run`` look at its controls and priorities again."""
+        events = self.events
+        if events is not None:
+            events.put(None)
+
+    def prioritize(self, rows, job=None):
+        """Send ``rows`` (of ``job``, or of every job) before the rest of the backlog; safe to call from any thread.
+
+        Rows still waiting are moved to the front of the queue, and their
+        batches are applied as soon as they come back. Later calls go ahead
+        of earlier ones.
+        """
+        with self.priority_lock:
+            self.priority_requests.append((job, list(rows)))
+        self.wake()
+
+    def take_priority(self):
+        """The units of the rows passed to ``prioritize`` since the last call."""
+        with self.priority_lock:
+            requests, self.priority_requests = self.priority_requests, []
+        wanted = set()
+        for job, rows in requests:
+            for row in rows:
+                for row_job, unit in self.row_units.get(row, ()):
+                    if job is None or row_job is job:
+                        wanted.add(unit)
+        return wanted
+
+    def build_prompt(self, texts, languages):
+        source = json.dumps({str(i + 1): text for i, text in enumerate(texts)}, ensure_ascii=False, indent=0)
+        if len(languages) == 1:
+            return (f"Translate the values of this JSON object to {languages[0]}.\n"
+                    "Reply with only a JSON object that has exactly the same keys, each mapped to its translation. "
+                    "Keep formatting tags and line breaks.\n"
+                    + source)
+        language_keys = ", ".join(f'"{language}"' for language in languages)
+        return (f"Translate the values of this JSON object to each of these languages: {', '.join(languages)}.\n"
+                "Reply with only a JSON object that has exactly the same keys, each mapped to an object "
+                f"with the keys {language_keys} holding the translation into that language. "
+                "Keep formatting tags and line breaks.\n"
+                + source)
+
+    def parse_response(self, response_text, languages):
+        """Map (0-based cue index, language) to translations from a JSON reply keyed by cue number.
+
+        With one language each cue maps to its translation, with several to
+        an object keyed by language. Replies that are not valid JSON, such as
+        ones cut off by the output limit, are scanned for the complete cues
+        instead.
+        """
+        text = self.reply_body(response_text)
+        response_dict = {}
+        try:
+            start = text.index("{")
+            parsed = json.loads(text[start:text.rindex("}") + 1])
+            pairs = parsed.items() if isinstance(parsed, dict) else []
+        except ValueError:
+            pattern = JSON_PAIR if len(languages) == 1 else JSON_OBJECT_PAIR
+            for num, value in pattern.findall(text):
+                response_dict.update(decode_raw_pair(num, value, languages))
+            return response_dict
+        for num, value in pairs:
+            response_dict.update(decode_pair(num, value, languages))
+        return response_dict
+
+    @staticmethod
+    def reply_body(response_text):
+        """A reply without the Markdown code fence models sometimes put around it."""
+        text = response_text.strip()
+        if text.startswith("```"):
+            text = text.strip("`").partition("\n")[2]
+        return text
+
+    @classmethod
+    def is_valid_reply(cls, response_text):
+        """Whether a reply is one well-formed JSON object, whatever cues it holds."""
+        text = cls.reply_body(response_text)
+        try:
+            return isinstance(json.loads(text[text.index("{"):text.rindex("}") + 1]), dict)
+        except ValueError:
+            return False
+
+    def generate(self, prompt, languages, on_partial=None, api_key=None, should_stop=None):
+        """Run one request and return the backend's completion and its translations.
+
+        When streaming, ``on_partial`` is called from the request thread with
+        each group of cues as soon as the reply has completed them, and the
+        reply is closed with ``RequestAbandoned`` as soon as ``should_stop()``
+        is true. ``api_key`` is the key from the pool to send it with, if
+        there is one.
+        """
+        key = api_key.key if api_key is not None else None
+        if not (self.streaming and on_partial):
+            completion = self.backend.complete(prompt, api_key=key)
+            return completion, self.parse_response(completion.text, languages)
+        completion = self.backend.stream(prompt, api_key=key)
+        parser = CueStreamParser(languages)
+        streamed = {}
+        for chunk in completion:
+            found = parser.feed(chunk)
+            if found:
+                streamed.update(found)
+                on_partial(found)
+            if should_stop is not None and should_stop():
+                completion.close()
+                raise RequestAbandoned()
+        response_dict = self.parse_response(completion.text, languages)
+        response_dict.update(streamed)
+        return completion, response_dict
+
+    def request_translations(self, texts, languages, on_partial=None, api_key=None, should_stop=None, on_activity=None):
+        """Send one batch and return the translations that came back, keyed by (index, language).
+
+        429 and 5xx replies and dropped connections are retried with
+        exponential backoff shared by every request thread; missing or
+        invalid cues are left out for the caller to send again. With a key
+        pool a 429 only rests the key that got it, and the retry goes out
+        with whichever key is free next. Once ``should_stop()`` (by default,
+        a cancel) is true, ``RequestAbandoned`` is raised instead of reading
+        on or retrying. ``on_activity(True)`` is called as each attempt goes
+        out and ``on_activity(False)`` while it waits to retry.
+        """
+        should_stop = should_stop or (lambda: self.is_canceled)
+        attempt = 0
+        max_attempts = MAX_REQUEST_RETRIES * (len(self.key_pool.keys) if self.key_pool else 1)
+        prompt = self.build_prompt(texts, languages)
+        while True:
+            if should_stop():
+                raise RequestAbandoned()
+            if on_activity:
+                on_activity(True)
+            started = time.monotonic()
+            try:
+                completion, response_dict = self.generate(prompt, languages, on_partial, api_key, should_stop)
+                self.metrics.observe_request(time.monotonic() - started, completion.input_tokens or estimate_tokens(prompt),
+                                             completion.output_tokens or estimate_tokens(completion.text))
+                if api_key is not None:
+                    self.key_pool.succeeded(api_key)
+                break
+            except RequestAbandoned:
+                raise
+            except Exception as e:
+                self.metrics.observe_request(time.monotonic() - started, failed=True)
+                if should_stop():
+                    raise RequestAbandoned()
+                if not self.is_retryable(e) or attempt >= max_attempts:
+                    if is_connection_error(e):
+                        raise TranslationError("Internet connection lost. Translation stopped.")
+                    raise TranslationError(f"Translation failed: {str(e)}")
+                self.stats["retries"] += 1
+                self.metrics.count("retries")
+                if api_key is not None and self.error_code(e) == 429:
+                    self.key_pool.back_off(api_key)
+                else:
+                    self.back_off(attempt)
+                if on_activity:
+                    on_activity(False)
+                api_key = self.acquire(should_stop)
+                attempt += 1
+        # Only a reply cut off by the output limit, or garbled, says the batch was too big; cues the model merely
+        # left out are sent again without shrinking the batches
+        if (completion.truncated or (completion.output_tokens or 0) >= self.batcher.output_limit
+                or not self.is_valid_reply(completion.text)):
+            self.batcher.record_failure()
+        elif len(response_dict) == len(texts) * len(languages):
+            self.batcher.record_success(self.batcher.texts_tokens(texts) * len(languages), completion.output_tokens)
+        return response_dict
+
+    def back_off(self, attempt):
+        delay = min(MAX_BACKOFF, 2 ** attempt) + random.uniform(0, 1)
+        with self.backoff_lock:
+            self.backoff_until = max(self.backoff_until, time.monotonic() + delay)
+            return self.backoff_until - time.monotonic()
+
+    @staticmethod
+    def error_code(error):
+        """The HTTP status a failed request reported, or None."""
+        code = getattr(error, 'code', None)
+        if code is None:
+            code = getattr(getattr(error, 'response', None), 'status_code', None)
+        try:
+            return int(code)
+        except (TypeError, ValueError):
+            return None
+
+    @classmethod
+    def is_retryable(cls, error):
+        if is_connection_error(error, transient=True):
+            return True
+        code = cls.error_code(error)
+        return code is not None and (code == 429 or 500 <= code < 600)
+
+    def try_acquire(self):
+        """Return ``(0, api_key)`` once the next request may go out, with the pool's key for it (None without a
+        pool), or ``(seconds to wait, None)``."""
+        if self.key_pool is None:
+            return max(0, self.backoff_until - time.monotonic()) or self.rate_limiter.try_acquire(), None
+        wait_time = max(0, self.backoff_until - time.monotonic())
+        if wait_time:
+            return wait_time, None
+        try:
+            return self.key_pool.try_acquire()
+        except QuotaExhausted as e:
+            raise TranslationError(str(e))
+
+    def acquire(self, should_stop):
+        """Wait until a request may go out, or raise ``RequestAbandoned`` once ``should_stop()``; return its key."""
+        while not should_stop():
+            wait_time, api_key = self.try_acquire()
+            if not wait_time:
+                return api_key
+            self.interrupted.wait(wait_time)
+        raise RequestAbandoned()
+
+    def cache_scope(self, language):
+        return cache_scope(language, self.backend.model, PROMPT_VERSION)
+
+    def store_cached(self, cache_key, translated_text, scope, source_text):
+        store = getattr(self.translation_cache, 'store', None)
+        if store is not None:
+            store(cache_key, translated_text, scope, source_text)
+        else:
+            self.translation_cache[cache_key] = translated_text
+
+    def lookup_cached(self, cache_keys):
+        get_many = getattr(self.translation_cache, 'get_many', None)
+        if get_many is not None:
+            return get_many(cache_keys)
+        return {key: self.translation_cache[key] for key in cache_keys if key in self.translation_cache}
+
+    def build_units(self, jobs):
+        """Group rows of all jobs whose normalized text and target language are identical.
+
+        Units come in order of first appearance, with the languages of one
+        cue next to each other so they can share a request. Jobs over the
+        same texts in different languages are normalized only once.
+        """
+        units = {}
+        groups = {}
+        scopes = {}
+        self.row_units = {}
+        for job in jobs:
+            if job.target_language is None:
+                job.target_language = self.target_language
+            scopes[job.target_language] = self.cache_scope(job.target_language)
+            groups.setdefault(id(job.texts), []).append(job)
+        for group in groups.values():
+            texts = group[0].texts
+            for row in range(min(job.start_row for job in group), len(texts)):
+                if texts[row] is None:
+                    continue
+                canonical, style = normalize_text(texts[row])
+                if not canonical:
+                    continue
+                for job in group:
+                    if row < job.start_row or job.results[row] is not None:
+                        continue
+                    scope = scopes[job.target_language]
+                    cache_key = make_cache_key(scope, canonical)
+                    unit = units.get(cache_key)
+                    if unit is None:
+                        unit = units[cache_key] = TranslationUnit(cache_key, canonical, job.target_language, scope)
+                    if job not in unit.first_rows:
+                        unit.first_rows[job] = row
+                        job.outstanding.append(row)
+                    unit.rows.append((job, row, style))
+                    self.row_units.setdefault(row, []).append((job, unit))
+                    job.queued_rows += 1
+        return list(units.values())
+
+    def stats_summary(self):
+        duplicates = self.stats.get("rows", 0) - self.stats.get("unique", 0)
+        summary = (f"{duplicates} duplicate lines translated once, {self.stats.get('cached_rows', 0)} lines from cache, "
+                   f"{self.stats.get('requests', 0)} requests sent ({self.stats.get('requests_saved', 0)} API calls saved).")
+        if self.stats.get("fuzzy_rows"):
+            summary += (f" {self.stats['fuzzy_rows']} near-duplicate lines reused from translation memory "
+                        f"({self.stats['fuzzy_requests_saved']} API calls avoided).")
+        if self.stats.get("failed_rows"):
+            summary += (f" {self.stats['failed_rows']} lines left untranslated after {MAX_CUE_RETRIES} retries; "
+                        "they keep their source text.")
+        if self.key_pool is not None:
+            summary += " " + self.key_pool.summary()
+        return summary
+
+    def prepare_batch(self, units):
+        """Split a batch into cached results, results from the translation memory and units that still need a request."""
+        cached_texts = self.lookup_cached([unit.cache_key for unit in units]) if self.use_cache else {}
+        translated_units = []
+        uncached_units = []
+        for unit in units:
+            cached = cached_texts.get(unit.cache_key)
+            if cached is not None:
+                translated_units.append((unit, cached))
+            else:
+                uncached_units.append(unit)
+        if self.use_cache:
+            self.metrics.count("cache_hits", len(translated_units))
+            self.metrics.count("cache_misses", len(uncached_units))
+        fuzzy_units = []
+        if self.use_cache and self.translation_memory and uncached_units:
+            matches = {}
+            for unit in uncached_units:
+                match = self.translation_memory.find(unit.scope, unit.text)
+                if match:
+                    matches[unit] = match
+            matched_texts = self.lookup_cached([cache_key for cache_key, _, _ in matches.values()]) if matches else {}
+            remaining = []
+            for unit in uncached_units:
+                cache_key, matched_text, _ = matches.get(unit, (None, None, None))
+                if cache_key in matched_texts:
+                    fuzzy_units.append((unit, adapt_translation(unit.text, matched_text, matched_texts[cache_key])))
+                else:
+                    remaining.append(unit)
+            uncached_units = remaining
+            self.metrics.count("memory_hits", len(fuzzy_units))
+        return translated_units, fuzzy_units, uncached_units
+
+    def queue_units(self, units, uncached, urgent=False):
+        """Look ``units`` up in the cache and memory and queue the rest for requests, ahead of the others if ``urgent``.
+
+        Returns the batch of the ones found, or None.
+        """
+        translated_units, fuzzy_units, uncached_units = self.prepare_batch(units)
+        now = time.monotonic()
+        for unit in uncached_units:
+            unit.queued_at = now
+        if urgent:
+            uncached.extendleft(reversed(uncached_units))
+        else:
+            uncached.extend(uncached_units)
+        if fuzzy_units:
+            self.stats["fuzzy_units"] += len(fuzzy_units)
+            self.stats["fuzzy_rows"] += sum(len(unit.rows) for unit, _ in fuzzy_units)
+        if not (translated_units or fuzzy_units):
+            return None
+        self.stats["cached_rows"] += sum(len(unit.rows) for unit, _ in translated_units)
+        return Batch(cached=translated_units + fuzzy_units, ready=True, urgent=urgent)
+
+    def promote(self, wanted, pending, uncached):
+        """Move the ``wanted`` units still waiting to the front of ``uncached``; return the batch of those found cached."""
+        self.priority_units |= wanted
+        queued = [unit for unit in uncached if unit in wanted]
+        if queued:
+            rest = [unit for unit in uncached if unit not in wanted]
+            uncached.clear()
+            uncached.extend(queued + rest)
+        promoted = [unit for unit in pending if unit in wanted]
+        if not promoted:
+            return None
+        rest = [unit for unit in pending if unit not in wanted]
+        pending.clear()
+        pending.extend(rest)
+        return self.queue_units(promoted, uncached, urgent=True)
+
+    def apply_translations(self, translated, cached=()):
+        """Copy translations to every row of their units; ``translated`` ones are also stored in the cache."""
+        for unit, translated_text in translated:
+            if self.use_cache:
+                self.store_cached(unit.cache_key, translated_text, unit.scope, unit.text)
+                if self.translation_memory is not None:
+                    self.translation_memory.add(unit.cache_key, unit.scope, unit.text)
+        job_rows = {}
+        for unit, translated_text in list(cached) + list(translated):
+            for job, row, style in unit.rows:
+                job_rows.setdefault(job, []).append((row, restore_formatting(translated_text, style)))
+            for job, first_row in unit.first_rows.items():
+                job.applied_rows.add(first_row)
+        for job, rows in job_rows.items():
+            job.apply(sorted(rows))
+
+    def apply_batch(self, batch):
+        translated = [(unit, text) for unit, text in batch.translated if unit not in batch.streamed]
+        self.apply_translations(translated, batch.cached)
+        if batch.failed:
+            self.apply_untranslated(batch.failed)
+
+    def apply_untranslated(self, units):
+        """Fill the rows of units no reply would translate with their source text, leaving the cache alone."""
+        job_rows = {}
+        for unit in units:
+            for job, row, style in unit.rows:
+                job_rows.setdefault(job, []).append((row, job.texts[row]))
+            for job, first_row in unit.first_rows.items():
+                job.applied_rows.add(first_row)
+        for job, rows in job_rows.items():
+            job.apply(sorted(rows))
+        self.stats["failed_rows"] += sum(len(unit.rows) for unit in units)
+
+    def apply_streamed(self, batch, response_dict):
+        """Show the cues a streaming reply has completed so far, ahead of the rest of the batch."""
+        translated = []
+        for key, translated_text in response_dict.items():
+            for unit in batch.unit_keys.get(key, []):
+                if unit not in batch.streamed:
+                    batch.streamed.add(unit)
+                    translated.append((unit, translated_text))
+        self.apply_translations(translated)
+
+    def request_batch(self, batch, events, api_key=None):
+        """Send the units of a batch, asking for every language wanted for each distinct text."""
+        def on_partial(response_dict):
+            batch.received.update(response_dict)
+            batch.active = time.monotonic()
+            events.put((batch, response_dict))
+
+        def on_activity(active):
+            # Waiting to retry does not count against the request timeout
+            batch.active = time.monotonic() if active else None
+
+        return self.request_translations(batch.texts, batch.languages, on_partial if self.streaming else None, api_key,
+                                         lambda: batch.abandoned or self.interrupted.is_set(), on_activity)
+
+    def abandon_requests(self, in_flight, batches, uncached):
+        """Give up on the requests in flight that were interrupted or timed out; return their units to send again.
+
+        Units whose requests timed out more than ``MAX_CUE_RETRIES`` times
+        keep their source text instead. Replies that came back in the
+        meantime are still collected. The request threads stop at their next
+        chunk or retry, and whatever they receive after all is stored in the
+        cache by ``keep_abandoned``.
+        """
+        now = time.monotonic()
+        units = []
+        for future, batch in list(in_flight.items()):
+            stopped = future.done() and isinstance(future.exception(), RequestAbandoned)
+            if future.done() and not stopped:
+                self.collect_batch(in_flight.pop(future), uncached)
+                continue
+            timed_out = batch.active is not None and now - batch.active > self.request_timeout
+            if not (stopped or timed_out or self.interrupted.is_set()):
+                continue
+            del in_flight[future]
+            for seq in [seq for seq, queued in batches.items() if queued is batch]:
+                del batches[seq]
+            batch.abandoned = True
+            with self.abandoned_lock:
+                self.abandoned.add(future)
+            future.add_done_callback(lambda future, batch=batch: self.keep_abandoned(batch, future))
+            resent = [unit for unit in batch.units if unit not in batch.streamed]
+            if timed_out and not stopped:
+                self.stats["retries"] += 1
+                self.metrics.count("retries")
+                for unit in resent:
+                    unit.attempts += 1
+                # Like cues replies keep leaving out, they keep their source text rather than ending the job
+                failed = [unit for unit in resent if unit.attempts > MAX_CUE_RETRIES]
+                if failed:
+                    self.apply_untranslated(failed)
+                    resent = [unit for unit in resent if unit.attempts <= MAX_CUE_RETRIES]
+            units.extend(resent)
+        return units
+
+    def keep_abandoned(self, batch, future):
+        """Store what an abandoned request brought back in the cache, so its cues are not paid for twice.
+
+        Replies coming in after ``close`` are dropped, as the cache may be closed by then.
+        """
+        received = dict(batch.received)
+        if future.exception() is None:
+            received.update(future.result())
+        translated = []
+        for key, translated_text in received.items():
+            translated.extend((unit, translated_text) for unit in batch.unit_keys.get(key, ()) if unit not in batch.streamed)
+        with self.abandoned_lock:
+            self.abandoned.discard(future)
+            if self.closed or not self.use_cache:
+                return
+            for unit, translated_text in translated:
+                self.store_cached(unit.cache_key, translated_text, unit.scope, unit.text)
+                if self.translation_memory is not None:
+                    self.translation_memory.add(unit.cache_key, unit.scope, unit.text)
+
+    def submit(self, function, *args):
+        """Run ``function(*args)`` in a new daemon thread and return its Future.
+
+        Requests given up on can stay blocked in the network for up to the
+        backend's timeout; as daemon threads they do not hold up the
+        process's exit, nor a pool slot of the requests that replace them.
+        """
+        future = Future()
+
+        def run():
+            future.set_running_or_notify_cancel()
+            try:
+                result = function(*args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def close(self, timeout=ABANDONED_WAIT):
+        """Give requests given up on ``timeout`` seconds to bring their replies to the cache, then close the backend.
+
+        Call it once the engine is done with, before closing its cache and
+        translation memory.
+        """
+        with self.abandoned_lock:
+            abandoned = list(self.abandoned)
+        wait(abandoned, timeout)
+        with self.abandoned_lock:
+            self.closed = True
+        try:
+            if abandoned and self.use_cache:
+                self.flush_cache()
+        finally:
+            self.backend.close()
+
+    def collect_batch(self, batch, uncached):
+        """Take a finished request's translations and queue its missing cues again.
+
+        Translations the reply carried for languages the batch did not need
+        for that text are still stored in the cache.
+        """
+        response_dict = batch.future.result()
+        batch.future = None
+        missing = []
+        for key, units in batch.unit_keys.items():
+            for unit in units:
+                if key in response_dict:
+                    batch.translated.append((unit, response_dict[key]))
+                    continue
+                unit.attempts += 1
+                if unit.attempts > MAX_CUE_RETRIES:
+                    batch.failed.append(unit)
+                else:
+                    missing.append(unit)
+        self.stats["retries"] += len(missing)
+        batch.urgent = batch.urgent or any(unit in self.priority_units for unit in batch.units)
+        now = time.monotonic()
+        for unit in missing:
+            unit.queued_at = now
+        uncached.extendleft(reversed(missing))
+        batch.ready = True
+        if self.use_cache:
+            for (idx, language), translated_text in response_dict.items():
+                if (idx, language) not in batch.unit_keys:
+                    scope = self.cache_scope(language)
+                    self.store_cached(make_cache_key(scope, batch.texts[idx]), translated_text, scope, batch.texts[idx])
+
+    def run(self, jobs):
+        """Translate every job, sharing batches, the rate limiter and the cache between them.
+
+        Cues are normalized first and identical ones across all jobs are
+        sent once, their translation being copied to every row with that
+        row's own formatting. Up to ``concurrency`` requests are kept in
+        flight while the rate limiter holds them to the configured RPM, and
+        the next job's cues are sent while the previous job's requests are
+        still out. Finished batches are applied in order, and cues a reply
+        left out are sent again in a later batch, up to ``MAX_CUE_RETRIES``
+        times before they keep their source text; streamed cues and batches
+        of prioritized rows are applied as they arrive. A request with no
+        reply for ``request_timeout`` seconds is given up on and its cues
+        sent again. While paused nothing is sent; on a cancel it returns as
+        soon as the replies already in are applied. Raises ``TranslationError``
+        when a batch cannot be completed; every row before a job's
+        ``current_row`` is done by then.
+        """
+        self.use_cache = self.cache_mode != "None" and self.translation_cache is not None
+        units = self.build_units(jobs)
+        self.stats = {
+            "rows": sum(len(unit.rows) for unit in units),
+            "unique": len(units),
+            "cached_rows": 0,
+            "fuzzy_units": 0,
+            "fuzzy_rows": 0,
+            "fuzzy_requests_saved": 0,
+            "requested_units": 0,
+            "requested_rows": 0,
+            "requests": 0,
+            "retries": 0,
+            "failed_rows": 0,
+            "requests_saved": 0
+        }
+        for job in jobs:
+            job.start()
+        self.metrics.start()
+        self.priority_units = set()
+        pending = deque(units)
+        uncached = deque()
+        batches = {}
+        in_flight = {}
+        requeued = []
+        events = queue.Queue()
+        self.events = events
+        waiting = None
+        next_seq = 0
+        next_apply = 0
+        try:
+            while True:
+                if in_flight:
+                    requeued += self.abandon_requests(in_flight, batches, uncached)
+                if self.interrupted.is_set() and waiting is not None:
+                    uncached.extendleft(reversed(batches.pop(waiting).units))
+                    waiting = None
+                if requeued and not self.interrupted.is_set():
+                    # Looked up again, as an abandoned request may have brought them back to the cache since
+                    batch = self.queue_units(requeued, uncached, urgent=True)
+                    requeued = []
+                    if batch is not None:
+                        batches[next_seq] = batch
+                        next_seq += 1
+                if self.priority_requests:
+                    wanted = self.take_priority()
+                    if wanted and waiting is not None and not batches[waiting].urgent:
+                        # The batch held back by the rate limiter goes back so the wanted rows are sent first
+                        uncached.extendleft(reversed(batches.pop(waiting).units))
+                        waiting = None
+                    batch = self.promote(wanted, pending, uncached) if wanted else None
+                    if batch is not None:
+                        batches[next_seq] = batch
+                        next_seq += 1
+                for seq in [seq for seq, batch in batches.items() if batch.urgent and batch.ready]:
+                    self.apply_batch(batches.pop(seq))
+                while next_apply < next_seq and (next_apply not in batches or batches[next_apply].ready):
+                    if next_apply in batches:
+                        self.apply_batch(batches.pop(next_apply))
+                    next_apply += 1
+                if self.is_canceled or (next_apply == next_seq and not pending and not uncached and not requeued):
+                    break
+
+                timeout = None
+                if not self.interrupted.is_set() and len(in_flight) < self.concurrency:
+                    if waiting is None:
+                        if pending and len(uncached) < LOOKAHEAD_UNITS:
+                            chunk = [pending.popleft() for _ in range(min(LOOKAHEAD_UNITS, len(pending)))]
+                            batch = self.queue_units(chunk, uncached)
+                            if batch is not None:
+                                batches[next_seq] = batch
+                                next_seq += 1
+                            continue
+                        if uncached:
+                            waiting = next_seq
+                            units = self.batcher.next_batch(uncached)
+                            batches[next_seq] = Batch(units=units, urgent=any(unit in self.priority_units for unit in units))
+                            next_seq += 1
+                    if waiting is not None:
+                        timeout, api_key = self.try_acquire()
+                        if not timeout:
+                            batch = batches[waiting]
+                            now = time.monotonic()
+                            self.metrics.observe_batch(batch.created - min(unit.queued_at for unit in batch.units),
+                                                       now - batch.created)
+                            batch.active = now
+                            batch.future = self.submit(self.request_batch, batch, events, api_key)
+                            batch.future.add_done_callback(events.put)
+                            in_flight[batch.future] = batch
+                            waiting = None
+                            self.stats["requests"] += 1
+                            self.stats["requested_units"] += len(batch.units)
+                            self.stats["requested_rows"] += sum(len(unit.rows) for unit in batch.units)
+                            continue
+
+                if in_flight:
+                    active = [batch.active for batch in in_flight.values() if batch.active is not None]
+                    if active:
+                        deadline = max(0, min(active) + self.request_timeout - time.monotonic())
+                        timeout = deadline if timeout is None else min(timeout, deadline)
+                    try:
+                        event = events.get(timeout=timeout)
+                    except queue.Empty:
+                        continue
+                    while True:
+                        if isinstance(event, tuple):
+                            batch, response_dict = event
+                            if batch.future in in_flight:
+                                self.apply_streamed(batch, response_dict)
+                        elif event in in_flight and not isinstance(event.exception(), RequestAbandoned):
+                            # Stopped requests are left to abandon_requests
+                            self.collect_batch(in_flight.pop(event), uncached)
+                        try:
+                            event = events.get_nowait()
+                        except queue.Empty:
+                            break
+                elif timeout or self.interrupted.is_set():
+                    # Woken early by prioritize, resume or cancel
+                    try:
+                        events.get(timeout=timeout)
+                    except queue.Empty:
+                        pass
+                else:
+                    break
+        finally:
+            self.events = None
+            if self.key_pool is not None:
+                self.key_pool.flush_usage()
+            if self.stats["requests"]:
+                per_request = self.stats["requested_units"] / self.stats["requests"]
+                self.stats["requests_saved"] = max(0, math.ceil(self.stats["requested_rows"] / per_request) - self.stats["requests"])
+                self.stats["fuzzy_requests_saved"] = math.ceil(self.stats["fuzzy_units"] / per_request)
+            elif self.stats["fuzzy_units"]:
+                self.stats["fuzzy_requests_saved"] = 1
+        if self.use_cache:
+            self.flush_cache()
+
+    def translate(self, texts, start_row=0, on_translated=None, on_progress=None, extra_jobs=(), on_translated_rows=None):
+        """Translate ``texts[start_row:]`` and return the list of results.
+
+        ``on_progress`` receives the number of rows done so far, counting
+        rows before ``start_row`` and empty ones. Rows before ``start_row``
+        or left untranslated by a cancel are ``None``; the row to resume
+        from is kept in ``current_row``. ``extra_jobs``, usually the same
+        texts in other target languages, run in the same pass.
+        ``on_translated_rows`` receives results a batch at a time.
+        """
+        def progress(rows_done):
+            self.current_row = job.current_row
+            if on_progress:
+                on_progress(rows_done)
+
+        job = TranslationJob(texts, start_row, on_translated=on_translated, on_progress=progress,
+                             on_translated_rows=on_translated_rows)
+        self.current_row = start_row
+        try:
+            self.run([job] + list(extra_jobs))
+        finally:
+            self.current_row = job.current_row
+        return job.results
+
+    def flush_cache(self):
+        flush = getattr(self.translation_cache, 'flush', None)
+        if flush is None:
+            return
+        try:
+            flush()
+            if self.translation_memory is not None:
+                self.translation_memory.flush()
+        except Exception as e:
+            raise TranslationError(f"Failed to save cache to file: {str(e)}")
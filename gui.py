@@ -0,0 +1,1212 @@
+import sys
+import os
+import json
+import time
+from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QPushButton, QLabel, QFileDialog, QMessageBox, 
+                             QTableView, QAbstractItemView, QHeaderView, QComboBox, QProgressBar, QDialog, 
+                             QLineEdit, QFormLayout, QHBoxLayout, QCheckBox, QPlainTextEdit)
+from PyQt5.QtGui import QFont, QIcon
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
+import storage
+from backends import BACKENDS, REQUEST_TIMEOUT, model_list
+from engine import ABANDONED_WAIT, TranslationEngine, TranslationError, TranslationJob, output_file_name
+from jobs import JobQueue
+from journal import JobJournal, file_hash
+from rate_limits import format_key_spec, parse_key_spec
+from revision import revise
+from subtitle_io import read_subtitles
+from subtitle_model import SubtitleTableModel
+from translation_cache import LRUTranslationCache, create_cache_tables, open_translation_cache
+from translation_memory import open_translation_memory
+
+LANGUAGES = ["English", "French", "German", "Spanish", "Persian", "Chinese", "Japanese"]
+FUZZY_THRESHOLDS = ["Off", "0.98", "0.95", "0.9", "0.85"]
+METRICS_INTERVAL_MS = 1000
+PRIORITY_DELAY_MS = 150
+SUBTITLE_FILTER = "Subtitle Files (*.srt *.vtt *.ass *.ssa)"
+
+def resource_path(relative_path):
+    """Get absolute path to resource, works for dev and PyInstaller"""
+    if hasattr(sys, '_MEIPASS'):
+        # PyInstaller creates a temp folder and stores path in _MEIPASS
+        return os.path.join(sys._MEIPASS, relative_path)
+    return os.path.join(os.path.abspath("."), relative_path)
+
+class SettingsDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Public Settings")
+        self.setGeometry(200, 200, 400, 420)
+        self.setStyleSheet("background-color: #2c3e50; color: white;")
+        self.setWindowIcon(QIcon(resource_path("logo.png")))
+
+        layout = QFormLayout()
+        self.rpm = '15'
+
+        self.api_key_input = QLineEdit(self)
+        self.api_key_input.setStyleSheet("background-color: #34495e; color: white; padding: 5px; border-radius: 5px;")
+        self.api_key_input.setFont(QFont("Tahoma", 10))
+        layout.addRow("API Key:", self.api_key_input)
+
+        self.api_keys_input = QPlainTextEdit(self)
+        self.api_keys_input.setStyleSheet("background-color: #34495e; color: white; padding: 5px; border-radius: 5px;")
+        self.api_keys_input.setFont(QFont("Tahoma", 10))
+        self.api_keys_input.setPlaceholderText("One per line: KEY[,RPM[,DAILY_QUOTA]]")
+        self.api_keys_input.setFixedHeight(70)
+        layout.addRow("Additional API Keys:", self.api_keys_input)
+
+        self.http_proxy_input = QLineEdit(self)
+        self.http_proxy_input.setStyleSheet("background-color: #34495e; color: white; padding: 5px; border-radius: 5px;")
+        self.http_proxy_input.setFont(QFont("Tahoma", 10))
+        layout.addRow("HTTP Proxy (e.g., http://127.0.0.1:8086):", self.http_proxy_input)
+
+        self.https_proxy_input = QLineEdit(self)
+        self.https_proxy_input.setStyleSheet("background-color: #34495e; color: white; padding: 5px; border-radius: 5px;")
+        self.https_proxy_input.setFont(QFont("Tahoma", 10))
+        layout.addRow("HTTPS Proxy (e.g., http://127.0.0.1:8086):", self.https_proxy_input)
+
+        self.openai_base_url_input = QLineEdit(self)
+        self.openai_base_url_input.setStyleSheet("background-color: #34495e; color: white; padding: 5px; border-radius: 5px;")
+        self.openai_base_url_input.setFont(QFont("Tahoma", 10))
+        layout.addRow("OpenAI-compatible Server (e.g., http://192.168.1.20:8000/v1):", self.openai_base_url_input)
+
+        self.openai_api_key_input = QLineEdit(self)
+        self.openai_api_key_input.setStyleSheet("background-color: #34495e; color: white; padding: 5px; border-radius: 5px;")
+        self.openai_api_key_input.setFont(QFont("Tahoma", 10))
+        layout.addRow("Server API Key (optional):", self.openai_api_key_input)
+
+        self.openai_proxy_input = QLineEdit(self)
+        self.openai_proxy_input.setStyleSheet("background-color: #34495e; color: white; padding: 5px; border-radius: 5px;")
+        self.openai_proxy_input.setFont(QFont("Tahoma", 10))
+        layout.addRow("Server Proxy (empty for direct):", self.openai_proxy_input)
+
+        self.openai_concurrency_input = QLineEdit(self)
+        self.openai_concurrency_input.setStyleSheet("background-color: #34495e; color: white; padding: 5px; border-radius: 5px;")
+        self.openai_concurrency_input.setFont(QFont("Tahoma", 10))
+        layout.addRow("Server Max Concurrent Requests (optional):", self.openai_concurrency_input)
+
+        self.save_button = QPushButton("Save Settings")
+        self.save_button.setFont(QFont("Tahoma", 10))
+        self.save_button.setStyleSheet("background-color: #27ae60; color: white; padding: 10px; border-radius: 8px;")
+        self.save_button.clicked.connect(self.save_settings)
+        layout.addWidget(self.save_button)
+
+        self.setLayout(layout)
+        self.load_existing_settings()
+
+    def load_existing_settings(self):
+        try:
+            conn = storage.connect()
+            cursor = conn.cursor()
+            cursor.execute("SELECT key, value FROM settings")
+            settings = dict(cursor.fetchall())
+            conn.close()
+            self.api_key_input.setText(settings.get('api_key', ''))
+            self.rpm = settings.get('rpm', '15')
+            self.api_keys_input.setPlainText("\n".join(map(format_key_spec, json.loads(settings.get('api_keys') or '[]'))))
+            proxy = json.loads(settings.get('proxy', '{}'))
+            self.http_proxy_input.setText(proxy.get('http', ''))
+            self.https_proxy_input.setText(proxy.get('https', ''))
+            self.openai_base_url_input.setText(settings.get('openai_base_url', ''))
+            self.openai_api_key_input.setText(settings.get('openai_api_key', ''))
+            self.openai_proxy_input.setText(json.loads(settings.get('openai_proxy', '{}')).get('http', ''))
+            self.openai_concurrency_input.setText(settings.get('openai_concurrency', ''))
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error loading settings: {str(e)}")
+
+    def save_settings(self):
+        openai_proxy = self.openai_proxy_input.text().strip()
+        config = {
+            "api_key": self.api_key_input.text(),
+            "proxy": json.dumps({
+                "http": self.http_proxy_input.text(),
+                "https": self.https_proxy_input.text()
+            }),
+            "openai_base_url": self.openai_base_url_input.text().strip(),
+            "openai_api_key": self.openai_api_key_input.text(),
+            "openai_proxy": json.dumps({"http": openai_proxy, "https": openai_proxy}),
+            "openai_concurrency": self.openai_concurrency_input.text().strip()
+        }
+        try:
+            if config["openai_concurrency"] and int(config["openai_concurrency"]) <= 0:
+                raise ValueError("Server max concurrent requests must be a positive number!")
+            config["api_keys"] = json.dumps([parse_key_spec(line, self.rpm)
+                                             for line in self.api_keys_input.toPlainText().splitlines() if line.strip()])
+            conn = storage.connect()
+            cursor = conn.cursor()
+            for key, value in config.items():
+                cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+            conn.commit()
+            conn.close()
+            QMessageBox.information(self, "Success", "Settings saved successfully!")
+            self.accept()
+        except ValueError as e:
+            QMessageBox.warning(self, "Error", str(e))
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error saving settings: {str(e)}")
+
+class AdvancedSettingsDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Advanced Settings")
+        self.setGeometry(200, 200, 400, 400)
+        self.setStyleSheet("background-color: #2c3e50; color: white;")
+        if os.path.exists(resource_path("logo.png")):
+            self.setWindowIcon(QIcon(resource_path("logo.png")))
+
+        layout = QFormLayout()
+
+        self.rpm_input = QLineEdit(self)
+        self.rpm_input.setStyleSheet("background-color: #34495e; color: white; padding: 5px; border-radius: 5px;")
+        self.rpm_input.setFont(QFont("Tahoma", 10))
+        self.rpm_input.setText("15")
+        layout.addRow("Requests per Minute (RPM):", self.rpm_input)
+
+        self.concurrency_input = QLineEdit(self)
+        self.concurrency_input.setStyleSheet("background-color: #34495e; color: white; padding: 5px; border-radius: 5px;")
+        self.concurrency_input.setFont(QFont("Tahoma", 10))
+        self.concurrency_input.setText("3")
+        layout.addRow("Concurrent Requests:", self.concurrency_input)
+
+        self.timeout_input = QLineEdit(self)
+        self.timeout_input.setStyleSheet("background-color: #34495e; color: white; padding: 5px; border-radius: 5px;")
+        self.timeout_input.setFont(QFont("Tahoma", 10))
+        self.timeout_input.setText(str(REQUEST_TIMEOUT))
+        layout.addRow("Request Timeout (seconds):", self.timeout_input)
+
+        self.backend_combo = QComboBox(self)
+        self.backend_combo.setStyleSheet("background-color: #34495e; color: white; padding: 6px; border-radius: 5px;")
+        self.backend_combo.setFont(QFont("Tahoma", 10))
+        self.backend_combo.addItems([name for name in BACKENDS if name != "Mock"])
+        layout.addRow("Backend:", self.backend_combo)
+
+        self.model_combo = QComboBox(self)
+        self.model_combo.setStyleSheet("background-color: #34495e; color: white; padding: 6px; border-radius: 5px;")
+        self.model_combo.setFont(QFont("Tahoma", 10))
+        self.model_combo.setEditable(True)
+        layout.addRow("Model:", self.model_combo)
+        self.settings = {}
+        self.backend_combo.currentTextChanged.connect(self.load_models)
+
+        self.cache_combo = QComboBox(self)
+        self.cache_combo.setStyleSheet("background-color: #34495e; color: white; padding: 6px; border-radius: 5px;")
+        self.cache_combo.setFont(QFont("Tahoma", 10))
+        self.cache_combo.addItems(["RAM", "File", "None"])
+        self.cache_combo.setCurrentText("RAM")
+        layout.addRow("Translation Cache:", self.cache_combo)
+
+        self.cache_budget_input = QLineEdit(self)
+        self.cache_budget_input.setStyleSheet("background-color: #34495e; color: white; padding: 5px; border-radius: 5px;")
+        self.cache_budget_input.setFont(QFont("Tahoma", 10))
+        self.cache_budget_input.setText("64")
+        layout.addRow("Cache Memory Budget (MB):", self.cache_budget_input)
+
+        self.cache_stats_label = QLabel(self.cache_stats_text(parent), self)
+        self.cache_stats_label.setFont(QFont("Tahoma", 9))
+        layout.addRow("Cache Usage:", self.cache_stats_label)
+
+        self.fuzzy_combo = QComboBox(self)
+        self.fuzzy_combo.setStyleSheet("background-color: #34495e; color: white; padding: 6px; border-radius: 5px;")
+        self.fuzzy_combo.setFont(QFont("Tahoma", 10))
+        self.fuzzy_combo.addItems(FUZZY_THRESHOLDS)
+        self.fuzzy_combo.setCurrentText("Off")
+        layout.addRow("Reuse Near-Duplicates (Similarity):", self.fuzzy_combo)
+
+        self.batch_size_combo = QComboBox(self)
+        self.batch_size_combo.setStyleSheet("background-color: #34495e; color: white; padding: 6px; border-radius: 5px;")
+        self.batch_size_combo.setFont(QFont("Tahoma", 10))
+        self.batch_size_combo.addItems(["Auto", "1", "5", "10", "20", "30"])
+        self.batch_size_combo.setCurrentText("Auto")
+        layout.addRow("Translations per Request:", self.batch_size_combo)
+
+        self.streaming_combo = QComboBox(self)
+        self.streaming_combo.setStyleSheet("background-color: #34495e; color: white; padding: 6px; border-radius: 5px;")
+        self.streaming_combo.setFont(QFont("Tahoma", 10))
+        self.streaming_combo.addItems(["On", "Off"])
+        self.streaming_combo.setCurrentText("On")
+        layout.addRow("Show Lines as They Stream:", self.streaming_combo)
+
+        self.save_button = QPushButton("Save Advanced Settings")
+        self.save_button.setFont(QFont("Tahoma", 10))
+        self.save_button.setStyleSheet("background-color: #27ae60; color: white; padding: 10px; border-radius: 8px;")
+        self.save_button.clicked.connect(self.save_settings)
+        layout.addWidget(self.save_button)
+
+        self.setLayout(layout)
+        self.load_existing_settings()
+
+    def load_existing_settings(self):
+        try:
+            conn = storage.connect()
+            cursor = conn.cursor()
+            cursor.execute("SELECT key, value FROM settings")
+            settings = dict(cursor.fetchall())
+            conn.close()
+            self.settings = settings
+            self.rpm_input.setText(settings.get('rpm', '15'))
+            self.concurrency_input.setText(settings.get('concurrency', '3'))
+            self.timeout_input.setText(settings.get('request_timeout', str(REQUEST_TIMEOUT)))
+            backend = settings.get('backend', 'Gemini')
+            if backend in [self.backend_combo.itemText(i) for i in range(self.backend_combo.count())]:
+                self.backend_combo.setCurrentText(backend)
+            self.load_models(self.backend_combo.currentText())
+            model = settings.get('model')
+            if model:
+                self.model_combo.setCurrentText(model)
+            cache_mode = settings.get('cache_mode', 'RAM')
+            if cache_mode in ["RAM", "File", "None"]:
+                self.cache_combo.setCurrentText(cache_mode)
+            self.cache_budget_input.setText(settings.get('cache_budget_mb', '64'))
+            batch_size = settings.get('batch_size', 'Auto')
+            if batch_size in ["Auto", "1", "5", "10", "20", "30"]:
+                self.batch_size_combo.setCurrentText(batch_size)
+            streaming = settings.get('streaming', 'On')
+            if streaming in ["On", "Off"]:
+                self.streaming_combo.setCurrentText(streaming)
+            fuzzy_threshold = settings.get('fuzzy_threshold', 'Off')
+            if fuzzy_threshold in FUZZY_THRESHOLDS:
+                self.fuzzy_combo.setCurrentText(fuzzy_threshold)
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error loading advanced settings: {str(e)}")
+
+    def load_models(self, backend):
+        self.model_combo.clear()
+        self.model_combo.addItems(model_list(self.settings, backend))
+
+    def save_settings(self):
+        try:
+            rpm = int(self.rpm_input.text())
+            if rpm <= 0:
+                raise ValueError("RPM must be a positive number!")
+            concurrency = int(self.concurrency_input.text())
+            if concurrency <= 0:
+                raise ValueError("Concurrent requests must be a positive number!")
+            request_timeout = int(self.timeout_input.text())
+            if request_timeout <= 0:
+                raise ValueError("Request timeout must be a positive number of seconds!")
+            cache_budget = float(self.cache_budget_input.text())
+            if cache_budget <= 0:
+                raise ValueError("Cache memory budget must be a positive number!")
+            backend = self.backend_combo.currentText()
+            model = self.model_combo.currentText().strip()
+            if not model:
+                raise ValueError("Enter a model name!")
+            models = model_list(self.settings, backend)
+            if model not in models:
+                models.append(model)
+            config = {
+                "rpm": str(rpm),
+                "concurrency": str(concurrency),
+                "request_timeout": str(request_timeout),
+                "backend": backend,
+                "model": model,
+                f"{backend.lower()}_models": json.dumps(models),
+                "cache_mode": self.cache_combo.currentText(),
+                "cache_budget_mb": self.cache_budget_input.text(),
+                "batch_size": self.batch_size_combo.currentText(),
+                "streaming": self.streaming_combo.currentText(),
+                "fuzzy_threshold": self.fuzzy_combo.currentText()
+            }
+            conn = storage.connect()
+            cursor = conn.cursor()
+            for key, value in config.items():
+                cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+            conn.commit()
+            conn.close()
+            if self.cache_combo.currentText() == "File":
+                self.ensure_cache_table_exists()
+            QMessageBox.information(self, "Success", "Advanced settings saved successfully!")
+            self.accept()
+        except ValueError as e:
+            QMessageBox.warning(self, "Error", str(e))
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error saving advanced settings: {str(e)}")
+
+    @staticmethod
+    def cache_stats_text(parent):
+        cache = getattr(parent, 'translation_cache', None)
+        if not hasattr(cache, 'stats'):
+            return "Cache disabled"
+        stats = cache.stats()
+        return (f"{stats['entries']} entries, {stats['size_bytes'] / 1048576:.1f}/{stats['budget_bytes'] / 1048576:.0f} MB\n"
+                f"Hits: {stats['hits']}  Misses: {stats['misses']}  Evictions: {stats['evictions']}  "
+                f"Hit rate: {stats['hit_rate']:.0%}")
+
+    def ensure_cache_table_exists(self):
+        conn = storage.connect()
+        create_cache_tables(conn)
+        conn.commit()
+        conn.close()
+
+class TranslationWorker(QThread):
+    progress = pyqtSignal(int)
+    finished = pyqtSignal()
+    translated = pyqtSignal(list)
+    error = pyqtSignal(str)
+    canceled = pyqtSignal()
+
+    def __init__(self, texts, target_languages, start_row=0, config=None, translation_cache=None, extra_jobs=None, results=None,
+                 translation_memory=None):
+        super().__init__()
+        self.texts = list(texts)
+        self.start_row = start_row
+        self.current_row = start_row
+        self.engine = TranslationEngine(target_languages, config=config, translation_cache=translation_cache,
+                                        translation_memory=translation_memory)
+        self.job = TranslationJob(self.texts, start_row, target_language=self.engine.target_language,
+                                  on_translated_rows=self.translated.emit, on_progress=self.on_progress)
+        if results is not None:
+            self.job.results = list(results)
+        # The table shows the first language; the others are kept here and carry over to a resume
+        previous_jobs = {job.target_language: job for job in extra_jobs or []}
+        self.extra_jobs = []
+        for language in self.engine.target_languages[1:]:
+            previous = previous_jobs.get(language)
+            job = TranslationJob(self.texts, previous.current_row if previous else 0, target_language=language)
+            if previous:
+                job.results = previous.results
+            self.extra_jobs.append(job)
+
+    @property
+    def jobs(self):
+        return [self.job] + self.extra_jobs
+
+    def run(self):
+        try:
+            self.engine.run(self.jobs)
+            if self.engine.is_canceled:
+                self.canceled.emit()
+            else:
+                self.finished.emit()
+        except TranslationError as e:
+            self.error.emit(str(e))
+            self.canceled.emit()
+        except Exception as e:
+            self.error.emit(f"Error during translation: {str(e)}")
+
+    def on_progress(self, rows_done):
+        self.current_row = self.job.current_row
+        self.progress.emit(rows_done)
+
+    def cancel(self):
+        self.engine.cancel()
+
+    def pause(self):
+        self.engine.pause()
+
+    def resume(self):
+        self.engine.resume()
+
+class BatchTranslationWorker(QThread):
+    progress = pyqtSignal(int, int)
+    file_progress = pyqtSignal(str, int, int)
+    file_finished = pyqtSignal(str)
+    finished = pyqtSignal()
+    error = pyqtSignal(str)
+    canceled = pyqtSignal()
+
+    def __init__(self, paths, target_languages, output_dir=None, config=None, translation_cache=None, translation_memory=None):
+        super().__init__()
+        self.engine = TranslationEngine(target_languages, config=config, translation_cache=translation_cache,
+                                        translation_memory=translation_memory)
+        self.queue = JobQueue(self.engine, output_dir)
+        self.queue.add(paths)
+
+    def run(self):
+        try:
+            self.queue.run(on_progress=self.progress.emit, on_file_progress=self.on_file_progress,
+                           on_file_finished=lambda job: self.file_finished.emit(job.output_path))
+            if self.engine.is_canceled:
+                self.canceled.emit()
+            else:
+                self.finished.emit()
+        except TranslationError as e:
+            self.error.emit(str(e))
+            self.canceled.emit()
+        except Exception as e:
+            self.error.emit(f"Error during translation: {str(e)}")
+
+    def on_file_progress(self, job, rows_done, total_rows):
+        self.file_progress.emit(os.path.basename(job.name), rows_done, total_rows)
+
+    def cancel(self):
+        self.engine.cancel()
+
+    def pause(self):
+        self.engine.pause()
+
+    def resume(self):
+        self.engine.resume()
+
+class SubtitleTranslatorApp(QWidget):
+    def __init__(self):
+        super().__init__()
+        self.worker = None
+        self.batch_worker = None
+        self.last_processed_row = 0
+        self.extra_jobs = []
+        self.revision_results = None
+        self.config = dict(storage.DEFAULT_CONFIG)
+        self.translation_cache = None
+        self.translation_memory = None
+        self.journal = None
+        self.settings_pending = False
+        # Engines of ended runs whose given-up requests may still bring replies for the cache
+        self.retired_engines = []
+        self.initUI()
+        self.original_file_name = ""
+        self.original_file_path = ""
+        self.source_hash = None
+
+    def finish_startup(self):
+        """Open the database, cache, translation memory and journal once the window is up, then offer to resume."""
+        self.initialize_db()
+        self.config = self.load_config()
+        self.translation_cache = self.load_translation_cache()
+        self.translation_memory = self.load_translation_memory()
+        self.journal = self.open_journal()
+        self.offer_resume()
+
+    def load_config(self):
+        try:
+            return storage.load_config()
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error loading configuration: {str(e)}")
+            return dict(storage.DEFAULT_CONFIG)
+
+    def load_translation_cache(self):
+        cache_mode = self.config.get('cache_mode', 'RAM')
+        try:
+            return open_translation_cache(self.config)
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error loading cache from file: {str(e)}")
+        return LRUTranslationCache() if cache_mode in ("RAM", "File") else None
+
+    def open_journal(self):
+        try:
+            return JobJournal()
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error opening the job journal: {str(e)}")
+            return None
+
+    def journal_worker(self, worker, resume):
+        """Record the worker's progress in the journal, restoring rows an unfinished run of the file left if ``resume``."""
+        if not self.journal:
+            return
+        try:
+            for job in worker.jobs:
+                self.journal.open_job(job, self.original_file_path, worker.engine.backend.model, resume, self.source_hash)
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error recording translation progress: {str(e)}")
+            return
+        self.table_model.set_translations([(row, text) for row, text in enumerate(worker.job.results)
+                                           if text is not None and not self.table_model.translations[row]])
+
+    def offer_resume(self):
+        """Offer to finish a translation that an earlier session left unfinished."""
+        if not self.journal:
+            return
+        try:
+            entries = [entry for entry in self.journal.unfinished() if entry.target_language in LANGUAGES]
+            if not entries:
+                return
+            latest = entries[0]
+            entries = [entry for entry in entries
+                       if entry.source_path == latest.source_path and entry.source_hash == latest.source_hash]
+            languages = ", ".join(entry.target_language for entry in entries)
+            reply = QMessageBox.question(self, "Resume Translation",
+                                         f"The translation of {os.path.basename(latest.source_path)} into {languages} "
+                                         f"was not finished ({latest.done_rows}/{latest.total_rows} lines done).\n"
+                                         "Resume it?", QMessageBox.Yes | QMessageBox.No)
+            if reply == QMessageBox.Yes and (not os.path.isfile(latest.source_path)
+                                             or file_hash(latest.source_path) != latest.source_hash):
+                QMessageBox.warning(self, "Error", f"{latest.source_path} is missing or has changed since; "
+                                                   "its translation cannot be resumed.")
+                reply = QMessageBox.No
+            if reply != QMessageBox.Yes:
+                for entry in entries:
+                    self.journal.delete(entry.job_id)
+                return
+            if not self.load_subtitle_file(latest.source_path):
+                return
+            self.language_combo.setCurrentText(latest.target_language)
+            for language, check in self.extra_language_checks.items():
+                check.setChecked(any(entry.target_language == language for entry in entries[1:]))
+            total_rows = self.table_model.rowCount()
+            self.table_model.set_translations([(row, text) for row, text in
+                                               enumerate(self.journal.results(latest.job_id, total_rows)) if text is not None])
+            self.extra_jobs = []
+            for entry in entries[1:]:
+                job = TranslationJob(self.table_model.originals, target_language=entry.target_language)
+                job.results = self.journal.results(entry.job_id, total_rows)
+                self.extra_jobs.append(job)
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error reading the job journal: {str(e)}")
+            return
+        self.resume_translation()
+
+    def load_translation_memory(self):
+        try:
+            return open_translation_memory(self.config)
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error opening the translation memory: {str(e)}")
+            return None
+
+    def close_translation_memory(self):
+        if self.translation_memory is not None:
+            try:
+                self.translation_memory.close()
+            except Exception as e:
+                QMessageBox.warning(self, "Error", f"Error saving the translation memory: {str(e)}")
+
+    def save_translation_cache(self):
+        if self.config.get('cache_mode', 'RAM') == "File" and hasattr(self.translation_cache, 'flush'):
+            try:
+                self.translation_cache.flush()
+            except Exception as e:
+                QMessageBox.warning(self, "Error", f"Error saving cache to file: {str(e)}")
+
+    def close_translation_cache(self):
+        self.save_translation_cache()
+        if hasattr(self.translation_cache, 'close'):
+            try:
+                self.translation_cache.close()
+            except Exception as e:
+                QMessageBox.warning(self, "Error", f"Error closing the cache file: {str(e)}")
+
+    def clear_cache(self):
+        if self.config.get('cache_mode', 'RAM') == "File":
+            try:
+                self.translation_cache.clear()
+                if self.translation_memory is not None:
+                    self.translation_memory.clear()
+                QMessageBox.information(self, "Success", "Translation cache cleared successfully!")
+            except Exception as e:
+                QMessageBox.warning(self, "Error", f"Error clearing cache: {str(e)}")
+
+    def initUI(self):
+        self.setWindowTitle("Subtitle Translator")
+        self.setGeometry(0, 0, 800, 550)
+        self.setStyleSheet("background-color: #2c3e50; color: white;")
+        if os.path.exists(resource_path("logo.png")):
+            self.setWindowIcon(QIcon(resource_path("logo.png")))
+
+        screen = QApplication.primaryScreen().geometry()
+        self.move((screen.width() - self.width()) // 2, (screen.height() - self.height()) // 2)
+
+        menu_layout = QHBoxLayout()
+        menu_layout.addStretch()
+
+        self.settings_button = QPushButton("Public Settings")
+        self.settings_button.setFont(QFont("Tahoma", 10))
+        self.settings_button.setStyleSheet("background-color: #34495e; color: white; padding: 5px; border-radius: 5px;")
+        self.settings_button.clicked.connect(self.open_settings_dialog)
+        menu_layout.addWidget(self.settings_button)
+
+        self.advanced_settings_button = QPushButton("Advanced Settings")
+        self.advanced_settings_button.setFont(QFont("Tahoma", 10))
+        self.advanced_settings_button.setStyleSheet("background-color: #34495e; color: white; padding: 5px; border-radius: 5px;")
+        self.advanced_settings_button.clicked.connect(self.open_advanced_settings_dialog)
+        menu_layout.addWidget(self.advanced_settings_button)
+
+        self.clear_cache_button = QPushButton("Clear Cache")
+        self.clear_cache_button.setFont(QFont("Tahoma", 10))
+        self.clear_cache_button.setStyleSheet("background-color: #34495e; color: white; padding: 5px; border-radius: 5px;")
+        self.clear_cache_button.clicked.connect(self.clear_cache)
+        menu_layout.addWidget(self.clear_cache_button)
+
+        main_layout = QVBoxLayout()
+        main_layout.addLayout(menu_layout)
+
+        self.label = QLabel("Select a subtitle file (SRT):")
+        self.label.setFont(QFont("Tahoma", 12))
+        main_layout.addWidget(self.label)
+
+        self.btn_select = QPushButton("Choose File")
+        self.btn_select.setFont(QFont("Tahoma", 10))
+        self.btn_select.setStyleSheet("background-color: #2980b9; color: white; padding: 12px; border-radius: 8px;")
+        self.btn_select.clicked.connect(self.select_file)
+        main_layout.addWidget(self.btn_select)
+
+        batch_layout = QHBoxLayout()
+        self.btn_batch_files = QPushButton("Translate Files...")
+        self.btn_batch_files.setFont(QFont("Tahoma", 10))
+        self.btn_batch_files.setStyleSheet("background-color: #34495e; color: white; padding: 8px; border-radius: 8px;")
+        self.btn_batch_files.clicked.connect(self.select_batch_files)
+        batch_layout.addWidget(self.btn_batch_files)
+
+        self.btn_batch_folder = QPushButton("Translate Folder...")
+        self.btn_batch_folder.setFont(QFont("Tahoma", 10))
+        self.btn_batch_folder.setStyleSheet("background-color: #34495e; color: white; padding: 8px; border-radius: 8px;")
+        self.btn_batch_folder.clicked.connect(self.select_batch_folder)
+        batch_layout.addWidget(self.btn_batch_folder)
+        main_layout.addLayout(batch_layout)
+
+        self.language_label = QLabel("Select Target Language:")
+        self.language_label.setFont(QFont("Tahoma", 12))
+        main_layout.addWidget(self.language_label)
+
+        self.language_combo = QComboBox()
+        self.language_combo.setFont(QFont("Tahoma", 10))
+        self.language_combo.setStyleSheet("background-color: #34495e; color: white; padding: 6px; border-radius: 5px;")
+        self.language_combo.addItems(LANGUAGES)
+        main_layout.addWidget(self.language_combo)
+
+        extra_languages_layout = QHBoxLayout()
+        self.extra_languages_label = QLabel("Also translate to:")
+        self.extra_languages_label.setFont(QFont("Tahoma", 10))
+        extra_languages_layout.addWidget(self.extra_languages_label)
+        self.extra_language_checks = {}
+        for language in LANGUAGES:
+            check = QCheckBox(language)
+            check.setFont(QFont("Tahoma", 10))
+            self.extra_language_checks[language] = check
+            extra_languages_layout.addWidget(check)
+        extra_languages_layout.addStretch()
+        main_layout.addLayout(extra_languages_layout)
+
+        self.file_name_label = QLabel("No file selected")
+        self.file_name_label.setFont(QFont("Tahoma", 10))
+        self.file_name_label.setStyleSheet("color: #ecf0f1;")
+        main_layout.addWidget(self.file_name_label)
+
+        self.table_model = SubtitleTableModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.table_model)
+        self.table.setStyleSheet("background-color: #ecf0f1; color: black; border: 1px solid #ccc; padding: 0px;")
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.horizontalHeader().setDefaultSectionSize(220)
+        self.table.verticalHeader().setDefaultSectionSize(45)
+        self.table.setEditTriggers(QAbstractItemView.AllEditTriggers)
+        self.table.setFont(QFont("Tahoma", 10))
+        main_layout.addWidget(self.table)
+        # Rows scrolled to or selected during a translation are translated next
+        self.priority_timer = QTimer(self)
+        self.priority_timer.setSingleShot(True)
+        self.priority_timer.setInterval(PRIORITY_DELAY_MS)
+        self.priority_timer.timeout.connect(self.prioritize_visible_rows)
+        self.table.verticalScrollBar().valueChanged.connect(lambda _: self.priority_timer.start())
+        self.table.selectionModel().selectionChanged.connect(lambda *_: self.priority_timer.start())
+
+        self.btn_revise = QPushButton("Keep Previous Translation...")
+        self.btn_revise.setFont(QFont("Tahoma", 10))
+        self.btn_revise.setStyleSheet("background-color: #34495e; color: white; padding: 8px; border-radius: 8px;")
+        self.btn_revise.clicked.connect(self.revise_subtitle_file)
+        main_layout.addWidget(self.btn_revise)
+
+        self.btn_translate = QPushButton("Start Translate")
+        self.btn_translate.setFont(QFont("Tahoma", 10))
+        self.btn_translate.setStyleSheet("background-color: #27ae60; color: white; padding: 12px; border-radius: 8px;")
+        self.btn_translate.clicked.connect(self.translate_subtitle)
+        main_layout.addWidget(self.btn_translate)
+
+        self.progress_layout = QHBoxLayout()
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.setFont(QFont("Tahoma", 10))
+        self.progress_bar.setVisible(False)
+        self.progress_bar.setTextVisible(True)
+        self.progress_layout.addWidget(self.progress_bar)
+
+        self.btn_stop = QPushButton("Stop")
+        self.btn_stop.setFont(QFont("Tahoma", 10))
+        self.btn_stop.setStyleSheet("background-color: #e74c3c; color: white; padding: 10px; border-radius: 8px;")
+        self.btn_stop.clicked.connect(self.stop_translation)
+        self.btn_stop.setVisible(False)
+        self.progress_layout.addWidget(self.btn_stop)
+
+        self.btn_pause = QPushButton("Pause")
+        self.btn_pause.setFont(QFont("Tahoma", 10))
+        self.btn_pause.setStyleSheet("background-color: #f39c12; color: white; padding: 10px; border-radius: 8px;")
+        self.btn_pause.clicked.connect(self.toggle_pause)
+        self.btn_pause.setVisible(False)
+        self.progress_layout.addWidget(self.btn_pause)
+
+        self.btn_resume = QPushButton("Resume")
+        self.btn_resume.setFont(QFont("Tahoma", 10))
+        self.btn_resume.setStyleSheet("background-color: #27ae60; color: white; padding: 10px; border-radius: 8px;")
+        self.btn_resume.clicked.connect(self.resume_translation)
+        self.btn_resume.setVisible(False)
+        self.progress_layout.addWidget(self.btn_resume)
+
+        self.btn_save_partial = QPushButton("Save")
+        self.btn_save_partial.setFont(QFont("Tahoma", 10))
+        self.btn_save_partial.setStyleSheet("background-color: #2980b9; color: white; padding: 10px; border-radius: 8px;")
+        self.btn_save_partial.clicked.connect(self.save_translated_file)
+        self.btn_save_partial.setVisible(False)
+        self.progress_layout.addWidget(self.btn_save_partial)
+
+        main_layout.addLayout(self.progress_layout)
+
+        self.metrics_label = QLabel()
+        self.metrics_label.setFont(QFont("Tahoma", 9))
+        self.metrics_label.setStyleSheet("color: #bdc3c7;")
+        self.metrics_label.setVisible(False)
+        main_layout.addWidget(self.metrics_label)
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(lambda: self.show_metrics(self.worker or self.batch_worker))
+        self.metrics_timer.start(METRICS_INTERVAL_MS)
+
+        self.setLayout(main_layout)
+
+    def selected_languages(self):
+        """The target language followed by the other checked languages."""
+        target_language = self.language_combo.currentText()
+        return [target_language] + [language for language, check in self.extra_language_checks.items()
+                                    if check.isChecked() and language != target_language]
+
+    def reset_translation_state(self):
+        if self.worker and self.worker.isRunning():
+            self.worker.cancel()
+            self.worker.wait()
+        self.retire_engine(self.worker)
+        self.worker = None
+        self.extra_jobs = []
+        self.progress_bar.setValue(self.last_processed_row)
+        self.progress_bar.setVisible(False)
+        self.btn_stop.setVisible(False)
+        self.set_pause_visible(False)
+        self.btn_resume.setVisible(False)
+        self.btn_save_partial.setVisible(False)
+        self.btn_translate.setEnabled(True)
+        self.btn_translate.setStyleSheet("background-color: #27ae60; color: white; padding: 12px; border-radius: 8px;")
+
+    def open_settings_dialog(self):
+        dialog = SettingsDialog(self)
+        dialog.exec_()
+        self.reload_settings()
+
+    def open_advanced_settings_dialog(self):
+        dialog = AdvancedSettingsDialog(self)
+        dialog.exec_()
+        self.reload_settings()
+
+    def reload_settings(self):
+        """Load the saved settings and reopen the cache and memory they select.
+
+        A running translation still uses the old ones, so then this waits
+        until it ends (see ``apply_pending_settings``).
+        """
+        if (self.worker and self.worker.isRunning()) or self.batch_worker:
+            self.settings_pending = True
+            return
+        self.settings_pending = False
+        self.close_retired_engines()
+        self.close_translation_cache()
+        self.close_translation_memory()
+        self.config = self.load_config()
+        self.translation_cache = self.load_translation_cache()
+        self.translation_memory = self.load_translation_memory()
+
+    def retire_engine(self, worker):
+        """Keep an ended worker's engine until the cache is closed, so that replies to requests it gave up on still
+        reach the cache; engines with none left are closed."""
+        if worker:
+            self.retired_engines.append(worker.engine)
+        for engine in [engine for engine in self.retired_engines if not engine.abandoned]:
+            engine.close(0)
+            self.retired_engines.remove(engine)
+
+    def close_retired_engines(self):
+        deadline = time.monotonic() + ABANDONED_WAIT
+        for engine in self.retired_engines:
+            engine.close(max(0, deadline - time.monotonic()))
+        self.retired_engines = []
+
+    def apply_pending_settings(self):
+        if self.settings_pending:
+            self.reload_settings()
+
+    def select_file(self):
+        self.reset_translation_state()
+        options = QFileDialog.Options()
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select Subtitle File", "", SUBTITLE_FILTER, options=options)
+        if file_path:
+            self.load_subtitle_file(file_path)
+
+    def load_subtitle_file(self, file_path):
+        try:
+            self.original_file_name = os.path.basename(file_path)
+            self.original_file_path = file_path
+            document = read_subtitles(file_path)
+            if not document:
+                raise ValueError("Empty or invalid subtitle file")
+            self.source_hash = file_hash(file_path)
+            self.table_model.load(document)
+            self.file_name_label.setText(f"Current file: {os.path.basename(file_path)}")
+            self.last_processed_row = 0
+            self.revision_results = None
+            self.progress_bar.setMaximum(len(document))
+            return True
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error loading subtitle file: {str(e)}")
+            self.file_name_label.setText("No file selected")
+            return False
+
+    def translate_subtitle(self):
+        if (self.worker and self.worker.isRunning()) or self.batch_worker:
+            return
+
+        target_languages = self.selected_languages()
+        total_rows = self.table_model.rowCount()
+        
+        if total_rows == 0:
+            QMessageBox.warning(self, "Error", "No subtitles selected for translation!")
+            return
+        try:
+            worker = TranslationWorker(self.table_model.originals, target_languages, 0, config=self.config,
+                                       translation_cache=self.translation_cache, results=self.revision_results,
+                                       translation_memory=self.translation_memory)
+        except TranslationError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+        self.journal_worker(worker, resume=False)
+
+        self.progress_bar.setMaximum(total_rows)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setFormat(f"Translating: %v/{total_rows}")
+        self.btn_stop.setVisible(True)
+        self.set_pause_visible(True)
+        self.btn_resume.setVisible(False)
+        self.btn_save_partial.setVisible(False)
+        self.btn_translate.setEnabled(False)
+        self.btn_translate.setStyleSheet("background-color: #7f8c8d; color: white; padding: 12px; border-radius: 8px;")
+
+        self.worker = worker
+        self.worker.progress.connect(self.update_progress)
+        self.worker.translated.connect(self.update_translations)
+        self.worker.finished.connect(self.on_translation_finished)
+        self.worker.error.connect(self.on_translation_error)
+        self.worker.canceled.connect(self.on_translation_canceled)
+        self.worker.start()
+        self.prioritize_visible_rows()
+
+    def revise_subtitle_file(self):
+        """Fill the Translated column from an earlier version of the loaded file and its translation."""
+        if (self.worker and self.worker.isRunning()) or self.batch_worker:
+            return
+        if self.table_model.rowCount() == 0:
+            QMessageBox.warning(self, "Error", "Load the revised subtitle file first!")
+            return
+        previous_path, _ = QFileDialog.getOpenFileName(self, "Select the Previous Version of This File", "", SUBTITLE_FILTER)
+        if not previous_path:
+            return
+        translation_path, _ = QFileDialog.getOpenFileName(self, "Select the Translation of the Previous Version",
+                                                          os.path.dirname(previous_path), SUBTITLE_FILTER)
+        if not translation_path:
+            return
+        try:
+            revision = revise(self.table_model.document, read_subtitles(previous_path), read_subtitles(translation_path))
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error loading the previous version: {str(e)}")
+            return
+        self.table_model.flush_translations()
+        self.table_model.set_translations([(row, text or "") for row, text in enumerate(revision.results)])
+        self.revision_results = revision.results
+        QMessageBox.information(self, "Previous Translation", f"{revision.summary()} Start Translate to translate the rest.")
+
+    def resume_translation(self):
+        if (self.worker and self.worker.isRunning()) or self.batch_worker:
+            return
+
+        target_languages = self.selected_languages()
+        total_rows = self.table_model.rowCount()
+        self.table_model.flush_translations()
+        try:
+            # Rows already in the Translated column, edited ones included, are kept and not requested again
+            worker = TranslationWorker(self.table_model.originals, target_languages, self.last_processed_row, config=self.config,
+                                       translation_cache=self.translation_cache, extra_jobs=self.extra_jobs,
+                                       results=[text or None for text in self.table_model.translations],
+                                       translation_memory=self.translation_memory)
+        except TranslationError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+        self.journal_worker(worker, resume=True)
+
+        self.progress_bar.setMaximum(total_rows)
+        self.progress_bar.setValue(self.last_processed_row)
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setFormat(f"Translating: %v/{total_rows}")
+        self.btn_stop.setVisible(True)
+        self.set_pause_visible(True)
+        self.btn_resume.setVisible(False)
+        self.btn_save_partial.setVisible(True)
+        self.btn_translate.setEnabled(False)
+        self.btn_translate.setStyleSheet("background-color: #7f8c8d; color: white; padding: 12px; border-radius: 8px;")
+
+        self.worker = worker
+        self.worker.progress.connect(self.update_progress)
+        self.worker.translated.connect(self.update_translations)
+        self.worker.finished.connect(self.on_translation_finished)
+        self.worker.error.connect(self.on_translation_error)
+        self.worker.canceled.connect(self.on_translation_canceled)
+        self.worker.start()
+        self.prioritize_visible_rows()
+
+    def prioritize_visible_rows(self):
+        """Have the running translation do the rows on screen and the selected ones before the rest."""
+        if not (self.worker and self.worker.isRunning()):
+            return
+        first_row = self.table.rowAt(0)
+        if first_row < 0:
+            return
+        last_row = self.table.rowAt(self.table.viewport().height() - 1)
+        if last_row < 0:
+            last_row = self.table_model.rowCount() - 1
+        selected_rows = sorted({index.row() for index in self.table.selectionModel().selectedIndexes()})
+        self.worker.engine.prioritize(list(range(first_row, last_row + 1)) + selected_rows)
+
+    def select_batch_files(self):
+        file_paths, _ = QFileDialog.getOpenFileNames(self, "Select Subtitle Files", "", SUBTITLE_FILTER)
+        if file_paths:
+            self.start_batch_translation(file_paths)
+
+    def select_batch_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Select Folder of Subtitles")
+        if folder:
+            self.start_batch_translation([folder])
+
+    def start_batch_translation(self, paths):
+        if (self.worker and self.worker.isRunning()) or (self.batch_worker and self.batch_worker.isRunning()):
+            return
+        source_dir = paths[0] if os.path.isdir(paths[0]) else os.path.dirname(paths[0])
+        output_dir = QFileDialog.getExistingDirectory(self, "Select Output Folder", source_dir) or None
+        try:
+            self.batch_worker = BatchTranslationWorker(paths, self.selected_languages(), output_dir,
+                                                       config=self.config, translation_cache=self.translation_cache,
+                                                       translation_memory=self.translation_memory)
+        except TranslationError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+        if not self.batch_worker.queue.paths:
+            QMessageBox.warning(self, "Error", "No subtitle files found!")
+            self.retire_engine(self.batch_worker)
+            self.batch_worker = None
+            return
+
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.btn_stop.setVisible(True)
+        self.set_pause_visible(True)
+        self.btn_resume.setVisible(False)
+        self.btn_save_partial.setVisible(False)
+        self.set_batch_controls_enabled(False)
+        self.file_name_label.setText(f"Translating {len(self.batch_worker.queue.paths)} files...")
+
+        self.batch_worker.progress.connect(self.update_batch_progress)
+        self.batch_worker.file_progress.connect(self.update_batch_file_progress)
+        self.batch_worker.finished.connect(self.on_batch_finished)
+        self.batch_worker.error.connect(self.on_batch_error)
+        self.batch_worker.canceled.connect(self.on_batch_canceled)
+        self.batch_worker.start()
+
+    def set_batch_controls_enabled(self, enabled):
+        self.btn_translate.setEnabled(enabled)
+        self.btn_select.setEnabled(enabled)
+        self.btn_batch_files.setEnabled(enabled)
+        self.btn_batch_folder.setEnabled(enabled)
+        color = "#27ae60" if enabled else "#7f8c8d"
+        self.btn_translate.setStyleSheet(f"background-color: {color}; color: white; padding: 12px; border-radius: 8px;")
+
+    def update_batch_progress(self, done, total):
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setFormat(f"Translating: %v/{total}")
+        self.progress_bar.setValue(done)
+
+    def update_batch_file_progress(self, name, done, total):
+        queue = self.batch_worker.queue if self.batch_worker else None
+        files_done = len(queue.outputs) if queue else 0
+        files_total = len(queue.jobs) if queue else 0
+        self.file_name_label.setText(f"Files done: {files_done}/{files_total} - {name}: {done}/{total}")
+
+    def end_batch_translation(self):
+        if self.batch_worker:
+            self.save_batch_profiles(self.batch_worker)
+            self.show_metrics(self.batch_worker)
+        self.progress_bar.setVisible(False)
+        self.btn_stop.setVisible(False)
+        self.set_pause_visible(False)
+        self.set_batch_controls_enabled(True)
+        self.save_translation_cache()
+        queue = self.batch_worker.queue if self.batch_worker else None
+        self.retire_engine(self.batch_worker)
+        self.batch_worker = None
+        self.apply_pending_settings()
+        return queue
+
+    def on_batch_finished(self):
+        summary = self.batch_worker.engine.stats_summary() if self.batch_worker else ""
+        queue = self.end_batch_translation()
+        message = f"{len(queue.outputs)}/{len(queue.jobs)} files translated.\n{summary}"
+        if queue.errors:
+            message += "\n\n" + "\n".join(f"{os.path.basename(path)}: {error}" for path, error in queue.errors)
+        self.file_name_label.setText("No file selected" if not self.original_file_name else f"Current file: {self.original_file_name}")
+        QMessageBox.information(self, "Success", message)
+
+    def on_batch_canceled(self):
+        queue = self.end_batch_translation()
+        if queue:
+            self.file_name_label.setText(f"Stopped: {len(queue.outputs)}/{len(queue.jobs)} files translated")
+
+    def on_batch_error(self, error_message):
+        self.end_batch_translation()
+        QMessageBox.warning(self, "Error", error_message)
+
+    def stop_translation(self):
+        # The engine gives up on its requests at once; the row to resume from is read in on_translation_canceled,
+        # once the worker has stopped moving it
+        if self.batch_worker:
+            self.batch_worker.cancel()
+            return
+        if self.worker:
+            self.worker.cancel()
+            self.btn_stop.setVisible(False)
+            self.set_pause_visible(False)
+
+    def toggle_pause(self):
+        worker = self.batch_worker or self.worker
+        if not worker:
+            return
+        if worker.engine.is_paused:
+            worker.resume()
+            self.btn_pause.setText("Pause")
+        else:
+            worker.pause()
+            self.btn_pause.setText("Continue")
+
+    def set_pause_visible(self, visible):
+        self.btn_pause.setText("Pause")
+        self.btn_pause.setVisible(visible)
+
+    def update_progress(self, value):
+        self.progress_bar.setValue(value)
+
+    def update_translations(self, rows):
+        self.table_model.queue_translations(rows)
+
+    def on_translation_finished(self):
+        if self.worker:
+            self.save_batch_profiles(self.worker)
+            self.show_metrics(self.worker)
+        self.progress_bar.setVisible(False)
+        self.btn_stop.setVisible(False)
+        self.set_pause_visible(False)
+        self.btn_resume.setVisible(False)
+        self.btn_save_partial.setVisible(False)
+        self.btn_translate.setEnabled(True)
+        self.btn_translate.setStyleSheet("background-color: #27ae60; color: white; padding: 12px; border-radius: 8px;")
+        summary = self.worker.engine.stats_summary() if self.worker else ""
+        self.save_translated_file()
+        if self.worker and self.worker.extra_jobs:
+            self.save_extra_translations(self.worker.extra_jobs)
+        QMessageBox.information(self, "Success", f"Subtitles translated successfully!\n{summary}")
+        self.retire_engine(self.worker)
+        self.worker = None
+        self.extra_jobs = []
+        self.last_processed_row = 0
+        if self.config.get('cache_mode', 'RAM') == "File":
+            self.save_translation_cache()
+        self.apply_pending_settings()
+
+    def on_translation_canceled(self):
+        if self.worker:
+            self.last_processed_row = self.worker.current_row
+            self.save_batch_profiles(self.worker)
+            self.show_metrics(self.worker)
+        self.progress_bar.setVisible(True)
+        self.btn_stop.setVisible(False)
+        self.set_pause_visible(False)
+        self.btn_resume.setVisible(True)
+        self.btn_save_partial.setVisible(True)
+        self.btn_translate.setEnabled(True)
+        self.btn_translate.setStyleSheet("background-color: #27ae60; color: white; padding: 12px; border-radius: 8px;")
+        if self.worker:
+            self.extra_jobs = self.worker.extra_jobs
+        self.retire_engine(self.worker)
+        self.worker = None
+        self.save_translation_cache()
+        self.apply_pending_settings()
+
+    def show_metrics(self, worker):
+        """Show the running (or just ended) worker's request metrics under the progress bar."""
+        if worker:
+            self.metrics_label.setText(worker.engine.metrics.summary())
+            self.metrics_label.setVisible(True)
+
+    def save_batch_profiles(self, worker):
+        try:
+            self.config['batch_profiles'] = json.dumps(worker.engine.batcher.export())
+            storage.save_settings({'batch_profiles': self.config['batch_profiles']})
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error saving batch sizes: {str(e)}")
+
+    def on_translation_error(self, error_message):
+        if self.worker:
+            self.last_processed_row = self.worker.current_row
+            self.save_batch_profiles(self.worker)
+            self.show_metrics(self.worker)
+        self.progress_bar.setVisible(True)
+        self.btn_stop.setVisible(False)
+        self.set_pause_visible(False)
+        self.btn_resume.setVisible(True)
+        self.btn_save_partial.setVisible(True)
+        self.btn_translate.setEnabled(True)
+        self.btn_translate.setStyleSheet("background-color: #27ae60; color: white; padding: 12px; border-radius: 8px;")
+        QMessageBox.warning(self, "Error", error_message)
+        if self.worker:
+            self.extra_jobs = self.worker.extra_jobs
+        self.retire_engine(self.worker)
+        self.worker = None
+        self.apply_pending_settings()
+
+    def save_translated_file(self):
+        try:
+            default_file_name = output_file_name(self.original_file_name, self.language_combo.currentText())
+            
+            file_path, _ = QFileDialog.getSaveFileName(self, "Save Translated Subtitle", default_file_name, SUBTITLE_FILTER)
+            if file_path:
+                self.table_model.save(file_path)
+                QMessageBox.information(self, "Success", "Translated file saved successfully!")
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error saving file: {str(e)}")
+
+    def save_extra_translations(self, jobs):
+        """Write the other target languages next to the source file as ``{lang_prefix}-{file name}``."""
+        directory = os.path.dirname(self.original_file_path)
+        saved = []
+        for job in jobs:
+            try:
+                file_path = os.path.join(directory, output_file_name(self.original_file_name, job.target_language))
+                self.table_model.save(file_path, job.results)
+                saved.append(os.path.basename(file_path))
+            except Exception as e:
+                QMessageBox.warning(self, "Error", f"Error saving {job.target_language} translation: {str(e)}")
+        if saved:
+            QMessageBox.information(self, "Success", "Also saved: " + ", ".join(saved))
+
+    def initialize_db(self):
+        try:
+            storage.initialize_db()
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error opening the database: {str(e)}")
+
+    def closeEvent(self, event):
+        # The workers still use the cache and memory until their engine is closed
+        for worker in (self.worker, self.batch_worker):
+            if worker and worker.isRunning():
+                worker.cancel()
+                worker.wait()
+            self.retire_engine(worker)
+        self.close_retired_engines()
+        self.close_translation_cache()
+        self.close_translation_memory()
+        if self.journal:
+            self.journal.close()
+        super().closeEvent(event)
+
+def main(argv):
+    app = QApplication(argv)
+    window = SubtitleTranslatorApp()
+    window.show()
+    QTimer.singleShot(0, window.finish_startup)
+    return app.exec_()
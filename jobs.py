@@ -0,0 +1,131 @@
+import os
+from engine import TranslationJob, lang_prefix, output_file_name
+from journal import file_hash
+from subtitle_io import SUBTITLE_EXTENSIONS, SubtitleWriter, read_subtitles
+
+def collect_subtitle_files(paths, target_languages=None):
+    """Expand directories into the subtitle files they contain, skipping earlier translations into ``target_languages``."""
+    if isinstance(target_languages, str):
+        target_languages = [target_languages]
+    skip_prefixes = tuple(f"{lang_prefix(language)}-" for language in target_languages or [])
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path) if name.lower().endswith(SUBTITLE_EXTENSIONS))
+            candidates = [os.path.join(path, name) for name in names
+                          if not (skip_prefixes and name.startswith(skip_prefixes))]
+            files.extend(candidate for candidate in candidates if os.path.isfile(candidate))
+        else:
+            files.append(path)
+    return files
+
+class JobQueue:
+    """Translates many subtitle files in one engine run.
+
+    All files share the engine's rate limiter, cache and request slots, so
+    the next episode's cues go out while the previous one's requests are
+    still in flight. Each file is written to ``{lang_prefix}-{file name}``
+    in ``output_dir`` (or next to the source), once for every target
+    language of the engine, cue by cue as the rows before them are done,
+    and renamed into place once complete. Every language's job shares the
+    texts read from the source, which is parsed once. With a ``journal`` each
+    file's progress is recorded as it is made, and unless ``resume`` is
+    off, cues an interrupted run already translated are not requested again.
+    """
+
+    def __init__(self, engine, output_dir=None, journal=None, resume=True):
+        self.engine = engine
+        self.output_dir = output_dir
+        self.journal = journal
+        self.resume = resume
+        self.restored_rows = 0
+        self.paths = []
+        self.jobs = []
+        self.outputs = []
+        self.errors = []
+        self.on_file_finished = None
+
+    def add(self, paths):
+        self.paths.extend(collect_subtitle_files(paths, self.engine.target_languages))
+
+    def output_path(self, source_path, target_language=None):
+        directory = self.output_dir or os.path.dirname(source_path)
+        return os.path.join(directory, output_file_name(os.path.basename(source_path), target_language or self.engine.target_language))
+
+    def write_ready(self, job):
+        """Append the cues finished since the last call to the job's output, opening it on the first."""
+        if job.write_failed or job.current_row == 0:
+            return
+        try:
+            if job.writer is None:
+                job.writer = SubtitleWriter(job.document, job.output_path)
+            job.writer.write_until(job.current_row, job.results)
+        except Exception as e:
+            job.write_failed = True
+            self.errors.append((job.name, f"Error saving file: {str(e)}"))
+
+    def write_output(self, job):
+        if job.write_failed:
+            return
+        try:
+            if job.writer is None:
+                job.writer = SubtitleWriter(job.document, job.output_path)
+            job.writer.finish(job.results)
+            self.outputs.append(job.output_path)
+            if self.on_file_finished:
+                self.on_file_finished(job)
+        except Exception as e:
+            self.errors.append((job.name, f"Error saving file: {str(e)}"))
+
+    def load_jobs(self):
+        self.jobs = []
+        self.errors = []
+        self.restored_rows = 0
+        for path in self.paths:
+            try:
+                document = read_subtitles(path)
+                if not document:
+                    raise ValueError("Empty or invalid subtitle file")
+            except Exception as e:
+                self.errors.append((path, f"Error loading subtitle file: {str(e)}"))
+                continue
+            source_hash = file_hash(path) if self.journal else None
+            for target_language in self.engine.target_languages:
+                job = TranslationJob(document.texts, name=path, target_language=target_language, on_finished=self.write_output)
+                job.document = document
+                job.output_path = self.output_path(path, target_language)
+                job.writer = None
+                job.write_failed = False
+                if self.journal:
+                    self.restored_rows += self.journal.open_job(job, path, self.engine.backend.model, self.resume, source_hash)
+                self.jobs.append(job)
+        return self.jobs
+
+    def run(self, on_progress=None, on_file_progress=None, on_file_finished=None):
+        """Translate every queued file; returns the paths written.
+
+        ``on_progress(done, total)`` reports rows over all files and
+        ``on_file_progress(job, done, total)`` rows of the file that moved.
+        """
+        self.on_file_finished = on_file_finished
+        jobs = self.jobs or self.load_jobs()
+        total = sum(job.total_rows for job in jobs)
+
+        def progress(job):
+            def report(rows_done):
+                self.write_ready(job)
+                if on_file_progress:
+                    on_file_progress(job, rows_done, job.total_rows)
+                if on_progress:
+                    on_progress(sum(other.done_rows for other in jobs), total)
+            return report
+
+        for job in jobs:
+            job.on_progress = progress(job)
+        try:
+            self.engine.run(jobs)
+        finally:
+            for job in jobs:
+                if job.writer is not None and not job.finished:
+                    job.writer.discard()
+        return self.outputs
@@ -0,0 +1,179 @@
+import hashlib
+import threading
+import time
+import storage
+
+def file_hash(path):
+    """SHA-256 of a file's contents, so a journal entry is only resumed against the same source."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class JournalEntry:
+    def __init__(self, job_id, source_path, source_hash, target_language, model, total_rows, done_rows, updated):
+        self.job_id = job_id
+        self.source_path = source_path
+        self.source_hash = source_hash
+        self.target_language = target_language
+        self.model = model
+        self.total_rows = total_rows
+        self.done_rows = done_rows
+        self.updated = updated
+
+class JobJournal:
+    """Unfinished translation jobs kept in SQLite so they survive a crash or restart.
+
+    A job is one source file (identified by its hash) in one target
+    language with one model. Every translated cue is recorded with its
+    result as it arrives; the writes are committed at most
+    ``flush_interval`` seconds apart, so a crash loses at most that much.
+    Finished jobs are removed, so whatever is left is work to resume:
+    ``results`` gives the rows already done, and only the others need to
+    be requested again.
+    """
+
+    def __init__(self, db_path=None, flush_interval=1.0):
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.RLock()
+        self.conn = storage.connect(db_path, check_same_thread=False)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS jobs
+                             (job_id INTEGER PRIMARY KEY, source_path TEXT, source_hash TEXT, target_language TEXT,
+                              model TEXT, total_rows INTEGER, updated REAL)''')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS job_cues
+                             (job_id INTEGER, row INTEGER, status TEXT, result TEXT, PRIMARY KEY (job_id, row))''')
+        self.conn.commit()
+
+    def find(self, source_hash, target_language, model=None):
+        """The unfinished job for this source and language (and model, if given), or None."""
+        with self.lock:
+            query = "SELECT job_id FROM jobs WHERE source_hash = ? AND target_language = ?"
+            params = [source_hash, target_language]
+            if model is not None:
+                query += " AND model = ?"
+                params.append(model)
+            row = self.conn.execute(query + " ORDER BY updated DESC LIMIT 1", params).fetchone()
+            return row[0] if row else None
+
+    def start(self, source_path, source_hash, target_language, model, total_rows):
+        """Record a new job, replacing any unfinished one for the same source and language."""
+        with self.lock:
+            for job_id in self.conn.execute("SELECT job_id FROM jobs WHERE source_hash = ? AND target_language = ?",
+                                            (source_hash, target_language)).fetchall():
+                self.delete(job_id[0])
+            cursor = self.conn.execute("INSERT INTO jobs (source_path, source_hash, target_language, model, total_rows, updated) "
+                                       "VALUES (?, ?, ?, ?, ?, ?)",
+                                       (source_path, source_hash, target_language, model, total_rows, time.time()))
+            self.conn.commit()
+            return cursor.lastrowid
+
+    def resume(self, source_path, source_hash, target_language, model, total_rows):
+        """Return the unfinished job for this source, language and model, or start a new one."""
+        with self.lock:
+            job_id = self.find(source_hash, target_language, model)
+            if job_id is None:
+                return self.start(source_path, source_hash, target_language, model, total_rows)
+            self.conn.execute("UPDATE jobs SET source_path = ? WHERE job_id = ?", (source_path, job_id))
+            self.conn.commit()
+            return job_id
+
+    def record(self, job_id, rows):
+        """Note ``(row, text)`` results of a job; committed within ``flush_interval`` seconds."""
+        with self.lock:
+            self.pending.extend((job_id, row, "done", text) for row, text in rows)
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.pending:
+                self.conn.executemany("INSERT OR REPLACE INTO job_cues (job_id, row, status, result) VALUES (?, ?, ?, ?)",
+                                      self.pending)
+                self.conn.executemany("UPDATE jobs SET updated = ? WHERE job_id = ?",
+                                      [(time.time(), job_id) for job_id in {entry[0] for entry in self.pending}])
+                self.conn.commit()
+                self.pending = []
+            self.last_flush = time.monotonic()
+
+    def results(self, job_id, total_rows):
+        """The job's results as a list with None for the rows not done yet."""
+        with self.lock:
+            self.flush()
+            results = [None] * total_rows
+            for row, text in self.conn.execute("SELECT row, result FROM job_cues WHERE job_id = ? AND status = 'done'", (job_id,)):
+                if row < total_rows:
+                    results[row] = text
+            return results
+
+    def finish(self, job_id):
+        """Forget a completed job."""
+        self.delete(job_id)
+
+    def delete(self, job_id):
+        with self.lock:
+            self.pending = [entry for entry in self.pending if entry[0] != job_id]
+            self.conn.execute("DELETE FROM job_cues WHERE job_id = ?", (job_id,))
+            self.conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            self.conn.commit()
+
+    def unfinished(self):
+        """Every job left unfinished, most recently active first."""
+        with self.lock:
+            self.flush()
+            cursor = self.conn.execute('''SELECT jobs.job_id, source_path, source_hash, target_language, model, total_rows,
+                                                 COUNT(job_cues.row), updated
+                                          FROM jobs LEFT JOIN job_cues ON job_cues.job_id = jobs.job_id
+                                          GROUP BY jobs.job_id ORDER BY updated DESC''')
+            return [JournalEntry(*row) for row in cursor]
+
+    def track(self, job, job_id):
+        """Record ``job``'s results under ``job_id`` as they are applied, and forget the job once it finishes.
+
+        Results the job already holds are recorded first, so rows restored
+        from elsewhere are not lost if this run is interrupted too.
+        """
+        on_translated_rows = job.on_translated_rows
+        on_finished = job.on_finished
+
+        def record(rows):
+            self.record(job_id, rows)
+            if on_translated_rows:
+                on_translated_rows(rows)
+
+        def finished(finished_job):
+            if on_finished:
+                on_finished(finished_job)
+            self.finish(job_id)
+
+        self.record(job_id, [(row, text) for row, text in enumerate(job.results) if text is not None])
+        self.flush()
+        job.on_translated_rows = record
+        job.on_finished = finished
+
+    def open_job(self, job, source_path, model, resume=True, source_hash=None):
+        """Journal ``job``, translating ``source_path`` with ``model``, and return the number of rows restored.
+
+        With ``resume`` the results of an unfinished run of the same source,
+        language and model fill the rows ``job`` has no result for, so only
+        the others are requested; otherwise any such run is discarded.
+        """
+        source_hash = source_hash or file_hash(source_path)
+        restored = 0
+        if resume:
+            job_id = self.resume(source_path, source_hash, job.target_language, model, job.total_rows)
+            for row, text in enumerate(self.results(job_id, job.total_rows)):
+                if text is not None and job.results[row] is None:
+                    job.results[row] = text
+                    restored += 1
+        else:
+            job_id = self.start(source_path, source_hash, job.target_language, model, job.total_rows)
+        self.track(job, job_id)
+        return restored
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.conn.close()
@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+LATENCY_SAMPLES = 10000
+RPM_WINDOW = 60
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+class Metrics:
+    """Counters and timings of an engine's requests, safe to read from another thread while it runs.
+
+    For every request attempt: its latency and input and output tokens,
+    whether it failed and was retried. For every batch: how long its cues
+    waited for a free request slot (queue wait) and then for the rate
+    limiter or a backoff (rate wait). Cache hits and misses count distinct
+    cues looked up, memory hits the misses answered by the translation
+    memory. ``snapshot`` sums it all up in a flat dict, with the
+    requests sent in the last minute as the effective RPM next to the
+    configured one.
+    """
+
+    def __init__(self, configured_rpm=0):
+        self.configured_rpm = configured_rpm
+        self.lock = threading.Lock()
+        self.started = None
+        self.counters = dict.fromkeys(("requests", "retries", "errors", "input_tokens", "output_tokens",
+                                       "cache_hits", "cache_misses", "memory_hits", "batches"), 0)
+        self.queue_wait = 0.0
+        self.rate_wait = 0.0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.request_times = deque()
+
+    def start(self):
+        with self.lock:
+            if self.started is None:
+                self.started = time.monotonic()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def observe_request(self, latency, input_tokens=None, output_tokens=None, failed=False):
+        """Record one request attempt that took ``latency`` seconds."""
+        with self.lock:
+            now = time.monotonic()
+            self.counters["requests"] += 1
+            self.request_times.append(now)
+            while now - self.request_times[0] > RPM_WINDOW:
+                self.request_times.popleft()
+            if failed:
+                self.counters["errors"] += 1
+                return
+            self.latencies.append(latency)
+            self.counters["input_tokens"] += input_tokens or 0
+            self.counters["output_tokens"] += output_tokens or 0
+
+    def observe_batch(self, queue_wait, rate_wait):
+        with self.lock:
+            self.counters["batches"] += 1
+            self.queue_wait += queue_wait
+            self.rate_wait += rate_wait
+
+    def snapshot(self):
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.started if self.started is not None else 0.0
+            latencies = sorted(self.latencies)
+            recent = sum(1 for moment in self.request_times if now - moment <= RPM_WINDOW)
+            counters = dict(self.counters)
+            queue_wait = self.queue_wait
+            rate_wait = self.rate_wait
+        succeeded = counters["requests"] - counters["errors"]
+        lookups = counters["cache_hits"] + counters["cache_misses"]
+        snapshot = {
+            "timestamp": round(time.time(), 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "latency_p50": percentile(latencies, 0.5),
+            "latency_p90": percentile(latencies, 0.9),
+            "latency_p99": percentile(latencies, 0.99),
+            "latency_mean": sum(latencies) / len(latencies) if latencies else None,
+            "input_tokens_per_request": counters["input_tokens"] / succeeded if succeeded else None,
+            "output_tokens_per_request": counters["output_tokens"] / succeeded if succeeded else None,
+            "queue_wait_seconds": queue_wait,
+            "rate_wait_seconds": rate_wait,
+            "queue_wait_mean": queue_wait / counters["batches"] if counters["batches"] else None,
+            "rate_wait_mean": rate_wait / counters["batches"] if counters["batches"] else None,
+            "cache_hit_rate": counters["cache_hits"] / lookups if lookups else None,
+            "configured_rpm": self.configured_rpm,
+            "effective_rpm": recent,
+            "rpm_utilization": recent / self.configured_rpm if self.configured_rpm else None
+        }
+        snapshot.update(counters)
+        return {key: round(value, 4) if isinstance(value, float) else value for key, value in snapshot.items()}
+
+    def summary(self):
+        """One line for a status bar."""
+        s = self.snapshot()
+        latency = (f"latency p50 {s['latency_p50']:.2f} s / p90 {s['latency_p90']:.2f} s"
+                   if s["latency_p50"] is not None else "latency -")
+        cache = f"cache {s['cache_hit_rate']:.0%}" if s["cache_hit_rate"] is not None else "cache -"
+        if s["memory_hits"]:
+            cache += f" + {s['memory_hits']} from memory"
+        return (f"{latency} · {s['effective_rpm']}/{s['configured_rpm']} RPM · {s['requests']} requests, "
+                f"{s['retries']} retries · tokens {s['input_tokens']} in / {s['output_tokens']} out · {cache} · "
+                f"waits: queue {s['queue_wait_seconds']:.1f} s, rate {s['rate_wait_seconds']:.1f} s")
+
+PROMETHEUS_METRICS = (
+    ("requests", "counter", "Request attempts sent"),
+    ("retries", "counter", "Request attempts that were retried"),
+    ("errors", "counter", "Request attempts that failed"),
+    ("batches", "counter", "Batches sent"),
+    ("input_tokens", "counter", "Input tokens of successful requests"),
+    ("output_tokens", "counter", "Output tokens of successful requests"),
+    ("cache_hits", "counter", "Cues found in the translation cache"),
+    ("cache_misses", "counter", "Cues not found in the translation cache"),
+    ("memory_hits", "counter", "Cache misses answered from the translation memory"),
+    ("queue_wait_seconds", "counter", "Seconds batches waited for a free request slot"),
+    ("rate_wait_seconds", "counter", "Seconds batches waited for the rate limiter or a backoff"),
+    ("effective_rpm", "gauge", "Requests sent in the last minute"),
+    ("configured_rpm", "gauge", "Configured requests per minute"),
+)
+
+def to_prometheus(snapshot):
+    """A snapshot in the Prometheus text format."""
+    lines = []
+    for key, kind, help_text in PROMETHEUS_METRICS:
+        name = f"subai_{key}_total" if kind == "counter" else f"subai_{key}"
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {snapshot[key]}"]
+    lines += ["# HELP subai_request_latency_seconds Latency of successful requests",
+              "# TYPE subai_request_latency_seconds summary"]
+    for quantile, key in (("0.5", "latency_p50"), ("0.9", "latency_p90"), ("0.99", "latency_p99")):
+        value = snapshot[key]
+        if value is not None:
+            lines.append(f'subai_request_latency_seconds{{quantile="{quantile}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+class MetricsWriter:
+    """Writes a ``Metrics`` snapshot to ``path`` every ``interval`` seconds and once more on ``stop``.
+
+    A path ending in ``.prom`` is rewritten in the Prometheus text format,
+    for node_exporter's textfile collector; any other path gets one JSON
+    line appended per snapshot.
+    """
+
+    def __init__(self, metrics, path, interval=10.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+
+    def write(self):
+        snapshot = self.metrics.snapshot()
+        if self.path.endswith(".prom"):
+            temporary = f"{self.path}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                f.write(to_prometheus(snapshot))
+            os.replace(temporary, self.path)
+        else:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(snapshot) + "\n")
+
+    def loop(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.write()
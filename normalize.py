@@ -0,0 +1,75 @@
+import re
+from collections import namedtuple
+
+WRAPPER_TAG = re.compile(r'^(<(i|b|u)>|<font\b[^>]*>|\{\\[^}]*\})(.*)$', re.S | re.I)
+TRAILING_OVERRIDE = re.compile(r'^(.*?)(\{\\[^}]*\})$', re.S)
+WHITESPACE = re.compile(r'[ \t\u00a0]+')
+
+CueStyle = namedtuple("CueStyle", ["prefix", "suffix", "line_count", "dialogue"])
+
+def closing_tag(opening, inner):
+    if opening.startswith("{"):
+        match = TRAILING_OVERRIDE.match(inner)
+        return match.group(2) if match else ""
+    name = re.match(r'<(\w+)', opening).group(1).lower()
+    return f"</{name}>"
+
+def strip_wrappers(text):
+    """Remove formatting tags that wrap the whole text; return (text, prefix, suffix)."""
+    prefix = ""
+    suffix = ""
+    while True:
+        match = WRAPPER_TAG.match(text)
+        if not match:
+            break
+        opening, inner = match.group(1), match.group(3)
+        closing = closing_tag(opening, inner)
+        if closing:
+            body = inner[:-len(closing)]
+            if not inner.lower().endswith(closing.lower()) or closing.lower() in body.lower():
+                break
+            inner = body
+        prefix += opening
+        suffix = closing + suffix
+        text = inner.strip()
+    return text, prefix, suffix
+
+def normalize_text(text):
+    """Reduce a cue to the canonical text sent to the model and used in cache keys.
+
+    Tags wrapping the whole cue, extra whitespace and line breaks are removed
+    so that cues differing only in those respects share one translation.
+    Line breaks are kept for dialogue cues ("- Hi.\\n- Bye."). Returns the
+    canonical text and a ``CueStyle`` that ``restore_formatting`` uses to put
+    the formatting back.
+    """
+    text, prefix, suffix = strip_wrappers(text.strip())
+    lines = [WHITESPACE.sub(" ", line).strip() for line in text.splitlines()]
+    lines = [line for line in lines if line]
+    dialogue = len(lines) > 1 and all(line.startswith("-") for line in lines)
+    canonical = "\n".join(lines) if dialogue else " ".join(lines)
+    return canonical, CueStyle(prefix, suffix, max(1, len(lines)), dialogue)
+
+def split_lines(text, line_count):
+    """Break text into ``line_count`` lines of similar length at word boundaries."""
+    words = text.split(" ")
+    if line_count <= 1 or len(words) < line_count:
+        return text
+    lines = []
+    remaining = len(text)
+    current = []
+    for word in words:
+        current.append(word)
+        target = remaining / (line_count - len(lines))
+        if len(lines) < line_count - 1 and len(" ".join(current)) >= target:
+            lines.append(" ".join(current))
+            remaining -= len(lines[-1]) + 1
+            current = []
+    if current:
+        lines.append(" ".join(current))
+    return "\n".join(lines)
+
+def restore_formatting(translation, style):
+    if style.line_count > 1 and not style.dialogue and "\n" not in translation:
+        translation = split_lines(translation, style.line_count)
+    return f"{style.prefix}{translation}{style.suffix}"
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import random
+import threading
+import time
+import storage
+
+MAX_KEY_BACKOFF = 60
+# Gemini's daily quotas reset at midnight Pacific time
+QUOTA_DAY_OFFSET = -8 * 3600
+USAGE_FLUSH_INTERVAL = 10.0
+
+class RateLimiter:
+    """Token bucket allowing ``rpm`` requests per minute, shared by all request threads."""
+
+    def __init__(self, rpm, burst=1):
+        self.rate = rpm / 60
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """Take a token if one is available; otherwise return the seconds to wait for one."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+class QuotaExhausted(Exception):
+    pass
+
+def quota_day():
+    return time.strftime("%Y-%m-%d", time.gmtime(time.time() + QUOTA_DAY_OFFSET))
+
+def key_id(key):
+    """A stable name for a key that does not reveal it, for the usage table."""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+def parse_key_spec(spec, default_rpm):
+    """``KEY[,RPM[,DAILY_QUOTA]]`` as a dict for the ``api_keys`` setting; raises ValueError."""
+    parts = [part.strip() for part in spec.split(",")]
+    if not parts[0]:
+        raise ValueError(f"No API key in {spec!r}")
+    rpm = int(parts[1]) if len(parts) > 1 and parts[1] else int(default_rpm)
+    quota = int(parts[2]) if len(parts) > 2 and parts[2] else 0
+    if rpm <= 0 or quota < 0:
+        raise ValueError(f"Invalid RPM or daily quota for API key ending in {parts[0][-4:]}")
+    return {"key": parts[0], "rpm": rpm, "daily_quota": quota}
+
+def format_key_spec(entry):
+    spec = f"{entry['key']},{entry['rpm']}"
+    return f"{spec},{entry['daily_quota']}" if entry.get('daily_quota') else spec
+
+class ApiKey:
+    """One API key's budget: its own token bucket, daily quota and 429 backoff."""
+
+    def __init__(self, key, rpm, daily_quota=0, used_today=0):
+        self.key = key
+        self.id = key_id(key)
+        self.rpm = rpm
+        self.daily_quota = daily_quota
+        self.used_today = used_today
+        self.unflushed = 0
+        self.limiter = RateLimiter(rpm)
+        self.backoff_until = 0.0
+        self.failures = 0
+        self.requests = 0
+        self.rate_limited = 0
+
+    @property
+    def label(self):
+        return f"…{self.key[-4:]}"
+
+    def exhausted(self):
+        return bool(self.daily_quota) and self.used_today >= self.daily_quota
+
+    def try_acquire(self, now):
+        """0 if a request may go out with this key now (and count it), otherwise the seconds until it may."""
+        if now < self.backoff_until:
+            return self.backoff_until - now
+        wait_time = self.limiter.try_acquire()
+        if not wait_time:
+            self.used_today += 1
+            self.unflushed += 1
+            self.requests += 1
+        return wait_time
+
+class KeyPool:
+    """API keys shared by the engine's request threads, each with its own RPM and daily quota.
+
+    ``try_acquire`` picks the key that can send right now with the most
+    quota left, so throughput adds up over the keys. A 429 on one key
+    (``back_off``) only rests that key, with a backoff that doubles on
+    each consecutive 429; the others keep sending. Requests made today
+    are counted per key in the ``key_usage`` table, so quotas hold over
+    several runs and processes sharing the keys' database.
+    """
+
+    def __init__(self, entries, db_path=None):
+        self.db_path = db_path or storage.DB_PATH
+        self.lock = threading.RLock()
+        self.day = quota_day()
+        usage = self.load_usage(self.day)
+        self.keys = [ApiKey(entry["key"], int(entry["rpm"]), int(entry.get("daily_quota") or 0),
+                            usage.get(key_id(entry["key"]), 0)) for entry in entries]
+        self.last_flush = time.monotonic()
+
+    def connect(self):
+        conn = storage.connect(self.db_path)
+        conn.execute('''CREATE TABLE IF NOT EXISTS key_usage
+                        (key_id TEXT, day TEXT, requests INTEGER, PRIMARY KEY (key_id, day))''')
+        return conn
+
+    def load_usage(self, day):
+        conn = self.connect()
+        try:
+            return dict(conn.execute("SELECT key_id, requests FROM key_usage WHERE day = ?", (day,)).fetchall())
+        finally:
+            conn.close()
+
+    @property
+    def rpm(self):
+        return sum(key.rpm for key in self.keys)
+
+    def try_acquire(self):
+        """Return ``(0, key)`` for a key that may send now, or ``(seconds to wait, None)``.
+
+        Raises ``QuotaExhausted`` once every key has used its daily quota.
+        """
+        with self.lock:
+            day = quota_day()
+            if day != self.day:
+                self.flush_usage()
+                self.day = day
+                for key in self.keys:
+                    key.used_today = 0
+            now = time.monotonic()
+            available = [key for key in self.keys if not key.exhausted()]
+            if not available:
+                raise QuotaExhausted("The daily quota of every API key is used up")
+            waits = []
+            for key in sorted(available, key=lambda key: key.used_today - (key.daily_quota or float("inf"))):
+                wait_time = key.try_acquire(now)
+                if not wait_time:
+                    due = time.monotonic() - self.last_flush >= USAGE_FLUSH_INTERVAL
+                    break
+                waits.append(wait_time)
+            else:
+                return min(waits), None
+        if due:
+            self.flush_usage()
+        return 0, key
+
+    def back_off(self, key):
+        with self.lock:
+            key.failures += 1
+            key.rate_limited += 1
+            delay = min(MAX_KEY_BACKOFF, 2 ** key.failures) + random.uniform(0, 1)
+            key.backoff_until = max(key.backoff_until, time.monotonic() + delay)
+
+    def succeeded(self, key):
+        key.failures = 0
+
+    def flush_usage(self):
+        with self.lock:
+            counts = [(key.id, self.day, key.unflushed) for key in self.keys if key.unflushed]
+            for key in self.keys:
+                key.unflushed = 0
+            self.last_flush = time.monotonic()
+        if not counts:
+            return
+        conn = self.connect()
+        try:
+            conn.executemany('''INSERT INTO key_usage (key_id, day, requests) VALUES (?, ?, ?)
+                                ON CONFLICT (key_id, day) DO UPDATE SET requests = requests + excluded.requests''', counts)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def summary(self):
+        parts = []
+        for key in self.keys:
+            quota = f"/{key.daily_quota} today" if key.daily_quota else ""
+            limited = f", {key.rate_limited} rate-limited" if key.rate_limited else ""
+            parts.append(f"{key.label}: {key.requests} requests ({key.used_today}{quota}){limited}")
+        return "API keys: " + "; ".join(parts) + "."
+
+def pool_entries(config):
+    """The ``api_key`` setting, unless listed again, followed by the extra keys of ``api_keys`` (a JSON list of
+    ``{"key", "rpm", "daily_quota"}``)."""
+    entries = json.loads(config.get('api_keys') or '[]')
+    if config.get('api_key') and config['api_key'] not in (entry["key"] for entry in entries):
+        entries = [{"key": config['api_key'], "rpm": int(config.get('rpm', '15')), "daily_quota": 0}] + entries
+    return entries
+
+def open_key_pool(config):
+    """The pool of the keys ``pool_entries`` lists, or None without extra keys in ``api_keys``."""
+    if not json.loads(config.get('api_keys') or '[]'):
+        return None
+    return KeyPool(pool_entries(config))
@@ -0,0 +1,160 @@
+import bisect
+import difflib
+from collections import Counter
+from itertools import accumulate
+from normalize import normalize_text, restore_formatting
+
+# How far a cue whose text is unchanged may have moved, beyond the file's overall shift, to still be paired
+MOVE_TOLERANCE_MS = 2000
+
+def cue_keys(document):
+    return [normalize_text(text)[0] if text else "" for text in document.texts]
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else 0
+
+def unique_anchors(previous_keys, keys):
+    """Pairs of rows whose text occurs exactly once in each file, keeping the longest run in the same order."""
+    previous_counts = Counter(previous_keys)
+    counts = Counter(keys)
+    previous_rows = {key: row for row, key in enumerate(previous_keys) if previous_counts[key] == 1 and key}
+    candidates = [(previous_rows[key], row) for row, key in enumerate(keys) if counts[key] == 1 and key in previous_rows]
+    # Longest increasing subsequence of the previous rows, in rows order
+    tails = []
+    tail_indexes = []
+    parents = [None] * len(candidates)
+    for index, (previous_row, _) in enumerate(candidates):
+        position = bisect.bisect_left(tails, previous_row)
+        if position:
+            parents[index] = tail_indexes[position - 1]
+        if position == len(tails):
+            tails.append(previous_row)
+            tail_indexes.append(index)
+        else:
+            tails[position] = previous_row
+            tail_indexes[position] = index
+    anchors = []
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        anchors.append(candidates[index])
+        index = parents[index]
+    return anchors[::-1]
+
+def align_cues(previous, document):
+    """Pair each cue of ``document`` with the cue of ``previous`` it is unchanged from.
+
+    Runs of unchanged cues are found by a diff of the texts (formatting
+    aside), which survives re-timing, anchored on lines that occur once
+    in each file. The median shift of those pairs is
+    then taken as the file's overall offset, and cues that moved out of
+    order are paired when their text is the same and their timing within
+    ``MOVE_TOLERANCE_MS`` of that shift. Returns the previous row of every
+    row (None for changed and new cues) and the offset in milliseconds.
+    """
+    previous_keys = cue_keys(previous)
+    keys = cue_keys(document)
+    pairs = [None] * len(keys)
+    unmatched_previous = []
+    unmatched = []
+    bounds = [(-1, -1)] + unique_anchors(previous_keys, keys) + [(len(previous_keys), len(keys))]
+    for (previous_anchor, anchor), (previous_next, next_anchor) in zip(bounds, bounds[1:]):
+        if anchor >= 0:
+            pairs[anchor] = previous_anchor
+        # Only the stretches between anchors are diffed, which keeps long files with repeated lines fast
+        matcher = difflib.SequenceMatcher(None, previous_keys[previous_anchor + 1:previous_next],
+                                          keys[anchor + 1:next_anchor], autojunk=False)
+        for tag, previous_start, previous_end, start, end in matcher.get_opcodes():
+            previous_start += previous_anchor + 1
+            previous_end += previous_anchor + 1
+            start += anchor + 1
+            end += anchor + 1
+            if tag == "equal":
+                for offset in range(end - start):
+                    pairs[start + offset] = previous_start + offset
+            else:
+                unmatched_previous.extend(range(previous_start, previous_end))
+                unmatched.extend(range(start, end))
+    offset_ms = median(document.starts[row] - previous.starts[previous_row]
+                       for row, previous_row in enumerate(pairs) if previous_row is not None)
+    moved = {}
+    for previous_row in unmatched_previous:
+        moved.setdefault(previous_keys[previous_row], []).append(previous_row)
+    for row in unmatched:
+        candidates = moved.get(keys[row])
+        if not candidates:
+            continue
+        expected = document.starts[row] - offset_ms
+        previous_row = min(candidates, key=lambda candidate: abs(previous.starts[candidate] - expected))
+        if abs(previous.starts[previous_row] - expected) <= MOVE_TOLERANCE_MS:
+            candidates.remove(previous_row)
+            pairs[row] = previous_row
+    return pairs, offset_ms
+
+def translation_rows(previous, translation):
+    """The translated text of each cue of ``previous``: by position, or by start time if the cue counts differ."""
+    if len(translation) == len(previous):
+        return list(translation.texts)
+    by_start = dict(zip(translation.starts, translation.texts))
+    return [by_start.get(start) for start in previous.starts]
+
+def carry_translation(text, previous_text, translated_text):
+    """Reuse ``translated_text`` for ``text``, re-applying ``text``'s formatting if it differs from ``previous_text``'s."""
+    _, style = normalize_text(text)
+    _, previous_style = normalize_text(previous_text)
+    if style == previous_style:
+        return translated_text
+    return restore_formatting(normalize_text(translated_text)[0], style)
+
+class Revision:
+    """What a revised subtitle file can keep from the translation of an earlier version.
+
+    ``results`` has the earlier translation of every cue whose text is
+    unchanged, wherever its timing moved, and None for the ones to
+    translate: ``changed`` cues overlap a removed cue in time, ``added``
+    ones do not. ``offset_ms`` is the overall shift of the timings.
+    """
+
+    def __init__(self, results, carried, changed, added, removed, offset_ms):
+        self.results = results
+        self.carried = carried
+        self.changed = changed
+        self.added = added
+        self.removed = removed
+        self.offset_ms = offset_ms
+
+    def summary(self):
+        shift = f", timings shifted by {self.offset_ms / 1000:+.3f} s" if self.offset_ms else ""
+        return (f"{self.carried} lines kept from the previous translation, {self.changed} changed and "
+                f"{self.added} new lines to translate, {self.removed} lines removed{shift}.")
+
+def revise(document, previous, translation):
+    """Line ``document`` up with an earlier version ``previous`` of it and that version's ``translation``."""
+    pairs, offset_ms = align_cues(previous, document)
+    translated = translation_rows(previous, translation)
+    results = [None] * len(document)
+    carried = 0
+    for row, previous_row in enumerate(pairs):
+        if previous_row is not None and document.texts[row] and translated[previous_row]:
+            results[row] = carry_translation(document.texts[row], previous.texts[previous_row], translated[previous_row])
+            carried += 1
+    paired = {previous_row for previous_row in pairs if previous_row is not None}
+    removed = sorted((previous.starts[row], previous.ends[row]) for row in range(len(previous)) if row not in paired)
+    removed_starts = [start for start, _ in removed]
+    # Latest end among the removed cues starting up to each one, to find an overlap with one bisect
+    latest_ends = list(accumulate((end for _, end in removed), max))
+    changed = added = 0
+    for row, previous_row in enumerate(pairs):
+        if results[row] is not None or not document.texts[row]:
+            continue
+        if previous_row is not None:
+            # Unchanged, but the previous translation has nothing for it
+            changed += 1
+            continue
+        start, end = document.starts[row] - offset_ms, document.ends[row] - offset_ms
+        before = bisect.bisect_left(removed_starts, end)
+        if before and latest_ends[before - 1] > start:
+            changed += 1
+        else:
+            added += 1
+    return Revision(results, carried, changed, added, len(removed), offset_ms)
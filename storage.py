@@ -0,0 +1,62 @@
+import os
+import sqlite3
+
+# Made absolute once, so every connection uses the same file whatever the working directory later is.
+# SUBAI_DB points several instances, or worker processes, at one shared database.
+DB_PATH = os.path.abspath(os.environ.get("SUBAI_DB") or 'subtitle_translator.db')
+BUSY_TIMEOUT = 30
+
+DEFAULT_CONFIG = {
+    'backend': 'Gemini',
+    'rpm': '15',
+    'concurrency': '3',
+    'model': 'gemini-1.5-flash',
+    'cache_mode': 'RAM',
+    'cache_budget_mb': '64',
+    'batch_size': 'Auto',
+    'streaming': 'On',
+    'fuzzy_threshold': 'Off'
+}
+
+def connect(db_path=None, check_same_thread=True):
+    """Open the database to share with other processes: in WAL mode, so readers never block the writer, and
+    waiting up to ``BUSY_TIMEOUT`` seconds for another writer instead of failing with "database is locked"."""
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=BUSY_TIMEOUT, check_same_thread=check_same_thread)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def initialize_db():
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute('''CREATE TABLE IF NOT EXISTS settings
+                      (key TEXT PRIMARY KEY, value TEXT)''')
+    conn.commit()
+    conn.close()
+
+def load_settings():
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT key, value FROM settings")
+    settings = dict(cursor.fetchall())
+    conn.close()
+    return settings
+
+def save_settings(config):
+    conn = connect()
+    cursor = conn.cursor()
+    for key, value in config.items():
+        cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+    conn.commit()
+    conn.close()
+
+def load_config():
+    """Read the stored settings over the defaults.
+
+    Proxies are left in the ``proxy`` setting for the backend to use rather
+    than put in the process environment, where they would apply to every
+    connection, including ones to a server on the LAN.
+    """
+    config = dict(DEFAULT_CONFIG)
+    config.update(load_settings())
+    return config
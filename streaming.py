@@ -0,0 +1,71 @@
+import json
+import re
+
+JSON_PAIR = re.compile(r'"(\d+)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+JSON_OBJECT_PAIR = re.compile(r'"(\d+)"\s*:\s*(\{(?:[^{}"]|"(?:[^"\\]|\\.)*")*\})')
+PAIR_SEPARATOR = re.compile(r'[\s,]*')
+
+def decode_pair(num, value, languages):
+    """Map (0-based cue index, language) to the translations in one decoded ``"number": value`` pair.
+
+    With one language ``value`` is the translation, with several an object
+    keyed by language. Anything else yields nothing.
+    """
+    try:
+        num = int(num) - 1
+    except ValueError:
+        return {}
+    translations = {languages[0]: value} if isinstance(value, str) else value
+    if not isinstance(translations, dict):
+        return {}
+    found = {}
+    for language in languages:
+        translated_text = translations.get(language)
+        if isinstance(translated_text, str) and translated_text.strip():
+            found[num, language] = translated_text.strip()
+    return found
+
+def decode_raw_pair(num, raw_value, languages):
+    """Like ``decode_pair`` for a value still in JSON source form, as matched by ``JSON_PAIR`` or ``JSON_OBJECT_PAIR``."""
+    try:
+        value = json.loads(f'"{raw_value}"' if len(languages) == 1 else raw_value)
+    except ValueError:
+        return {}
+    return decode_pair(num, value, languages)
+
+class CueStreamParser:
+    """Picks complete cues out of a JSON reply while it is still arriving.
+
+    Feed it the chunks of a streamed reply in order; each call returns the
+    cues whose value was completed by that chunk, so they can be shown
+    before the rest of the batch is written. Cues are expected in the order
+    the model writes them, one ``"number": value`` pair after another; if
+    the reply strays from that shape the parser stops finding cues and the
+    full reply is left to ``TranslationEngine.parse_response``.
+    """
+
+    def __init__(self, languages):
+        self.languages = languages
+        self.pattern = JSON_PAIR if len(languages) == 1 else JSON_OBJECT_PAIR
+        self.buffer = ""
+        self.started = False
+
+    def feed(self, chunk):
+        """Add the next piece of the reply; return ``{(index, language): text}`` for the cues it completed."""
+        self.buffer += chunk
+        if not self.started:
+            start = self.buffer.find("{")
+            if start < 0:
+                return {}
+            self.buffer = self.buffer[start + 1:]
+            self.started = True
+        found = {}
+        position = 0
+        while True:
+            match = self.pattern.match(self.buffer, PAIR_SEPARATOR.match(self.buffer, position).end())
+            if not match:
+                break
+            position = match.end()
+            found.update(decode_raw_pair(match.group(1), match.group(2), self.languages))
+        self.buffer = self.buffer[position:]
+        return found
@@ -0,0 +1,311 @@
+import codecs
+import mmap
+import os
+import re
+from array import array
+
+FORMATS = {".srt": "srt", ".vtt": "vtt", ".ass": "ass", ".ssa": "ass"}
+SUBTITLE_EXTENSIONS = tuple(FORMATS)
+SRT_TIMING = re.compile(r"\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})")
+VTT_TIMING = re.compile(r"\s*(?:(\d+):)?(\d{1,2}):(\d{1,2})\.(\d{1,3})\s+-->\s+(?:(\d+):)?(\d{1,2}):(\d{1,2})\.(\d{1,3})(.*)")
+ASS_TIME = re.compile(r"\s*(\d+):(\d{1,2}):(\d{1,2})\.(\d{1,2})\s*$")
+TIME_STRING = re.compile(r"\s*(?:(\d+):)?(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*$")
+VTT_BLOCKS = ("NOTE", "STYLE", "REGION")
+DEFAULT_ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+WrapStyle: 0
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,20,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,2,2,2,10,10,10,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+ASS_FIELDS = ["Layer", "Start", "End", "Style", "Name", "MarginL", "MarginR", "MarginV", "Effect", "Text"]
+
+def to_ms(hours, minutes, seconds, fraction):
+    """Milliseconds of a timestamp's fields; ``fraction`` is the digits after the separator."""
+    return ((int(hours or 0) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(fraction.ljust(3, "0")[:3])
+
+def parse_time(value):
+    """Milliseconds of an SRT, WebVTT or ASS timestamp such as ``00:01:02,500``; raises ValueError."""
+    match = TIME_STRING.match(value)
+    if not match:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    return to_ms(*match.groups())
+
+def srt_time(ms):
+    return f"{ms // 3600000:02}:{ms // 60000 % 60:02}:{ms // 1000 % 60:02},{ms % 1000:03}"
+
+def vtt_time(ms):
+    return f"{ms // 3600000:02}:{ms // 60000 % 60:02}:{ms // 1000 % 60:02}.{ms % 1000:03}"
+
+def ass_time(ms):
+    centiseconds = (ms + 5) // 10
+    return f"{centiseconds // 360000}:{centiseconds // 6000 % 60:02}:{centiseconds // 100 % 60:02}.{centiseconds % 100:02}"
+
+def format_for_path(path):
+    return FORMATS.get(os.path.splitext(path)[1].lower())
+
+def decode_line(raw):
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("cp1252", errors="replace")
+
+def iter_lines(path):
+    """The lines of a text file without line endings, read from a memory map one at a time.
+
+    UTF-8 (with or without a BOM) and legacy 8-bit files are decoded line by
+    line; UTF-16 files, which cannot be split on bytes, are decoded whole.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            head = mm[:4]
+            if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+                yield from mm[:].decode("utf-16").splitlines()
+                return
+            if head.startswith(codecs.BOM_UTF8):
+                mm.seek(len(codecs.BOM_UTF8))
+            for raw in iter(mm.readline, b""):
+                yield decode_line(raw).rstrip("\r\n")
+
+def iter_blocks(lines):
+    """Groups of non-blank lines separated by blank ones."""
+    block = []
+    for line in lines:
+        if line.strip():
+            block.append(line)
+        elif block:
+            yield block
+            block = []
+    if block:
+        yield block
+
+class SubtitleReader:
+    """Parses a subtitle file lazily: iterating yields ``(start_ms, end_ms, text, extra)`` as cues are read.
+
+    The format comes from the file name (``.srt``, ``.vtt``, ``.ass`` or
+    ``.ssa``) or, failing that, from the first line. ``extra`` keeps what
+    a format has besides timings and text so the cue can be written back
+    unchanged: the cue identifier and settings of a WebVTT cue, the other
+    fields of an ASS ``Dialogue`` line, and the NOTE blocks or ``Comment``
+    lines just before it. What comes before the first cue is ``header``
+    and what follows the last one ``footer``, both set as they are read.
+    """
+
+    def __init__(self, path, format=None):
+        self.path = path
+        self.format = format or format_for_path(path)
+        self.header = ""
+        self.footer = ""
+
+    def __iter__(self):
+        lines = iter_lines(self.path)
+        if self.format is None:
+            first = next(lines, "")
+            self.format = "vtt" if first.startswith("WEBVTT") else "ass" if first.strip() == "[Script Info]" else "srt"
+            lines = prepend(first, lines)
+        return getattr(self, f"parse_{self.format}")(lines)
+
+    def parse_srt(self, lines):
+        cue = None
+        for block in iter_blocks(lines):
+            timing_line = 1 if len(block) > 1 and block[0].strip().isdigit() else 0
+            match = SRT_TIMING.match(block[timing_line])
+            if match:
+                if cue:
+                    yield cue
+                groups = match.groups()
+                cue = (to_ms(*groups[:4]), to_ms(*groups[4:]), "\n".join(block[timing_line + 1:]), None)
+            elif cue:
+                # A blank line inside a cue's text
+                cue = (cue[0], cue[1], cue[2] + "\n\n" + "\n".join(block), None)
+        if cue:
+            yield cue
+
+    def parse_vtt(self, lines):
+        before = []
+        seen_cue = False
+        for block in iter_blocks(lines):
+            if not seen_cue and block[0].startswith("WEBVTT"):
+                self.header = "\n".join(block) + "\n\n"
+                continue
+            timing_line = 0 if "-->" in block[0] else 1
+            match = VTT_TIMING.match(block[timing_line]) if len(block) > timing_line else None
+            if block[0].startswith(VTT_BLOCKS) or not match:
+                if seen_cue:
+                    before.append("\n".join(block))
+                else:
+                    self.header += "\n".join(block) + "\n\n"
+                continue
+            seen_cue = True
+            groups = match.groups()
+            identifier = block[0] if timing_line else None
+            yield (to_ms(*groups[:4]), to_ms(*groups[4:8]), "\n".join(block[timing_line + 1:]),
+                   (identifier, groups[8].strip(), tuple(before)))
+            before = []
+        if before:
+            self.footer = "".join(f"{block}\n\n" for block in before)
+
+    def parse_ass(self, lines):
+        header = []
+        before = []
+        fields = None
+        in_events = False
+        after_events = False
+        for line in lines:
+            stripped = line.strip()
+            if after_events:
+                before.append(line)
+            elif stripped.startswith("[") and stripped.endswith("]"):
+                if in_events:
+                    after_events = True
+                    before += ["", line]
+                    continue
+                in_events = stripped.lower() == "[events]"
+                header.append(line)
+            elif not in_events:
+                header.append(line)
+            elif fields is None:
+                header.append(line)
+                if stripped.lower().startswith("format:"):
+                    fields = [field.strip() for field in stripped.split(":", 1)[1].split(",")]
+                    self.header = "\n".join(header) + "\n"
+            elif stripped.startswith("Dialogue:"):
+                values = line.split(":", 1)[1].lstrip().split(",", len(fields) - 1)
+                if len(values) < len(fields):
+                    before.append(line)
+                    continue
+                cue = dict(zip(fields, values))
+                start, end = ASS_TIME.match(cue["Start"]), ASS_TIME.match(cue["End"])
+                if not start or not end:
+                    before.append(line)
+                    continue
+                text = cue["Text"].replace("\\N", "\n")
+                yield (to_ms(*start.groups()), to_ms(*end.groups()), text, (values, fields, tuple(before)))
+                before = []
+            elif stripped:
+                before.append(line)
+        if fields is None:
+            self.header = "\n".join(header) + "\n"
+        self.footer = "".join(f"{line}\n" for line in before)
+
+def prepend(first, lines):
+    yield first
+    yield from lines
+
+class SubtitleDocument:
+    """The cues of a subtitle file: timings as two arrays of milliseconds, texts and per-cue extras as lists.
+
+    ``extras`` holds ``None`` for every SRT cue, so a file costs little
+    more than its texts; ``header``, ``footer`` and the extras let
+    ``SubtitleWriter`` write it back in its own format.
+    """
+
+    def __init__(self, format="srt", header="", footer=""):
+        self.format = format
+        self.header = header
+        self.footer = footer
+        self.starts = array('q')
+        self.ends = array('q')
+        self.texts = []
+        self.extras = []
+
+    def append(self, start, end, text, extra=None):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.texts.append(text)
+        self.extras.append(extra)
+
+    def __len__(self):
+        return len(self.texts)
+
+def read_subtitles(path, format=None):
+    reader = SubtitleReader(path, format)
+    document = SubtitleDocument()
+    for cue in reader:
+        document.append(*cue)
+    document.format = reader.format
+    document.header = reader.header
+    document.footer = reader.footer
+    return document
+
+class SubtitleWriter:
+    """Writes a document's cues to ``path`` in order, a run of finished rows at a time.
+
+    ``write_until(row, texts)`` appends every cue before ``row`` not
+    written yet, with its text from ``texts`` (falling back to the source
+    text where that is None); ``finish`` writes the rest and the footer.
+    The cues go to ``{path}.part``, which replaces ``path`` once complete,
+    so a cancelled run never leaves a truncated file under the real name.
+    The output format follows ``path``'s extension; the source's header
+    and per-cue extras are kept when it is the same as the document's.
+    """
+
+    def __init__(self, document, path, format=None):
+        self.document = document
+        self.path = path
+        self.format = format or format_for_path(path) or document.format
+        self.same_format = self.format == document.format
+        self.part_path = f"{path}.part"
+        self.next_row = 0
+        if self.same_format and document.header:
+            header = document.header
+        else:
+            header = {"srt": "", "vtt": "WEBVTT\n\n", "ass": DEFAULT_ASS_HEADER}[self.format]
+        with open(self.part_path, "w", encoding="utf-8") as f:
+            f.write(header)
+
+    def format_cue(self, row, text):
+        document = self.document
+        start, end = document.starts[row], document.ends[row]
+        extra = document.extras[row] if self.same_format else None
+        if self.format == "srt":
+            return f"{row + 1}\n{srt_time(start)} --> {srt_time(end)}\n{text}\n\n"
+        if self.format == "vtt":
+            identifier, settings, before = extra or (None, "", ())
+            lines = [f"{block}\n\n" for block in before]
+            if identifier:
+                lines.append(f"{identifier}\n")
+            lines.append(f"{vtt_time(start)} --> {vtt_time(end)}{' ' + settings if settings else ''}\n{text}\n\n")
+            return "".join(lines)
+        values, fields, before = extra or (None, ASS_FIELDS, ())
+        cue = dict(zip(fields, values)) if values else {"Layer": "0", "Style": "Default", "MarginL": "0",
+                                                        "MarginR": "0", "MarginV": "0"}
+        cue.update(Start=ass_time(start), End=ass_time(end), Text=text.replace("\n", "\\N"))
+        line = "Dialogue: " + ",".join(cue.get(field, "") for field in fields)
+        return "".join(f"{other}\n" for other in before) + line + "\n"
+
+    def write_until(self, row, texts):
+        row = min(row, len(self.document))
+        if row <= self.next_row:
+            return
+        sources = self.document.texts
+        with open(self.part_path, "a", encoding="utf-8") as f:
+            for i in range(self.next_row, row):
+                text = texts[i] if texts[i] is not None else sources[i]
+                f.write(self.format_cue(i, text if text is not None else ""))
+        self.next_row = row
+
+    def finish(self, texts):
+        self.write_until(len(self.document), texts)
+        if self.same_format and self.document.footer:
+            with open(self.part_path, "a", encoding="utf-8") as f:
+                f.write(self.document.footer)
+        os.replace(self.part_path, self.path)
+
+    def discard(self):
+        try:
+            os.remove(self.part_path)
+        except OSError:
+            pass
+
+def write_subtitles(document, path, texts=None, format=None):
+    """Write ``document`` to ``path`` with ``texts`` in place of its own where they are not None."""
+    writer = SubtitleWriter(document, path, format)
+    writer.finish(texts if texts is not None else document.texts)
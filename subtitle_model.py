@@ -0,0 +1,114 @@
+from array import array
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+from subtitle_io import SubtitleDocument, parse_time, srt_time, write_subtitles
+
+TIME_COLUMN, ORIGINAL_COLUMN, TRANSLATED_COLUMN = range(3)
+HEADERS = ["Time", "Original", "Translated"]
+UPDATE_INTERVAL_MS = 100
+
+class SubtitleTableModel(QAbstractTableModel):
+    """The cues of one subtitle file for a ``QTableView``.
+
+    Timings are the two arrays of milliseconds of the loaded
+    ``SubtitleDocument`` and texts are plain lists, so a file with tens of thousands of cues costs a few objects per cue
+    instead of three widget items; the time column is formatted only for
+    the rows the view paints. ``set_translations`` takes a whole batch of
+    results and reports it with one ``dataChanged``; ``queue_translations``
+    gathers the batches that arrive within ``UPDATE_INTERVAL_MS`` (streamed
+    replies come a few cues at a time) into one such update.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.document = SubtitleDocument()
+        self.starts = array('q')
+        self.ends = array('q')
+        self.originals = []
+        self.translations = []
+        self.pending = []
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(UPDATE_INTERVAL_MS)
+        self.update_timer.timeout.connect(self.flush_translations)
+
+    def load(self, document):
+        self.update_timer.stop()
+        self.pending = []
+        self.beginResetModel()
+        self.document = document
+        self.starts = document.starts
+        self.ends = document.ends
+        self.originals = document.texts
+        self.translations = [""] * len(self.originals)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.originals)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        row = index.row()
+        column = index.column()
+        if column == TIME_COLUMN:
+            return f"{srt_time(self.starts[row])} --> {srt_time(self.ends[row])}"
+        if column == ORIGINAL_COLUMN:
+            return self.originals[row]
+        return self.translations[row]
+
+    def flags(self, index):
+        return super().flags(index) | Qt.ItemIsEditable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        row = index.row()
+        column = index.column()
+        if column == TIME_COLUMN:
+            try:
+                start, end = value.split(' --> ')
+                self.starts[row] = parse_time(start)
+                self.ends[row] = parse_time(end)
+            except ValueError:
+                return False
+        elif column == ORIGINAL_COLUMN:
+            self.originals[row] = value
+        else:
+            self.translations[row] = value
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def set_translations(self, rows):
+        """Store a batch of ``(row, text)`` results and repaint them with a single ``dataChanged``."""
+        if not rows:
+            return
+        for row, text in rows:
+            self.translations[row] = text
+        first = min(row for row, _ in rows)
+        last = max(row for row, _ in rows)
+        self.dataChanged.emit(self.index(first, TRANSLATED_COLUMN), self.index(last, TRANSLATED_COLUMN), [Qt.DisplayRole])
+
+    def queue_translations(self, rows):
+        self.pending.extend(rows)
+        if not self.update_timer.isActive():
+            self.update_timer.start()
+
+    def flush_translations(self):
+        self.update_timer.stop()
+        rows, self.pending = self.pending, []
+        self.set_translations(rows)
+
+    def save(self, path, translations=None):
+        """Write the cues with this model's timings and ``translations`` (default: the Translated column),
+        falling back to the original text, in the format of ``path``'s extension."""
+        self.flush_translations()
+        translations = self.translations if translations is None else translations
+        write_subtitles(self.document, path, [text or None for text in translations])
@@ -0,0 +1,527 @@
+import gzip
+import hashlib
+import json
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from xml.etree.ElementTree import iterparse
+from xml.sax.saxutils import escape, quoteattr
+import storage
+from normalize import normalize_text
+
+ENTRY_OVERHEAD = 100
+SQLITE_MAX_VARIABLES = 500
+KEY_BYTES = 16
+COMPRESS_MIN_BYTES = 64
+# Keys of the old "{language}:{text}" table did not record the prompt; it was the one before versioning.
+LEGACY_PROMPT_VERSION = 1
+MIGRATION_CHUNK = 5000
+# Entries written per transaction by an import
+TRANSFER_CHUNK = 5000
+TRANSFER_FORMATS = ("jsonl", "tmx")
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+def cache_scope(language, model, prompt_version):
+    """What a translation depends on besides its source text: ``(language, model, prompt_version)``."""
+    return (language, model or "", prompt_version)
+
+def make_cache_key(scope, text):
+    """Fixed-size key of a normalized source text translated within ``scope``."""
+    language, model, prompt_version = scope
+    return hashlib.blake2b(f"{prompt_version}\x1f{model}\x1f{language}\x1f{text}".encode("utf-8"),
+                           digest_size=KEY_BYTES).digest()
+
+def pack_text(text):
+    """zlib-compressed bytes if that is smaller, otherwise the text itself; SQLite keeps the two apart by type."""
+    data = text.encode("utf-8")
+    if len(data) >= COMPRESS_MIN_BYTES:
+        packed = zlib.compress(data, 9)
+        if len(packed) < len(data):
+            return packed
+    return text
+
+def unpack_text(value):
+    return zlib.decompress(value).decode("utf-8") if isinstance(value, bytes) else value
+
+def create_cache_tables(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS cache_scopes
+                    (scope_id INTEGER PRIMARY KEY, language TEXT, model TEXT, prompt_version INTEGER,
+                     UNIQUE (language, model, prompt_version))''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS cache_entries
+                    (cache_key BLOB PRIMARY KEY, scope_id INTEGER, source_text, translated_text) WITHOUT ROWID''')
+
+def scope_id(conn, scope):
+    conn.execute("INSERT OR IGNORE INTO cache_scopes (language, model, prompt_version) VALUES (?, ?, ?)", scope)
+    return conn.execute("SELECT scope_id FROM cache_scopes WHERE language = ? AND model = ? AND prompt_version = ?",
+                        scope).fetchone()[0]
+
+def migrate_legacy_cache(conn, model):
+    """Move entries of the old ``translation_cache`` table, keyed by ``"{language}:{text}"``, to hashed keys.
+
+    The old entries hold cues as they were in the file; their source and
+    translation are reduced with ``normalize_text``, as the engine stores
+    them now, so that the cues are found again. The old keys did not record
+    the model, so they are filed under ``model``, the one configured when
+    the table is migrated. The translation memory's tables refer to the old
+    keys and are dropped; it indexes the migrated entries again. Returns the
+    number of entries moved.
+    """
+    legacy_table = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'translation_cache'"
+    if not conn.execute(legacy_table).fetchone():
+        return 0
+    # Another process opening the cache at the same time may have migrated it while this one waited for the lock
+    conn.execute("BEGIN IMMEDIATE")
+    if not conn.execute(legacy_table).fetchone():
+        conn.commit()
+        return 0
+    create_cache_tables(conn)
+    scope_ids = {}
+    moved = 0
+    last_rowid = 0
+    while True:
+        rows = conn.execute("SELECT rowid, cache_key, translated_text FROM translation_cache WHERE rowid > ? "
+                            "ORDER BY rowid LIMIT ?", (last_rowid, MIGRATION_CHUNK)).fetchall()
+        if not rows:
+            break
+        last_rowid = rows[-1][0]
+        entries = []
+        for _, key, translated_text in rows:
+            language, separator, text = key.partition(":")
+            if not separator or translated_text is None:
+                continue
+            text = normalize_text(text)[0]
+            translated_text = normalize_text(translated_text)[0]
+            if not text or not translated_text:
+                continue
+            scope = cache_scope(language, model, LEGACY_PROMPT_VERSION)
+            if scope not in scope_ids:
+                scope_ids[scope] = scope_id(conn, scope)
+            entries.append((make_cache_key(scope, text), scope_ids[scope], pack_text(text), pack_text(translated_text)))
+        conn.executemany("INSERT OR IGNORE INTO cache_entries (cache_key, scope_id, source_text, translated_text) "
+                         "VALUES (?, ?, ?, ?)", entries)
+        moved += len(entries)
+    conn.execute("DROP TABLE translation_cache")
+    conn.execute("DROP TABLE IF EXISTS tm_buckets")
+    conn.execute("DROP TABLE IF EXISTS tm_entries")
+    conn.commit()
+    return moved
+
+class LRUTranslationCache:
+    """Translation cache bounded by an approximate memory budget.
+
+    The least recently used entries are evicted once the estimated size of
+    keys and values exceeds ``budget_bytes``. Lookups through ``get`` are
+    counted as hits or misses; see ``stats``.
+    """
+
+    def __init__(self, budget_bytes=64 * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.entries = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def entry_cost(key, value):
+        return sys.getsizeof(key) + sys.getsizeof(value) + ENTRY_OVERHEAD
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return default
+
+    def get_many(self, keys):
+        """Return a dict with the cached translations for whichever of ``keys`` are present."""
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store(key, value)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def store(self, key, value, scope=None, source_text=None):
+        with self.lock:
+            if key in self.entries:
+                self.size_bytes -= self.entry_cost(key, self.entries.pop(key))
+            self.entries[key] = value
+            self.size_bytes += self.entry_cost(key, value)
+            while self.size_bytes > self.budget_bytes and len(self.entries) > 1:
+                old_key, old_value = self.entries.popitem(last=False)
+                self.size_bytes -= self.entry_cost(old_key, old_value)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "size_bytes": self.size_bytes,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+class SQLiteTranslationCache(LRUTranslationCache):
+    """Translation cache stored in the ``cache_entries`` table.
+
+    Entries are keyed by ``make_cache_key``: a 16-byte hash of the target
+    language, model, prompt version and normalized source, so a change of
+    model or prompt never serves an old translation. Each entry points to
+    its ``cache_scopes`` row, which keeps those three in the clear for
+    ``invalidate``, and holds the source and translation, compressed when
+    that makes them smaller.
+
+    Nothing is loaded up front: lookups are answered from the in-memory LRU
+    front cache and the remaining keys are fetched with one indexed
+    ``WHERE cache_key IN (...)`` query per batch. New entries are written
+    behind: they are kept in a dirty set and written with one
+    ``executemany`` once ``flush_size`` entries are pending or
+    ``flush_interval`` seconds have passed since the last write. Call
+    ``flush`` when a run stops or finishes so nothing is left behind.
+    A database from before hashed keys is migrated when opened, its
+    entries filed under ``legacy_model``.
+
+    Several processes can share the file: each write is one short
+    transaction, and a writer waits for another's lock (see
+    ``storage.connect``). ``export`` and ``import_entries`` move entries to
+    and from another database as JSONL or TMX, a chunk at a time.
+    """
+
+    def __init__(self, db_path=None, budget_bytes=64 * 1024 * 1024, flush_size=500, flush_interval=5.0, legacy_model=""):
+        super().__init__(budget_bytes)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.dirty = {}
+        self.scope_ids = {}
+        self.last_flush = time.monotonic()
+        self.db_path = db_path or storage.DB_PATH
+        self.conn = storage.connect(self.db_path, check_same_thread=False)
+        create_cache_tables(self.conn)
+        migrate_legacy_cache(self.conn, legacy_model)
+        self.conn.commit()
+
+    def get_many(self, keys):
+        with self.lock:
+            keys = list(dict.fromkeys(keys))
+            found = {}
+            missing = []
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    found[key] = self.entries[key]
+                elif key in self.dirty:
+                    found[key] = self.dirty[key][0]
+                else:
+                    missing.append(key)
+            for i in range(0, len(missing), SQLITE_MAX_VARIABLES):
+                chunk = missing[i:i + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                cursor = self.conn.execute(f"SELECT cache_key, translated_text FROM cache_entries WHERE cache_key IN ({placeholders})", chunk)
+                for key, value in cursor:
+                    value = unpack_text(value)
+                    found[key] = value
+                    super().store(key, value)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+            return found
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def store(self, key, value, scope=None, source_text=None):
+        with self.lock:
+            super().store(key, value)
+            self.dirty[key] = (value, scope, source_text)
+            due = (len(self.dirty) >= self.flush_size
+                   or time.monotonic() - self.last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.dirty:
+                rows = []
+                for key, (value, scope, source_text) in self.dirty.items():
+                    if scope is not None and scope not in self.scope_ids:
+                        self.scope_ids[scope] = scope_id(self.conn, scope)
+                    rows.append((key, self.scope_ids.get(scope), None if source_text is None else pack_text(source_text),
+                                 pack_text(value)))
+                self.conn.executemany("INSERT OR REPLACE INTO cache_entries (cache_key, scope_id, source_text, translated_text) "
+                                      "VALUES (?, ?, ?, ?)", rows)
+                self.conn.commit()
+                self.dirty.clear()
+            self.last_flush = time.monotonic()
+
+    def clear(self):
+        with self.lock:
+            super().clear()
+            self.dirty.clear()
+            self.scope_ids.clear()
+            self.conn.execute("DELETE FROM cache_entries")
+            self.conn.execute("DELETE FROM cache_scopes")
+            self.conn.commit()
+
+    def scopes(self):
+        """``(language, model, prompt_version, entries)`` for every scope with entries."""
+        with self.lock:
+            self.flush()
+            return self.conn.execute('''SELECT language, model, prompt_version, COUNT(*) FROM cache_scopes
+                                        JOIN cache_entries USING (scope_id)
+                                        GROUP BY scope_id ORDER BY language, model, prompt_version''').fetchall()
+
+    def invalidate(self, language=None, model=None, prompt_version=None, before_version=None):
+        """Delete the entries of every scope matching the given language, model and prompt version
+        (or any version older than ``before_version``); returns how many were deleted."""
+        conditions, params = [], []
+        for column, value in (("language", language), ("model", model), ("prompt_version", prompt_version)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if before_version is not None:
+            conditions.append("prompt_version < ?")
+            params.append(before_version)
+        where = " AND ".join(conditions) or "1"
+        from translation_memory import forget_entries
+        with self.lock:
+            self.flush()
+            scope_ids = [row[0] for row in self.conn.execute(f"SELECT scope_id FROM cache_scopes WHERE {where}", params)]
+            deleted = 0
+            for i in range(0, len(scope_ids), SQLITE_MAX_VARIABLES):
+                chunk = scope_ids[i:i + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                # Keys of deleted entries would otherwise take the places of live ones among the memory's candidates
+                forget_entries(self.conn, f"cache_entries.scope_id IN ({placeholders})", chunk)
+                deleted += self.conn.execute(f"DELETE FROM cache_entries WHERE scope_id IN ({placeholders})", chunk).rowcount
+                self.conn.execute(f"DELETE FROM cache_scopes WHERE scope_id IN ({placeholders})", chunk)
+            self.conn.commit()
+            self.scope_ids.clear()
+            # Keys are hashes, so the front cache cannot tell which scope an entry belongs to
+            super().clear()
+            return deleted
+
+    def iter_entries(self, language=None, model=None, prompt_version=None):
+        """Yield ``(language, model, prompt_version, source, translation)`` for the matching entries with a source.
+
+        Reads through its own connection, so lookups and writes of a running
+        translation are not held up meanwhile.
+        """
+        self.flush()
+        conditions, params = ["source_text IS NOT NULL"], []
+        for column, value in (("language", language), ("model", model), ("prompt_version", prompt_version)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        conn = storage.connect(self.db_path)
+        try:
+            cursor = conn.execute(f'''SELECT language, model, prompt_version, source_text, translated_text
+                                       FROM cache_entries JOIN cache_scopes USING (scope_id)
+                                       WHERE {" AND ".join(conditions)}''', params)
+            for language, model, prompt_version, source_text, translated_text in cursor:
+                yield language, model, prompt_version, unpack_text(source_text), unpack_text(translated_text)
+        finally:
+            conn.close()
+
+    def export(self, f, format="jsonl", source_language="en", **filters):
+        """Write the entries matching ``filters`` (see ``iter_entries``) to the text file ``f``; returns how many."""
+        writer = write_tmx if format == "tmx" else write_jsonl
+        return writer(self.iter_entries(**filters), f, source_language)
+
+    def import_entries(self, entries, replace=False):
+        """Add ``(language, model, prompt_version, source, translation)`` entries, ``TRANSFER_CHUNK`` per transaction.
+
+        Sources are normalized like the engine's, so the cues are found
+        again; translations are stored as they come, as exported. Entries
+        already cached are kept unless ``replace``. Returns how many were
+        added or replaced.
+        """
+        verb = "REPLACE" if replace else "IGNORE"
+        imported = 0
+        chunk = []
+        for language, model, prompt_version, source_text, translated_text in entries:
+            source_text = normalize_text(source_text)[0]
+            if source_text and translated_text:
+                chunk.append((cache_scope(language, model, int(prompt_version)), source_text, translated_text))
+            if len(chunk) >= TRANSFER_CHUNK:
+                imported += self.insert_entries(chunk, verb)
+                chunk = []
+        if chunk:
+            imported += self.insert_entries(chunk, verb)
+        if replace:
+            with self.lock:
+                super().clear()
+        return imported
+
+    def insert_entries(self, chunk, verb):
+        with self.lock:
+            self.flush()
+            rows = []
+            for scope, source_text, translated_text in chunk:
+                if scope not in self.scope_ids:
+                    self.scope_ids[scope] = scope_id(self.conn, scope)
+                rows.append((make_cache_key(scope, source_text), self.scope_ids[scope], pack_text(source_text),
+                             pack_text(translated_text)))
+            if verb == "REPLACE":
+                # The memory indexes replaced entries again when it is next opened
+                from translation_memory import forget_entries
+                for i in range(0, len(rows), SQLITE_MAX_VARIABLES):
+                    keys = [row[0] for row in rows[i:i + SQLITE_MAX_VARIABLES]]
+                    forget_entries(self.conn, f"cache_entries.cache_key IN ({','.join('?' * len(keys))})", keys)
+            cursor = self.conn.executemany(f"INSERT OR {verb} INTO cache_entries "
+                                           "(cache_key, scope_id, source_text, translated_text) VALUES (?, ?, ?, ?)", rows)
+            self.conn.commit()
+            return cursor.rowcount
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.conn.close()
+
+def transfer_format(path, format=None):
+    """``format``, or the one ``path``'s extension (before any ``.gz``) names: TMX for ``.tmx``, otherwise JSONL."""
+    if format:
+        return format
+    name = path.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return "tmx" if name.endswith(".tmx") else "jsonl"
+
+def open_transfer_file(path, mode):
+    """``path`` opened as UTF-8 text for ``mode`` "r" or "w"; ``-`` is standard input or output, ``.gz`` is gzip."""
+    if path == "-":
+        stream = sys.stdin if mode == "r" else sys.stdout
+        return open(stream.fileno(), mode, encoding="utf-8", closefd=False)
+    if path.lower().endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def write_jsonl(entries, f, source_language=None):
+    """One JSON object per entry and line; returns the number written."""
+    count = 0
+    for language, model, prompt_version, source_text, translated_text in entries:
+        f.write(json.dumps({"language": language, "model": model, "prompt_version": prompt_version,
+                            "source": source_text, "translation": translated_text}, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+def read_jsonl(f, model="", prompt_version=LEGACY_PROMPT_VERSION):
+    """Entries of a JSONL export; ``model`` and ``prompt_version`` stand in for missing ones. Raises ValueError."""
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+            yield (entry["language"], entry.get("model", model), entry.get("prompt_version", prompt_version),
+                   entry["source"], entry["translation"])
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Invalid entry on line {line_number}: {e}")
+
+def write_tmx(entries, f, source_language="en"):
+    """A TMX 1.4 document with one ``<tu>`` per entry; returns the number written.
+
+    The exact language name, model and prompt version are kept in
+    ``x-subai-*`` properties, so an import restores the same cache keys.
+    """
+    from engine import lang_prefix
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n<tmx version="1.4">\n'
+            '<header creationtool="SubAI" creationtoolversion="1" datatype="plaintext" segtype="block" '
+            f'adminlang="en" srclang={quoteattr(source_language)} o-tmf="SubAI"/>\n<body>\n')
+    count = 0
+    for language, model, prompt_version, source_text, translated_text in entries:
+        f.write(f'<tu><prop type="x-subai-language">{escape(language)}</prop>'
+                f'<prop type="x-subai-model">{escape(model)}</prop>'
+                f'<prop type="x-subai-prompt-version">{prompt_version}</prop>'
+                f'<tuv xml:lang={quoteattr(source_language)}><seg>{escape(source_text)}</seg></tuv>'
+                f'<tuv xml:lang={quoteattr(lang_prefix(language))}><seg>{escape(translated_text)}</seg></tuv></tu>\n')
+        count += 1
+    f.write("</body>\n</tmx>\n")
+    return count
+
+def read_tmx(f, model="", prompt_version=LEGACY_PROMPT_VERSION, source_language=None):
+    """Entries of a TMX file, one per target ``<tuv>`` of each ``<tu>``, parsed as it is read.
+
+    The source is the ``<tuv>`` in ``source_language``, or else the unit's
+    or header's ``srclang``, or else the first one. Target languages come
+    from the ``x-subai-language`` property or are mapped back from their
+    codes; ``model`` and ``prompt_version`` stand in for missing properties.
+    """
+    from engine import LANG_CODES
+    names = {code: name for name, code in LANG_CODES.items()}
+    header_language = None
+    body = None
+    for event, element in iterparse(f, events=("start", "end")):
+        if event == "start":
+            if element.tag == "body":
+                body = element
+            continue
+        if element.tag == "header":
+            header_language = element.get("srclang")
+        if element.tag != "tu":
+            continue
+        props = {prop.get("type"): prop.text or "" for prop in element.findall("prop")}
+        variants = [((tuv.get(XML_LANG) or tuv.get("lang") or "").lower(), "".join(tuv.find("seg").itertext()))
+                    for tuv in element.findall("tuv") if tuv.find("seg") is not None]
+        unit_language = (source_language or element.get("srclang") or header_language or "").lower()
+        source = next((variant for variant in variants if variant[0] == unit_language), variants[0] if variants else None)
+        for variant in variants:
+            if variant is source:
+                continue
+            language = props.get("x-subai-language") or names.get(variant[0].split("-")[0], variant[0])
+            yield (language, props.get("x-subai-model", model), props.get("x-subai-prompt-version", prompt_version),
+                   source[1], variant[1])
+        # Units are dropped once read, so memory stays flat however long the file is
+        if body is not None:
+            body.clear()
+
+def read_entries(f, format, model="", prompt_version=LEGACY_PROMPT_VERSION, source_language=None):
+    """Entries of a JSONL or TMX file ``f``; raises ValueError for a malformed one."""
+    if format == "jsonl":
+        yield from read_jsonl(f, model, prompt_version)
+        return
+    try:
+        yield from read_tmx(f, model, prompt_version, source_language)
+    except SyntaxError as e:
+        raise ValueError(f"Invalid TMX: {e}")
+
+def open_translation_cache(config):
+    """Return the cache for the configured mode: in-memory for RAM, SQLite-backed for File, None for None."""
+    cache_mode = config.get('cache_mode', 'RAM')
+    budget_bytes = int(float(config.get('cache_budget_mb', '64')) * 1024 * 1024)
+    if cache_mode == "File":
+        return SQLiteTranslationCache(budget_bytes=budget_bytes, legacy_model=config.get('model', ''))
+    if cache_mode == "RAM":
+        return LRUTranslationCache(budget_bytes)
+    return None
@@ -0,0 +1,302 @@
+import difflib
+import hashlib
+import re
+import sqlite3
+import struct
+import threading
+import time
+from collections import Counter
+import storage
+from translation_cache import create_cache_tables, unpack_text
+
+BANDS = 8
+ROWS = 4
+SHINGLE = 3
+MIN_LENGTH = 10
+MAX_CANDIDATES = 20
+CONTRACTIONS = ((re.compile(r"n't\b"), " not"), (re.compile(r"'re\b"), " are"), (re.compile(r"'m\b"), " am"),
+                (re.compile(r"'ll\b"), " will"), (re.compile(r"'ve\b"), " have"), (re.compile(r"'s\b"), " is"),
+                (re.compile(r"'d\b"), " would"))
+NON_WORD = re.compile(r"[^\w\s]+")
+SPACES = re.compile(r"\s+")
+DIGITS = re.compile(r"\d+")
+END_PUNCTUATION = re.compile(r"([.?!…]+)\s*$")
+
+def fuzzy_key(text):
+    """Lower-cased text with English contractions spelled out and punctuation removed."""
+    text = text.lower().replace("’", "'")
+    for pattern, replacement in CONTRACTIONS:
+        text = pattern.sub(replacement, text)
+    return SPACES.sub(" ", NON_WORD.sub(" ", text)).strip()
+
+def signature(key):
+    """MinHash of the character trigrams of ``key``: ``BANDS * ROWS`` 16-bit minimums.
+
+    One 64-byte BLAKE2b digest per trigram gives all 32 hash values at once.
+    """
+    padded = f" {key} ".encode("utf-8")
+    shingles = {padded[i:i + SHINGLE] for i in range(max(1, len(padded) - SHINGLE + 1))}
+    return list(map(min, *(struct.unpack("32H", hashlib.blake2b(shingle, digest_size=64).digest()) for shingle in shingles)))
+
+def band_buckets(scope, key):
+    """One 63-bit bucket per band; texts of the same cache scope sharing any bucket with a query are its candidates."""
+    values = signature(key)
+    prefix = "|".join(map(str, scope))
+    buckets = []
+    for band in range(BANDS):
+        data = f"{prefix}|{band}|".encode("utf-8") + struct.pack(f"{ROWS}H", *values[band * ROWS:(band + 1) * ROWS])
+        buckets.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big") >> 1)
+    return buckets
+
+def similarity(key, other, threshold=0.0):
+    """0..1 likeness of two fuzzy keys, or 0 once it is clear to be below ``threshold``; texts with different numbers never match."""
+    if key == other:
+        return 1.0
+    if DIGITS.findall(key) != DIGITS.findall(other):
+        return 0.0
+    matcher = difflib.SequenceMatcher(None, key, other, autojunk=False)
+    if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+        return 0.0
+    return matcher.ratio()
+
+def adapt_translation(text, matched_text, translation):
+    """Give a reused translation the final punctuation of ``text`` where it differs from the matched text's."""
+    ending = END_PUNCTUATION.search(text)
+    matched_ending = END_PUNCTUATION.search(matched_text)
+    translated_ending = END_PUNCTUATION.search(translation)
+    ending = ending.group(1) if ending else ""
+    matched_ending = matched_ending.group(1) if matched_ending else ""
+    if ending == matched_ending or not translated_ending or translated_ending.group(1) != matched_ending:
+        return translation
+    return translation[:translated_ending.start(1)] + ending
+
+def forget_entries(conn, condition, params=(), chunk_size=2000):
+    """Delete the memory's entries for the cache entries matching ``condition`` (SQL on ``cache_entries``).
+
+    Call it before the cache entries themselves are deleted or replaced,
+    in the same transaction; the caller commits. Buckets are worked out
+    again from the source text, so each is deleted through its primary key.
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tm_entries'").fetchone():
+        return
+    scopes = {scope_id: (language, model, prompt_version) for scope_id, language, model, prompt_version
+              in conn.execute("SELECT scope_id, language, model, prompt_version FROM cache_scopes")}
+    while True:
+        rows = conn.execute(f'''SELECT tm_entries.entry_id, tm_entries.source_text, cache_entries.scope_id
+                                FROM tm_entries JOIN cache_entries ON tm_entries.cache_key = cache_entries.cache_key
+                                WHERE {condition} LIMIT ?''', (*params, chunk_size)).fetchall()
+        if not rows:
+            break
+        buckets = []
+        for entry_id, text, scope_id in rows:
+            key = fuzzy_key(text or "")
+            if len(key) >= MIN_LENGTH and scope_id in scopes:
+                buckets.extend((bucket, entry_id) for bucket in band_buckets(scopes[scope_id], key))
+        conn.executemany("DELETE FROM tm_buckets WHERE bucket = ? AND entry_id = ?", buckets)
+        conn.executemany("DELETE FROM tm_entries WHERE entry_id = ?", [(entry_id,) for entry_id, _, _ in rows])
+
+class TranslationMemory:
+    """Finds cached translations of near-identical lines in the same cache scope (language, model and prompt).
+
+    Each source text is indexed by a MinHash signature of its character
+    trigrams, split into ``BANDS`` buckets (locality-sensitive hashing), so
+    a lookup only compares the query with texts sharing a bucket, however
+    many entries there are. Candidates are compared after ``fuzzy_key``
+    (case, punctuation and contractions ignored), and the best one at or
+    above ``threshold`` is returned. Lines shorter than ``MIN_LENGTH`` are
+    left to the exact cache. At most ``max_entries`` texts are indexed.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=200000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.buckets = {}
+        self.entries = {}
+        self.hits = 0
+        self.lock = threading.RLock()
+
+    def add(self, cache_key, scope, text):
+        key = fuzzy_key(text)
+        if len(key) < MIN_LENGTH:
+            return
+        with self.lock:
+            if cache_key in self.entries or len(self.entries) >= self.max_entries:
+                return
+            self.entries[cache_key] = (cache_key, text, key)
+            for bucket in band_buckets(scope, key):
+                self.buckets.setdefault(bucket, []).append(cache_key)
+
+    def candidates(self, buckets):
+        """The ``MAX_CANDIDATES`` entries sharing the most buckets with a query, as ``(cache_key, text, fuzzy key)``."""
+        with self.lock:
+            shared = Counter()
+            for bucket in buckets:
+                shared.update(self.buckets.get(bucket, ()))
+            return [self.entries[cache_key] for cache_key, _ in shared.most_common(MAX_CANDIDATES)]
+
+    def find(self, scope, text):
+        """Return ``(cache_key, matched_text, score)`` of the closest entry, or None."""
+        key = fuzzy_key(text)
+        if len(key) < MIN_LENGTH or not self:
+            return None
+        best = None
+        for cache_key, matched_text, matched_key in self.candidates(band_buckets(scope, key)):
+            score = similarity(key, matched_key, self.threshold)
+            if score >= self.threshold and (best is None or score > best[2]):
+                best = (cache_key, matched_text, score)
+        if best:
+            with self.lock:
+                self.hits += 1
+        return best
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+            self.entries.clear()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class SQLiteTranslationMemory(TranslationMemory):
+    """Translation memory kept next to the cache's ``cache_entries`` table.
+
+    Buckets live in an indexed table, so a lookup is a single query over
+    ``BANDS`` bucket values. New entries are written behind like the
+    cache's. Cache entries from before the memory existed are indexed by a
+    background thread when it is opened; lookups see them as they are
+    added.
+    """
+
+    def __init__(self, db_path=None, threshold=0.95, flush_interval=5.0):
+        super().__init__(threshold, max_entries=None)
+        self.db_path = db_path or storage.DB_PATH
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.conn = storage.connect(self.db_path, check_same_thread=False)
+        create_cache_tables(self.conn)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS tm_entries
+                             (entry_id INTEGER PRIMARY KEY, cache_key BLOB UNIQUE, source_text TEXT)''')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS tm_buckets
+                             (bucket INTEGER, entry_id INTEGER, PRIMARY KEY (bucket, entry_id)) WITHOUT ROWID''')
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COUNT(*) FROM tm_entries").fetchone()[0]
+        self.closed = threading.Event()
+        self.indexer = threading.Thread(target=self.index_cache, daemon=True)
+        self.indexer.start()
+
+    @staticmethod
+    def insert_entries(conn, entries):
+        """Insert ``(cache_key, text, buckets)`` entries not indexed yet; return how many were new."""
+        cursor = conn.cursor()
+        added = 0
+        for cache_key, text, buckets in entries:
+            cursor.execute("INSERT OR IGNORE INTO tm_entries (cache_key, source_text) VALUES (?, ?)", (cache_key, text))
+            if cursor.rowcount:
+                entry_id = cursor.lastrowid
+                cursor.executemany("INSERT OR IGNORE INTO tm_buckets (bucket, entry_id) VALUES (?, ?)",
+                                   [(bucket, entry_id) for bucket in buckets])
+                added += 1
+        conn.commit()
+        return added
+
+    def index_cache(self, chunk_size=2000):
+        """Index the cache entries that are not in the memory yet."""
+        conn = storage.connect(self.db_path)
+        try:
+            scopes = {scope_id: (language, model, prompt_version) for scope_id, language, model, prompt_version
+                      in conn.execute("SELECT scope_id, language, model, prompt_version FROM cache_scopes")}
+            last_key = b""
+            while not self.closed.is_set():
+                rows = conn.execute('''SELECT cache_key, scope_id, source_text FROM cache_entries WHERE cache_key > ?
+                                       AND cache_key NOT IN (SELECT cache_key FROM tm_entries)
+                                       ORDER BY cache_key LIMIT ?''', (last_key, chunk_size)).fetchall()
+                if not rows:
+                    break
+                last_key = rows[-1][0]
+                entries = []
+                for cache_key, scope_id, source_text in rows:
+                    if source_text is None or scope_id not in scopes:
+                        entries.append((cache_key, "", []))
+                        continue
+                    # Short texts are entered without buckets so they are not scanned again next time
+                    text = unpack_text(source_text)
+                    key = fuzzy_key(text)
+                    entries.append((cache_key, text, band_buckets(scopes[scope_id], key) if len(key) >= MIN_LENGTH else []))
+                added = self.insert_entries(conn, entries)
+                with self.lock:
+                    self.size += added
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.close()
+
+    def add(self, cache_key, scope, text):
+        key = fuzzy_key(text)
+        if len(key) < MIN_LENGTH:
+            return
+        with self.lock:
+            self.pending.append((cache_key, text, band_buckets(scope, key)))
+            due = time.monotonic() - self.last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.pending:
+                self.size += self.insert_entries(self.conn, self.pending)
+                self.pending = []
+            self.last_flush = time.monotonic()
+
+    def candidates(self, buckets):
+        with self.lock:
+            placeholders = ",".join("?" * len(buckets))
+            cursor = self.conn.execute(f'''SELECT cache_key, source_text FROM tm_entries
+                                           WHERE entry_id IN (SELECT entry_id FROM tm_buckets WHERE bucket IN ({placeholders})
+                                                              GROUP BY entry_id ORDER BY COUNT(*) DESC
+                                                              LIMIT {MAX_CANDIDATES})''', buckets)
+            found = dict(cursor.fetchall())
+            for cache_key, text, pending_buckets in self.pending:
+                if set(buckets).intersection(pending_buckets):
+                    found[cache_key] = text
+        return [(cache_key, text, fuzzy_key(text)) for cache_key, text in found.items()]
+
+    def clear(self):
+        with self.lock:
+            self.pending = []
+            self.conn.execute("DELETE FROM tm_buckets")
+            self.conn.execute("DELETE FROM tm_entries")
+            self.conn.commit()
+            self.size = 0
+
+    def __bool__(self):
+        return bool(self.size or self.pending)
+
+    def __len__(self):
+        return self.size + len(self.pending)
+
+    def close(self):
+        self.closed.set()
+        self.indexer.join()
+        with self.lock:
+            self.flush()
+            self.conn.close()
+
+def open_translation_memory(config):
+    """Return the memory for the configured cache mode and ``fuzzy_threshold``, or None when either is off."""
+    threshold = config.get('fuzzy_threshold', 'Off')
+    cache_mode = config.get('cache_mode', 'RAM')
+    if threshold == "Off" or cache_mode == "None":
+        return None
+    if cache_mode == "File":
+        return SQLiteTranslationMemory(threshold=float(threshold))
+    return TranslationMemory(float(threshold))